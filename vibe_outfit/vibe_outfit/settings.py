@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 now = datetime.now()
 future_time = now + timedelta(days=5)
@@ -57,6 +58,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # only active when QUERY_TIMING_SAMPLE_RATE > 0
+    'web_management_app.middleware.QueryTimingMiddleware',
+    # only active with a replica database, see DB_PROFILE below
+    'web_management_app.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +101,47 @@ DATABASES = {
     }
 }
 
+# DB_PROFILE=production: tuned SQLite with persistent connections, and an
+# optional read replica (DB_REPLICA_NAME, a second SQLite file kept in sync by
+# replication, or by `manage.py sync_replica` locally)
+DB_PROFILE = os.getenv('DB_PROFILE', 'development')
+
+# seconds between PRAGMA optimize runs per connection, None to disable
+SQLITE_OPTIMIZE_INTERVAL = None
+
+# how long a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # busy timeout: wait for the write lock instead of "database is locked"
+            'timeout': 20,
+            # take the write lock when the transaction starts, so two checkouts
+            # queue up instead of failing when both try to upgrade a read lock
+            'transaction_mode': 'IMMEDIATE',
+            # WAL: readers don't block the writer and the writer doesn't block readers
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-32000;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
+    })
+    SQLITE_OPTIMIZE_INTERVAL = 60 * 60
+
+    if os.getenv('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.getenv('DB_REPLICA_NAME'),
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['web_management_app.routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -153,5 +199,71 @@ REST_FRAMEWORK = {
 #     'AUTH_HEADER_TYPES': ('Bearer',),
 # }
 
+# cache versions (web_management_app/cache.py) live here. Every worker process
+# has to see the same versions, otherwise a write handled by one worker leaves
+# the others serving stale pages, so production REQUIRES a shared backend:
+#   CACHE_BACKEND=redis      CACHE_LOCATION=redis://127.0.0.1:6379/1   (pip install redis)
+#   CACHE_BACKEND=memcached  CACHE_LOCATION=127.0.0.1:11211            (pip install pymemcache)
+#   CACHE_BACKEND=database   CACHE_LOCATION=django_cache               (manage.py createcachetable)
+# The in-process locmem cache is only fit for a single development server.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'vibe-outfit'),
+    'database': ('django.core.cache.backends.db.DatabaseCache', 'django_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'database' if DB_PROFILE == 'production' else 'locmem')
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f'CACHE_BACKEND must be one of {", ".join(CACHE_BACKENDS)}')
+if DB_PROFILE == 'production' and CACHE_BACKEND == 'locmem':
+    raise ImproperlyConfigured('DB_PROFILE=production needs a shared CACHE_BACKEND (redis, memcached or database)')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+    }
+}
+
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media' 
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# uploads are stored under their content hash (web_management_app/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'web_management_app.storage.HashedMediaStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# worker processes resizing uploaded images (web_management_app/thumbnails.py)
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
+# share of requests (0..1) that get query/app timing, a Server-Timing
+# header and a log line (web_management_app/middleware.py), 0 turns it off
+QUERY_TIMING_SAMPLE_RATE = float(os.getenv('QUERY_TIMING_SAMPLE_RATE', 0))
+
+# the product feed (/api/feed/products.<format>) is for staff and for the
+# marketplaces given one of these tokens (?token=...), comma separated. Each
+# of them gets FEED_DOWNLOADS_PER_HOUR full downloads, 304s don't count.
+FEED_TOKENS = [token for token in os.getenv('FEED_TOKENS', '').split(',') if token]
+FEED_DOWNLOADS_PER_HOUR = int(os.getenv('FEED_DOWNLOADS_PER_HOUR', 12))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'web_management_app.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -14,12 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
-from web_management_app.views import OrderViewSet
+from web_management_app.views import OrderViewSet, serve_media
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='orders')
@@ -36,4 +38,10 @@ if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL,
         document_root=settings.MEDIA_ROOT
-    )
\ No newline at end of file
+    )
+else:
+    # hashed uploads with far-future cache headers and Range support, best put
+    # behind a CDN/reverse proxy cache
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
@@ -1,4 +1,17 @@
-from django.contrib import admin
+import csv
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Count, Q
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 
 from .models import (
@@ -11,11 +24,161 @@ from .models import (
     ProductImages,
     ProductReview,
     ProductVariant,
+    Promotion,
     Cart,
     CartItem,
     Order,
     OrderItem,
 )
+from .search import search_enabled, search_product_ids
+from .services import (
+    PRICE_AMOUNT,
+    PRICE_PERCENT,
+    STOCK_ADD,
+    STOCK_SET,
+    change_prices,
+    set_category_tree_active,
+    set_discount,
+    set_products_active,
+    set_stock,
+)
+
+# --------------------------- large tables start here ---------------------------
+# Changelists of tables that grow with traffic (products, variants, images,
+# reviews, carts, orders): no per-row queries (list_select_related, annotated
+# counts), autocomplete widgets instead of <select>s with every row of the
+# related table, no list_filters that read every distinct value, and no
+# COUNT(*) over the whole table on every page.
+EXACT_COUNT_LIMIT = 10000
+ADMIN_SEARCH_LIMIT = 1000
+
+
+def estimated_count(model):
+    # row estimate from the stats ANALYZE / PRAGMA optimize keep in sqlite_stat1,
+    # None when there are none yet
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return int(row[0].split()[0]) if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    # unfiltered lists of big tables use the estimate, filtered ones still count
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list.model)
+            if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # no second COUNT(*) for the "x of y selected" total
+    show_full_result_count = False
+
+# --------------------------- large tables end here ---------------------------
+
+# --------------------------- bulk actions start here ---------------------------
+# Bulk changes (services.py) run as set-based UPDATEs. Every action first shows
+# a page with its options and a preview of how many rows it changes; only
+# "Apply" writes anything.
+class PriceChangeForm(forms.Form):
+    mode = forms.ChoiceField(choices=[(PRICE_PERCENT, 'Percent'), (PRICE_AMOUNT, 'Amount')])
+    value = forms.DecimalField(
+        max_digits=10, decimal_places=2, min_value=-100000, max_value=100000,
+        help_text="10 raises prices by 10 % (or 10), -10 lowers them. Discount prices move along.",
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('mode') == PRICE_PERCENT:
+            value = cleaned_data.get('value', 0)
+            if value <= -100:
+                raise forms.ValidationError("A price can't be lowered by 100 % or more.")
+            if value > 1000:
+                raise forms.ValidationError("A price can be raised by 1000 % at most.")
+        return cleaned_data
+
+
+class DiscountForm(forms.Form):
+    percent = forms.IntegerField(min_value=0, max_value=99, help_text="Discount off the base price, 0 removes it.")
+
+
+class ConfirmForm(forms.Form):
+    pass
+
+
+class StockUploadForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row and the columns sku and stock.")
+    mode = forms.ChoiceField(choices=[(STOCK_SET, 'Set stock to the value'), (STOCK_ADD, 'Add the value to the stock')])
+    dry_run = forms.BooleanField(required=False, initial=True, label="Only preview, don't change anything")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if not upload:
+            return cleaned_data
+        stock_by_sku, errors = {}, []
+        reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig'))
+        if not {'sku', 'stock'} <= set(reader.fieldnames or ()):
+            raise forms.ValidationError("The CSV needs a header row with the columns sku and stock.")
+        for line, row in enumerate(reader, start=2):
+            sku = (row['sku'] or '').strip()
+            try:
+                stock = int(row['stock'])
+            except (TypeError, ValueError):
+                errors.append(f"line {line}: stock {row['stock']!r} is not a whole number")
+                continue
+            if not sku or (stock < 0 and cleaned_data.get('mode') == STOCK_SET):
+                errors.append(f"line {line}: needs a sku and a stock of at least 0")
+                continue
+            stock_by_sku[sku] = stock
+        if errors:
+            raise forms.ValidationError(errors[:20] + ([f"... {len(errors) - 20} more"] if len(errors) > 20 else []))
+        cleaned_data['stock_by_sku'] = stock_by_sku
+        return cleaned_data
+
+
+def describe(counts, dry_run):
+    changes = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items() if not isinstance(count, list))
+    return f"{'Would change' if dry_run else 'Changed'}: {changes}."
+
+
+class BulkActionsMixin:
+    def bulk_action(self, request, queryset, title, form_class, run):
+        # run(queryset, cleaned_data, dry_run) returns the counts from services.py
+        submitted = 'preview' in request.POST or 'apply' in request.POST
+        form = form_class(request.POST if submitted else None)
+        preview = None
+        if submitted and form.is_valid():
+            if 'apply' in request.POST:
+                self.message_user(request, describe(run(queryset, form.cleaned_data, False), False), messages.SUCCESS)
+                # back to the changelist
+                return None
+            preview = describe(run(queryset, form.cleaned_data, True), True)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'preview': preview,
+            'action': request.POST['action'],
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/web_management_app/bulk_action.html', context)
+
+# --------------------------- bulk actions end here ---------------------------
 
 # --------------------------- navigation bar start here ---------------------------
 
@@ -102,32 +265,98 @@ class HeroSectionAdmin(admin.ModelAdmin):
 # --------------------------- Products Table start here ---------------------------
 
 @admin.register(ProductCategory)
-class ProductCategoryTable(admin.ModelAdmin):
+class ProductCategoryTable(BulkActionsMixin, admin.ModelAdmin):
     list_display = ('id','name','slug','order','image','parent_id','is_active','created_at','updated_at',)
     search_fields = ('name',)
     list_filter = ('is_active','parent_id',)
     list_editable = ('order','is_active',)
     list_per_page = 100
     ordering = ('order','name','parent_id')
+    actions = ['activate_tree', 'deactivate_tree']
+
+    @admin.action(description="Activate with subcategories and their products", permissions=['change'])
+    def activate_tree(self, request, queryset):
+        return self.bulk_action(
+            request, queryset, "Activate categories and products", ConfirmForm,
+            lambda queryset, data, dry_run: set_category_tree_active(queryset, True, dry_run),
+        )
+
+    @admin.action(description="Deactivate with subcategories and their products", permissions=['change'])
+    def deactivate_tree(self, request, queryset):
+        return self.bulk_action(
+            request, queryset, "Deactivate categories and products", ConfirmForm,
+            lambda queryset, data, dry_run: set_category_tree_active(queryset, False, dry_run),
+        )
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'base_price', 'category', 'featured_products','new_arrivals','is_active', 'created_at')
+class ProductAdmin(BulkActionsMixin, LargeTableAdmin):
+    list_display = ('name', 'slug', 'base_price', 'effective_price', 'category', 'featured_products','new_arrivals','is_active', 'created_at')
     list_filter = ('is_active', 'category','featured_products','new_arrivals')
-    search_fields = ('name', 'description')
+    search_fields = ('name', '=slug')
+    list_select_related = ('category',)
+    autocomplete_fields = ('category',)
+    list_per_page = 100
+    actions = ['change_prices', 'set_discount', 'activate', 'deactivate']
+
+    @admin.action(description="Change prices", permissions=['change'])
+    def change_prices(self, request, queryset):
+        return self.bulk_action(
+            request, queryset, "Change prices", PriceChangeForm,
+            lambda queryset, data, dry_run: change_prices(queryset, data['mode'], data['value'], dry_run),
+        )
+
+    @admin.action(description="Set discount", permissions=['change'])
+    def set_discount(self, request, queryset):
+        return self.bulk_action(
+            request, queryset, "Set discount", DiscountForm,
+            lambda queryset, data, dry_run: set_discount(queryset, data['percent'], dry_run),
+        )
+
+    @admin.action(description="Activate selected products", permissions=['change'])
+    def activate(self, request, queryset):
+        return self.bulk_action(
+            request, queryset, "Activate products", ConfirmForm,
+            lambda queryset, data, dry_run: set_products_active(queryset, True, dry_run),
+        )
+
+    @admin.action(description="Deactivate selected products", permissions=['change'])
+    def deactivate(self, request, queryset):
+        return self.bulk_action(
+            request, queryset, "Deactivate products", ConfirmForm,
+            lambda queryset, data, dry_run: set_products_active(queryset, False, dry_run),
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # the full text index instead of LIKE over every name, also serves the
+        # autocomplete widgets. Inactive products aren't indexed, exact slug finds them.
+        if not search_term or not search_enabled():
+            return super().get_search_results(request, queryset, search_term)
+        product_ids = search_product_ids(search_term, ADMIN_SEARCH_LIMIT)
+        return queryset.filter(Q(pk__in=product_ids) | Q(slug=search_term.strip())), False
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'category', 'percent_off', 'min_quantity', 'starts_at', 'ends_at', 'is_active')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+    list_select_related = ('category',)
+    autocomplete_fields = ('category',)
+    ordering = ('-id',)
 
 @admin.register(ProductImages)
-class ProductImagesAdmin(admin.ModelAdmin):
+class ProductImagesAdmin(LargeTableAdmin):
     list_display = ('id','product','image','order','is_active','created_at','updated_at',)
-    search_fields = ('product',)
-    list_filter = ('is_active','product',)
+    search_fields = ('product__slug__exact',)
+    list_filter = ('is_active',)
+    list_select_related = ('product',)
+    autocomplete_fields = ('product',)
     list_editable = ('order','is_active',)
     list_per_page = 100
     ordering = ('product', 'order')
 
 
 @admin.register(ProductReview)
-class ProductReviewAdmin(admin.ModelAdmin):
+class ProductReviewAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'product',
@@ -137,10 +366,10 @@ class ProductReviewAdmin(admin.ModelAdmin):
         'created_at',
     )
 
+    # exact matches: a LIKE over every comment is a full scan of the table
     search_fields = (
-        'product__name',
-        'user__username',
-        'comment',
+        'product__slug__exact',
+        'user__username__exact',
     )
 
     list_filter = (
@@ -148,8 +377,11 @@ class ProductReviewAdmin(admin.ModelAdmin):
         'created_at',
     )
 
+    list_select_related = ('product', 'user')
+    autocomplete_fields = ('product', 'user')
     list_per_page = 50
-    ordering = ('-created_at',)
+    # newest first like created_at, without sorting the whole table
+    ordering = ('-id',)
 
     def short_comment(self, obj):
         return obj.comment[:40] + "..." if len(obj.comment) > 40 else obj.comment
@@ -158,7 +390,7 @@ class ProductReviewAdmin(admin.ModelAdmin):
 
 
 @admin.register(ProductVariant)
-class ProductVariantAdmin(admin.ModelAdmin):
+class ProductVariantAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'product',
@@ -172,15 +404,13 @@ class ProductVariantAdmin(admin.ModelAdmin):
     )
 
     search_fields = (
-        'sku',
-        'product__name',
+        'sku__exact',
+        'product__slug__exact',
     )
 
+    # color/size/material filters ran a SELECT DISTINCT over the whole table per page
     list_filter = (
         'is_active',
-        'color',
-        'size',
-        'material',
     )
 
     list_editable = (
@@ -188,16 +418,49 @@ class ProductVariantAdmin(admin.ModelAdmin):
         'is_active',
     )
 
+    list_select_related = ('product',)
+    autocomplete_fields = ('product',)
     list_per_page = 100
     ordering = ('product', 'sku')
 
+    def get_urls(self):
+        return [
+            path('upload-stock/', self.admin_site.admin_view(self.upload_stock), name='web_management_app_productvariant_upload_stock'),
+        ] + super().get_urls()
+
+    def upload_stock(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = StockUploadForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            dry_run = form.cleaned_data['dry_run']
+            counts = set_stock(form.cleaned_data['stock_by_sku'], form.cleaned_data['mode'], dry_run)
+            result = {'message': describe(counts, dry_run), 'unknown_skus': counts['unknown_skus'][:50],
+                      'unknown_count': len(counts['unknown_skus'])}
+            if not dry_run:
+                self.message_user(request, result['message'], messages.SUCCESS)
+                if counts['unknown_skus']:
+                    self.message_user(request, f"{len(counts['unknown_skus'])} unknown SKUs skipped.", messages.WARNING)
+                return redirect(reverse('admin:web_management_app_productvariant_changelist'))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Upload stock",
+            'opts': self.model._meta,
+            'form': form,
+            'result': result,
+        }
+        return TemplateResponse(request, 'admin/web_management_app/productvariant/upload_stock.html', context)
+
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    autocomplete_fields = ('variant',)
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'user',
@@ -206,8 +469,8 @@ class CartAdmin(admin.ModelAdmin):
     )
 
     search_fields = (
-        'user__username',
-        'user__email',
+        'user__username__exact',
+        'user__email__exact',
     )
 
     list_filter = (
@@ -215,16 +478,22 @@ class CartAdmin(admin.ModelAdmin):
     )
 
     inlines = [CartItemInline]
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     list_per_page = 50
-    ordering = ('-created_at',)
+    ordering = ('-id',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(item_count=Count('items'))
 
     def total_items(self, obj):
-        return obj.items.count()
+        return obj.item_count
 
     total_items.short_description = "Items"
+    total_items.admin_order_field = 'item_count'
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'cart',
@@ -233,24 +502,32 @@ class CartItemAdmin(admin.ModelAdmin):
     )
 
     search_fields = (
-        'variant__sku',
-        'cart__user__username',
-    )
-
-    list_filter = (
-        'variant',
+        'variant__sku__exact',
+        'cart__user__username__exact',
     )
 
+    list_select_related = ('cart__user', 'variant')
+    autocomplete_fields = ('cart', 'variant')
     list_per_page = 100
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ['id', 'user', 'total_amount', 'status', 'payment_method', 'created_at']
     list_filter = ['status', 'payment_method', 'created_at']
-    search_fields = ['user__email', 'user__username', 'id']
+    search_fields = ['user__email__exact', 'user__username__exact']
     readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
     list_per_page = 20
+    ordering = ['-id']
+
+    def get_search_results(self, request, queryset, search_term):
+        # an order number is looked up by primary key, not with LIKE on a cast id
+        found, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip().isdigit():
+            found |= queryset.filter(pk=int(search_term))
+        return found, may_have_duplicates
     
     fieldsets = (
         ('Order Information', {
@@ -0,0 +1,145 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .cache import NAVIGATION, HERO, CATALOG, STOCK, aconditional_get
+from .facets import get_facet_counts
+from .filters import ProductFilter
+from .models import CompanyLogo, NavOption, NavButtons, HeroSection, ProductCategory, Product
+from .pagination import ProductCursorPagination
+from .serializers import (
+    CompanyLogoSerializer,
+    NavOptionSerializer,
+    NavButtonsSerializer,
+    HeroSectionSerializer,
+    CategorySerializer,
+    ParentCategorySerializer,
+    ProductListSerializer,
+    ProductDetailsSerializer,
+)
+
+
+# --------------------------- async catalog start here ---------------------------
+# Async versions of the read-only catalog endpoints for the ASGI deployment
+# (uvicorn/daphne), mounted under /api/async/. Same querysets and serializers as
+# views.py, the same JSON; queries go through the async ORM and the version
+# counters through the async cache API, so a request only leaves the event loop
+# for the query itself. Serializers only run on rows that are already loaded.
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def not_found(detail):
+    return json_response({'detail': detail}, status=404)
+
+
+def no_match(model):
+    # same message as get_object_or_404 in the sync views
+    return not_found(f'No {model._meta.object_name} matches the given query.')
+
+
+@require_safe
+@aconditional_get(NAVIGATION)
+async def navigation(request):
+    logo = await CompanyLogo.objects.filter(is_active= True).order_by('-updated_at').afirst()
+    nav_option = [option async for option in NavOption.objects.filter(is_active= True).order_by('order')[:4]]
+    nav_button = [button async for button in NavButtons.objects.filter(is_active= True).order_by('order')[:3]]
+
+    return json_response({
+        "logo" : CompanyLogoSerializer(logo).data,
+        "nav_option" : NavOptionSerializer(nav_option, many = True).data,
+        "nav_button" : NavButtonsSerializer(nav_button, many = True).data,
+    })
+
+
+@require_safe
+@aconditional_get(HERO)
+async def hero_section(request):
+    hero_section = await HeroSection.objects.filter(is_active = True).order_by('-updated_at').afirst()
+    return json_response({
+        "hero_section": HeroSectionSerializer(hero_section).data
+    })
+
+
+@require_safe
+@aconditional_get(CATALOG)
+async def categories(request):
+    categories = ProductCategory.objects.filter(is_active = True, parent_id__isnull=True).order_by('order')[:4]
+    categories = [category async for category in categories]
+    return json_response(CategorySerializer(categories, many=True, context={'request': request}).data)
+
+
+@require_safe
+@aconditional_get(CATALOG)
+async def categories_with_children(request):
+    categories = ProductCategory.objects.filter(is_active=True,parent_id__isnull=True).prefetch_related('children')
+    categories = [category async for category in categories]
+    return json_response(ParentCategorySerializer(categories, many=True).data)
+
+
+async def product_list_response(request, queryset, partitions=None):
+    # filters + keyset page, like the sync ListAPIViews with ProductFilter
+    request = Request(request)
+    filterset = ProductFilter(request.query_params, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        return None, json_response(filterset.errors, status=400)
+
+    paginator = ProductCursorPagination()
+    try:
+        page = await paginator.apaginate_queryset(filterset.qs, request, partitions=partitions)
+    except ParseError as error:
+        # a bad cursor
+        return None, json_response({'detail': error.detail}, status=error.status_code)
+
+    data = ProductListSerializer(page, many=True, context={'request': request}).data
+    return paginator.get_paginated_data(data), None
+
+
+@require_safe
+@aconditional_get(CATALOG)
+async def category_products(request, slug):
+    try:
+        category = await ProductCategory.objects.aget(slug=slug, is_active=True)
+    except ProductCategory.DoesNotExist:
+        return no_match(ProductCategory)
+
+    subtree = ProductCategory.objects.filter(**category.subtree_filter()).values_list('id', flat=True)
+    category_ids = [pk async for pk in subtree]
+    # limited to the subtree by the paginator, see KeysetPagination
+    products = Product.objects.filter(is_active=True)
+    data, error = await product_list_response(request, products, partitions=('category_id', category_ids))
+    if error is not None:
+        return error
+    # bitmap work is CPU bound, a worker thread is the right place for it anyway
+    data['facets'] = await sync_to_async(get_facet_counts)(category, request.GET)
+    return json_response(data)
+
+
+@require_safe
+@aconditional_get(CATALOG)
+async def featured_products(request):
+    data, error = await product_list_response(request, Product.objects.filter(featured_products=True, is_active=True))
+    return error if error is not None else json_response(data)
+
+
+@require_safe
+@aconditional_get(CATALOG)
+async def new_arrival_products(request):
+    data, error = await product_list_response(request, Product.objects.filter(new_arrivals=True, is_active=True))
+    return error if error is not None else json_response(data)
+
+
+@require_safe
+@aconditional_get(CATALOG, STOCK)
+async def product_details(request, slug):
+    products = Product.objects.filter(is_active=True).prefetch_related('images', 'variants')
+    try:
+        product = await products.aget(slug=slug)
+    except Product.DoesNotExist:
+        return no_match(Product)
+    return json_response(ProductDetailsSerializer(product, context={'request': request}).data)
+
+# --------------------------- async catalog end here ---------------------------
@@ -0,0 +1,135 @@
+import datetime
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from .routers import primary_for_recent
+
+
+# --------------------------- cache versions start here ---------------------------
+# Every group of models has a version number stored in the cache. Writes bump the
+# version, so anything cached under an old version is simply never read again.
+# Versions are millisecond timestamps, which also makes them usable as
+# Last-Modified values.
+NAVIGATION = 'navigation'
+HERO = 'hero'
+CATALOG = 'catalog'
+# stock levels change on every order, kept apart so checkouts don't drop the catalog caches
+STOCK = 'stock'
+# CategoryFacet bitmaps, bumped only when a facet actually changes
+FACETS = 'facets'
+# promotion rules and the category tree they are compiled against (pricing.py)
+PRICING = 'pricing'
+
+VERSION_KEY = 'version:{}'
+HOME_CACHE_KEY = 'home:{}:{}:{}'
+HOME_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def get_versions(*names):
+    keys = [VERSION_KEY.format(name) for name in names]
+    found = cache.get_many(keys)
+
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            # first read after a restart/eviction, start a fresh version
+            cache.add(key, _now_ms(), None)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+async def aget_versions(*names):
+    keys = [VERSION_KEY.format(name) for name in names]
+    found = await cache.aget_many(keys)
+
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            await cache.aadd(key, _now_ms(), None)
+            version = await cache.aget(key)
+        versions.append(version)
+    return versions
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(name):
+    key = VERSION_KEY.format(name)
+    current = cache.get(key) or 0
+    version = max(_now_ms(), current + 1)
+    cache.set(key, version, None)
+    return version
+
+
+def home_cache_key():
+    return HOME_CACHE_KEY.format(*get_versions(NAVIGATION, HERO, CATALOG))
+
+
+def versions_etag(versions):
+    return '"{}"'.format('-'.join(str(version) for version in versions))
+
+
+def versions_last_modified(versions):
+    return datetime.datetime.fromtimestamp(max(versions) / 1000, tz=datetime.timezone.utc)
+
+
+def conditional_get(*names):
+    # ETag/Last-Modified straight from the version counters: a client that
+    # already has the current version gets a 304 before the view runs a query
+    # or serializes anything. A response tagged with a version that is only
+    # seconds old is built from the primary, not a lagging replica.
+    def etag(request, *args, **kwargs):
+        return versions_etag(request.cache_versions)
+
+    def last_modified(request, *args, **kwargs):
+        return versions_last_modified(request.cache_versions)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            request.cache_versions = get_versions(*names)
+            with primary_for_recent(request.cache_versions):
+                return conditional_view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+def aconditional_get(*names):
+    # conditional_get for async views, versions are read with the async cache API
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            versions = await aget_versions(*names)
+            etag = versions_etag(versions)
+            last_modified = int(versions_last_modified(versions).timestamp())
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                with primary_for_recent(versions):
+                    response = await view(request, *args, **kwargs)
+            # errors aren't tagged, same as the sync views where they are raised past condition()
+            if request.method in ('GET', 'HEAD') and response.status_code < 400:
+                if not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+# --------------------------- cache versions end here ---------------------------
@@ -0,0 +1,270 @@
+import zlib
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import FACETS, bump_version, get_version
+from .models import CategoryFacet, Product, ProductCategory, ProductVariant
+from .routers import primary_for_recent
+
+
+# --------------------------- facets start here ---------------------------
+# Each category keeps one bitmap of product ids per attribute value (plus one
+# for all of its products). Facet counts for a listing are then bit operations
+# on those bitmaps instead of a GROUP BY over the variants on every request.
+#
+# Bitmaps are stored from their lowest set byte (CategoryFacet.offset) and
+# zlib compressed, so a row costs about its number of products whatever the
+# highest product id is. Product and variant saves only flip the bits of the
+# products involved; refresh_category_facets rebuilds a category from scratch.
+#
+# Prices are bucketed (CategoryFacet.PRICE, value is the bucket's lower edge),
+# a price filter ORs the buckets it covers and only looks up the products of
+# the one or two buckets its bounds fall inside.
+FACET_ATTRIBUTES = ('color', 'size', 'material')
+PRICE_BUCKETS = tuple(Decimal(edge) for edge in (0, 10, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000, 2000))
+FACET_CACHE_KEY = 'facets:{}:{}'
+FACET_CACHE_TIMEOUT = 60 * 60
+
+
+def to_bitmap(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    # set bits in a bytearray, OR-ing python ints one by one is quadratic
+    data = bytearray(max(product_ids) // 8 + 1)
+    for pk in product_ids:
+        data[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(data, 'little')
+
+
+def bitmap_bytes(bitmap):
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+
+def from_bytes(data):
+    return int.from_bytes(bytes(data), 'little')
+
+
+def encode_bitmap(bitmap):
+    # (offset, data): bit n of data is product offset + n, offset is a whole byte
+    if not bitmap:
+        return 0, b''
+    offset = ((bitmap & -bitmap).bit_length() - 1) & ~7
+    return offset, zlib.compress(bitmap_bytes(bitmap >> offset))
+
+
+def decode_bitmap(offset, data):
+    if not data:
+        return 0
+    return from_bytes(zlib.decompress(bytes(data))) << offset
+
+
+def price_bucket(price):
+    return str(PRICE_BUCKETS[max(bisect_right(PRICE_BUCKETS, price) - 1, 0)])
+
+
+def product_groups(product_ids):
+    # product id -> (category id, facet keys) for the active ones among product_ids
+    products = Product.objects.filter(pk__in=product_ids, is_active=True)
+    groups = {
+        pk: (category_id, {(CategoryFacet.ALL, ''), (CategoryFacet.PRICE, price_bucket(price))})
+        for pk, category_id, price in products.values_list('id', 'category_id', 'effective_price')
+    }
+    variants = ProductVariant.objects.filter(
+        product_id__in=product_ids,
+        product__is_active=True,
+        is_active=True,
+    ).values_list('product_id', *FACET_ATTRIBUTES, 'stock')
+    for product_id, *attributes, stock in variants:
+        keys = groups[product_id][1]
+        for attribute, value in zip(FACET_ATTRIBUTES, attributes):
+            if value:
+                keys.add((attribute, value))
+        if stock > 0:
+            keys.add((CategoryFacet.IN_STOCK, ''))
+    return groups
+
+
+def facet_row(category_id, key, bitmap, facet=None):
+    facet = facet or CategoryFacet(category_id=category_id, attribute=key[0], value=key[1])
+    facet.offset, facet.products = encode_bitmap(bitmap)
+    facet.product_count = bitmap.bit_count()
+    return facet
+
+
+def refresh_category_facets(category_ids):
+    # categories deleted in the meantime have no facets to rebuild
+    category_ids = ProductCategory.objects.filter(pk__in=set(category_ids) - {None}).values_list('id', flat=True)
+    for category_id in category_ids:
+        product_ids = Product.objects.filter(category_id=category_id, is_active=True).values_list('id', flat=True)
+        members = {(CategoryFacet.ALL, ''): []}
+        for pk, (_, keys) in product_groups(product_ids).items():
+            for key in keys:
+                members.setdefault(key, []).append(pk)
+
+        facets = [facet_row(category_id, key, to_bitmap(ids)) for key, ids in members.items()]
+        with transaction.atomic():
+            CategoryFacet.objects.filter(category_id=category_id).delete()
+            CategoryFacet.objects.bulk_create(facets)
+            transaction.on_commit(lambda: bump_version(FACETS))
+
+
+def refresh_price_facets(category_ids):
+    # only the price buckets, after effective prices were changed in bulk
+    category_ids = ProductCategory.objects.filter(pk__in=set(category_ids) - {None}).values_list('id', flat=True)
+    for category_id in category_ids:
+        members = {}
+        products = Product.objects.filter(category_id=category_id, is_active=True)
+        for pk, price in products.values_list('id', 'effective_price'):
+            members.setdefault((CategoryFacet.PRICE, price_bucket(price)), []).append(pk)
+
+        facets = [facet_row(category_id, key, to_bitmap(ids)) for key, ids in members.items()]
+        with transaction.atomic():
+            CategoryFacet.objects.filter(category_id=category_id, attribute=CategoryFacet.PRICE).delete()
+            CategoryFacet.objects.bulk_create(facets)
+            transaction.on_commit(lambda: bump_version(FACETS))
+
+
+def update_product_facets(product_ids, category_ids):
+    # Sets or clears the bits of these products in these categories' facets
+    # (the categories they are in now and the ones they just left). Only rows
+    # whose bits change are written, values nobody has any more are dropped.
+    product_ids = set(product_ids)
+    groups = product_groups(product_ids)
+    touched = to_bitmap(product_ids)
+    category_ids = ProductCategory.objects.filter(pk__in=set(category_ids) - {None}).values_list('id', flat=True)
+
+    with transaction.atomic():
+        for category_id in category_ids:
+            members = {(CategoryFacet.ALL, ''): []}
+            for pk, (product_category_id, keys) in groups.items():
+                if product_category_id == category_id:
+                    for key in keys:
+                        members.setdefault(key, []).append(pk)
+            facets = {
+                (facet.attribute, facet.value): facet
+                for facet in CategoryFacet.objects.select_for_update().filter(category_id=category_id)
+            }
+
+            changed, created, emptied = [], [], []
+            for key in set(facets) | set(members):
+                facet = facets.get(key)
+                bitmap = decode_bitmap(facet.offset, facet.products) if facet else 0
+                updated = (bitmap & ~touched) | to_bitmap(members.get(key, ()))
+                if updated == bitmap and facet:
+                    continue
+                if not updated and key != (CategoryFacet.ALL, ''):
+                    if facet:
+                        emptied.append(facet.pk)
+                elif facet:
+                    changed.append(facet_row(category_id, key, updated, facet))
+                else:
+                    created.append(facet_row(category_id, key, updated))
+
+            CategoryFacet.objects.filter(pk__in=emptied).delete()
+            CategoryFacet.objects.bulk_update(changed, ['offset', 'products', 'product_count'])
+            CategoryFacet.objects.bulk_create(created)
+            if emptied or changed or created:
+                transaction.on_commit(lambda: bump_version(FACETS))
+
+
+def get_category_bitmaps(category):
+    # bitmaps of the whole subtree OR-ed together, cached compressed until a
+    # facet changes (not on every catalog change)
+    version = get_version(FACETS)
+    key = FACET_CACHE_KEY.format(category.pk, version)
+    encoded = cache.get(key)
+    if encoded is None:
+        bitmaps = {}
+        with primary_for_recent([version]):
+            rows = list(CategoryFacet.objects.filter(**category.subtree_filter('category__')).values_list(
+                'attribute', 'value', 'offset', 'products',
+            ))
+        for attribute, value, offset, products in rows:
+            bitmaps[attribute, value] = bitmaps.get((attribute, value), 0) | decode_bitmap(offset, products)
+        encoded = {name: encode_bitmap(bitmap) for name, bitmap in bitmaps.items()}
+        cache.set(key, encoded, FACET_CACHE_TIMEOUT)
+        return bitmaps
+    return {name: decode_bitmap(*value) for name, value in encoded.items()}
+
+
+def parse_values(value):
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def price_bitmap(category, params, bitmaps):
+    prices = {}
+    for param, lookup in (('min_price', 'effective_price__gte'), ('max_price', 'effective_price__lte')):
+        try:
+            prices[lookup] = Decimal(params[param])
+        except (KeyError, InvalidOperation):
+            continue
+    if not prices:
+        return None
+
+    low, high = prices.get('effective_price__gte'), prices.get('effective_price__lte')
+    result = 0
+    for lower, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,)):
+        if (high is not None and lower > high) or (low is not None and upper is not None and upper <= low):
+            continue
+        if (low is None or low <= lower) and (high is None or (upper is not None and upper <= high)):
+            result |= bitmaps.get((CategoryFacet.PRICE, str(lower)), 0)
+            continue
+        # a bound falls inside this bucket, check the prices of its products only
+        products = Product.objects.filter(
+            is_active=True, effective_price__gte=max(lower, low or lower), **category.subtree_filter('category__'),
+        )
+        if high is not None:
+            products = products.filter(effective_price__lte=high)
+        if upper is not None:
+            products = products.filter(effective_price__lt=upper)
+        result |= to_bitmap(products.values_list('id', flat=True))
+    return result
+
+
+def get_facet_counts(category, params):
+    bitmaps = get_category_bitmaps(category)
+
+    # everything except the attribute filters
+    base = bitmaps.get((CategoryFacet.ALL, ''), 0)
+    prices = price_bitmap(category, params, bitmaps)
+    if prices is not None:
+        base &= prices
+    in_stock = bitmaps.get((CategoryFacet.IN_STOCK, ''), 0)
+    if params.get('in_stock') in ('true', 'True', '1'):
+        base &= in_stock
+    elif params.get('in_stock') in ('false', 'False', '0'):
+        base &= ~in_stock
+
+    selected = {}
+    for attribute in FACET_ATTRIBUTES:
+        values = parse_values(params.get(attribute, ''))
+        if values:
+            selected[attribute] = reduce(or_, (bitmaps.get((attribute, value), 0) for value in values))
+
+    facets = {attribute: {} for attribute in FACET_ATTRIBUTES}
+    for attribute in FACET_ATTRIBUTES:
+        # counts of one attribute ignore its own selection, so the shopper
+        # sees how many products each extra value would add
+        mask = base
+        for other, bitmap in selected.items():
+            if other != attribute:
+                mask &= bitmap
+        for (name, value), bitmap in bitmaps.items():
+            if name == attribute:
+                count = (bitmap & mask).bit_count()
+                if count:
+                    facets[attribute][value] = count
+
+    mask = base
+    for bitmap in selected.values():
+        mask &= bitmap
+    facets[CategoryFacet.IN_STOCK] = (in_stock & mask).bit_count()
+    return facets
+
+# --------------------------- facets end here ---------------------------
@@ -0,0 +1,138 @@
+import csv
+import json
+import zlib
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Product, ProductImages, ProductVariant
+
+
+# --------------------------- product feed start here ---------------------------
+# The whole active catalog for marketplace / ad feeds, one row per active
+# variant. Products are read in keyset chunks (id > last id), each chunk's
+# variants and images come in one query each, and every chunk is encoded and
+# handed out before the next one is read. Memory stays at one chunk, whatever
+# the size of the catalog.
+FEED_CHUNK_SIZE = 1000
+FEED_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+FEED_COLUMNS = [
+    'id',
+    'item_group_id',
+    'title',
+    'description',
+    'category',
+    'price',
+    'sale_price',
+    'availability',
+    'stock',
+    'color',
+    'size',
+    'material',
+    'image_link',
+    'additional_image_links',
+]
+
+
+class Echo:
+    # csv.writer target that hands the formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def feed_rows(chunk_size=FEED_CHUNK_SIZE, base_url=''):
+    # yields a list of rows per chunk of products
+    last_id = 0
+    while True:
+        products = list(
+            Product.objects.filter(is_active=True, id__gt=last_id)
+            .select_related('category')
+            .only('id', 'slug', 'name', 'short_description', 'base_price', 'effective_price',
+                  'primary_image', 'category__slug')
+            .order_by('id')[:chunk_size]
+        )
+        if not products:
+            return
+        last_id = products[-1].id
+        product_ids = [product.id for product in products]
+
+        variants = {}
+        for variant in (
+            ProductVariant.objects.filter(product_id__in=product_ids, is_active=True)
+            .only('product_id', 'sku', 'color', 'size', 'material', 'stock')
+            .order_by('product_id', 'id')
+        ):
+            variants.setdefault(variant.product_id, []).append(variant)
+
+        images = {}
+        for product_id, name in (
+            ProductImages.objects.filter(product_id__in=product_ids, is_active=True)
+            .exclude(image='')
+            .order_by('product_id', 'order', 'id')
+            .values_list('product_id', 'image')
+        ):
+            images.setdefault(product_id, []).append(base_url + default_storage.url(name))
+
+        rows = []
+        for product in products:
+            image_links = images.get(product.id, [])
+            image_link = base_url + default_storage.url(product.primary_image.name) if product.primary_image else None
+            for variant in variants.get(product.id, []):
+                rows.append({
+                    'id': variant.sku,
+                    'item_group_id': product.slug,
+                    'title': product.name,
+                    'description': product.short_description,
+                    'category': product.category.slug,
+                    'price': product.base_price,
+                    'sale_price': product.effective_price if product.effective_price < product.base_price else None,
+                    'availability': 'in_stock' if variant.stock > 0 else 'out_of_stock',
+                    'stock': variant.stock,
+                    'color': variant.color,
+                    'size': variant.size,
+                    'material': variant.material,
+                    'image_link': image_link,
+                    'additional_image_links': [link for link in image_links if link != image_link],
+                })
+        yield rows
+
+
+def encode_ndjson(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+
+def encode_csv(chunks):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FEED_COLUMNS)
+    for rows in chunks:
+        yield ''.join(
+            writer.writerow([
+                ','.join(row[column]) if column == 'additional_image_links' else row[column]
+                for column in FEED_COLUMNS
+            ])
+            for row in rows
+        )
+
+
+def gzip_chunks(chunks):
+    # one gzip stream, compressed piece by piece
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def product_feed(feed_format, compress=False, chunk_size=FEED_CHUNK_SIZE, base_url=''):
+    encode = encode_ndjson if feed_format == 'ndjson' else encode_csv
+    chunks = encode(feed_rows(chunk_size, base_url))
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode() for chunk in chunks)
+
+# --------------------------- product feed end here ---------------------------
@@ -0,0 +1,33 @@
+import django_filters
+from django.db.models import Exists, OuterRef
+
+from .models import Product, ProductVariant
+
+
+# --------------------------- product filters start here ---------------------------
+# Variant attributes match on the product level (a product matches color=red if
+# any of its active variants is red), the same rule facets.py counts with.
+class ProductFilter(django_filters.FilterSet):
+    color = django_filters.CharFilter(method='filter_variant_attribute')
+    size = django_filters.CharFilter(method='filter_variant_attribute')
+    material = django_filters.CharFilter(method='filter_variant_attribute')
+    min_price = django_filters.NumberFilter(field_name='effective_price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='effective_price', lookup_expr='lte')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_variant_attribute(self, queryset, name, value):
+        values = [item.strip() for item in value.split(',') if item.strip()]
+        if not values:
+            return queryset
+        variants = ProductVariant.objects.filter(product=OuterRef('pk'), is_active=True, **{f'{name}__in': values})
+        return queryset.filter(Exists(variants))
+
+    def filter_in_stock(self, queryset, name, value):
+        in_stock = Exists(ProductVariant.objects.filter(product=OuterRef('pk'), is_active=True, stock__gt=0))
+        return queryset.filter(in_stock if value else ~in_stock)
+
+# --------------------------- product filters end here ---------------------------
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from web_management_app.cache import CATALOG, bump_version
+from web_management_app.models import Product, primary_image_subquery
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.primary_image from the active ProductImages rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of product ids updated per statement.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Product.objects.aggregate(last=Max('id'))['last'] or 0
+
+        updated = 0
+        # one UPDATE ... SET primary_image = (subquery) per id range, so big
+        # catalogs don't hold the write lock for the whole run
+        for start in range(0, last_id + 1, batch_size):
+            with transaction.atomic():
+                updated += Product.objects.filter(
+                    id__gte=start,
+                    id__lt=start + batch_size,
+                ).update(primary_image=primary_image_subquery())
+
+        bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Updated primary image for {updated} products."))
@@ -0,0 +1,105 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+
+from web_management_app.models import Product, ProductCategory
+
+
+def split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def summary(timings, elapsed):
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return len(timings) / elapsed, statistics.median(timings), p95
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the async catalog views (ASGI handler, one event loop) with the sync "
+        "ones (WSGI handler, one thread per connection) under concurrent requests. "
+        "Requests go through the full handler and middleware in-process, without a "
+        "network server, against the current database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,10,50',
+                            help="Comma separated numbers of concurrent connections.")
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Requests per endpoint and concurrency level.")
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        total = options['requests']
+
+        paths = ['navigation/', 'hero-section/', 'categories/', 'categories/all/']
+        category = ProductCategory.objects.filter(is_active=True).order_by('id').first()
+        product = Product.objects.filter(is_active=True).order_by('id').first()
+        if category:
+            paths.append(f'categories/{category.slug}/products/')
+        if product:
+            paths.append(f'products/{product.slug}/')
+
+        # the test clients send Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.run_benchmarks(paths, levels, total)
+
+    def run_benchmarks(self, paths, levels, total):
+        self.stdout.write(
+            f"{'endpoint':<32} {'conns':>5} {'wsgi req/s':>11} {'asgi req/s':>11} "
+            f"{'wsgi p50':>9} {'asgi p50':>9} {'wsgi p95':>9} {'asgi p95':>9}"
+        )
+        for path in paths:
+            for concurrency in levels:
+                sync_rate, sync_p50, sync_p95 = self.run_sync(f'/api/{path}', concurrency, total)
+                async_rate, async_p50, async_p95 = asyncio.run(self.run_async(f'/api/async/{path}', concurrency, total))
+                self.stdout.write(
+                    f"{path:<32} {concurrency:>5} {sync_rate:>11.1f} {async_rate:>11.1f} "
+                    f"{sync_p50:>9.2f} {async_p50:>9.2f} {sync_p95:>9.2f} {async_p95:>9.2f}"
+                )
+
+    def check(self, url, response):
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+    def run_sync(self, url, concurrency, total):
+        def connection_worker(count):
+            client = Client()
+            timings = []
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    self.check(url, response)
+            finally:
+                # every thread has its own database connection
+                connection.close()
+            return timings
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = sum(pool.map(connection_worker, split(total, concurrency)), [])
+        return summary(timings, time.perf_counter() - started)
+
+    async def run_async(self, url, concurrency, total):
+        client = AsyncClient()
+        async def connection_worker(count):
+            timings = []
+            for _ in range(count):
+                started = time.perf_counter()
+                response = await client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+                self.check(url, response)
+            return timings
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(connection_worker(count) for count in split(total, concurrency)))
+        return summary(sum(results, []), time.perf_counter() - started)
@@ -0,0 +1,77 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from web_management_app.models import Cart, CartItem, Product, ProductCategory, ProductVariant
+from web_management_app.pricing import get_rules
+from web_management_app.services import place_order
+
+
+class Command(BaseCommand):
+    help = "Measure order placement latency and query count for different cart sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,30,100',
+                            help="Comma separated cart sizes (number of lines).")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Orders placed per cart size.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+
+        # everything runs in a transaction that is rolled back at the end,
+        # so the benchmark leaves no users/products/orders behind
+        with transaction.atomic():
+            user, variants = self.create_fixtures(max(sizes))
+            cart = Cart.objects.create(user=user)
+
+            self.stdout.write(f"{'lines':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'queries':>8}")
+            for size in sizes:
+                timings = []
+                for _ in range(repeat):
+                    CartItem.objects.bulk_create([
+                        CartItem(cart=cart, variant=variant, quantity=2) for variant in variants[:size]
+                    ])
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        place_order(user, payment_method='cash_on_delivery')
+                        timings.append((time.perf_counter() - started) * 1000)
+
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f"{size:>6} {statistics.median(timings):>9.2f} {p95:>9.2f} "
+                    f"{timings[-1]:>9.2f} {len(queries):>8}"
+                )
+
+            transaction.set_rollback(True)
+
+    def create_fixtures(self, count):
+        user = User.objects.create(username='bench-checkout')
+        category = ProductCategory.objects.create(name='Bench', slug='bench-checkout')
+        products = [
+            Product(
+                name=f'Bench product {i}',
+                slug=f'bench-checkout-{i}',
+                short_description='bench',
+                description='bench',
+                base_price=10 + i,
+                category=category,
+            )
+            for i in range(count)
+        ]
+        # bulk_create skips the signal that prices products
+        rules = get_rules()
+        for product in products:
+            product.effective_price = rules.unit_price(product)
+        Product.objects.bulk_create(products)
+        variants = ProductVariant.objects.bulk_create([
+            ProductVariant(product=product, sku=f'BENCH-CHECKOUT-{product.pk}', stock=1_000_000)
+            for product in products
+        ])
+        return user, variants
@@ -0,0 +1,192 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from web_management_app.models import Cart, CartItem, Order, Product, ProductCategory, ProductReview, ProductVariant
+
+
+def percentile(timings, share):
+    return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+
+def url_patterns(resolver=None, prefix=''):
+    # every route of the project as its regex/route string
+    for pattern in (resolver or get_resolver()).url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_patterns(pattern, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern), pattern
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every route of web_management_app/urls.py and the orders router on the "
+        "current database (see generate_catalog) and print per-route p50/p95/p99 "
+        "in-process latency and queries per request as JSON. Requests run one at a time "
+        "through the test client (no server, no network), on one connection inside a "
+        "transaction that is rolled back, so writes leave nothing behind and commits "
+        "cost nothing. This is for comparing routes and spotting regressions, not a "
+        "capacity number: see bench_async for concurrent requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Measured requests per route.")
+        parser.add_argument('--warmup', type=int, default=3, help="Unmeasured requests per route first.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        category = (
+            ProductCategory.objects.filter(is_active=True, product_count__gt=0)
+            .order_by('-depth', '-product_count').first()
+        )
+        product = (
+            Product.objects.filter(is_active=True, variants__is_active=True, variants__stock__gt=0)
+            .order_by('-review_count', 'id').first()
+        )
+        if category is None or product is None:
+            raise CommandError("No catalog to benchmark, run generate_catalog first.")
+        self.variant = product.variants.filter(is_active=True, stock__gt=0).order_by('-stock').first()
+        self.product = product
+
+        report = {
+            'database': str(connection.settings_dict['NAME']),
+            'products': Product.objects.count(),
+            'variants': ProductVariant.objects.count(),
+            'reviews': ProductReview.objects.count(),
+            'orders': Order.objects.count(),
+            'mode': 'in-process, sequential, rolled back',
+            'requests_per_route': options['requests'],
+            'routes': {},
+        }
+
+        # the test client sends Host: testserver, staff may download the feed
+        # (as often as the benchmark wants)
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], FEED_DOWNLOADS_PER_HOUR=10 ** 9), \
+                transaction.atomic():
+            self.user = User.objects.create(username='bench-routes', is_staff=True)
+            self.client = Client()
+            self.client.force_login(self.user)
+            self.cart = Cart.objects.create(user=self.user)
+            self.item = CartItem.objects.create(cart=self.cart, variant=self.variant, quantity=1)
+            self.order_id = self.place_order()
+
+            routes = self.routes(category, product)
+            for name, route in routes.items():
+                report['routes'][name] = self.run(route, options['warmup'], options['requests'])
+
+            report['not_covered'] = self.not_covered(routes)
+            transaction.set_rollback(True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stderr.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def place_order(self):
+        response = self.client.post('/orders/', {'payment_method': 'cash_on_delivery'}, content_type='application/json')
+        if response.status_code != 201:
+            raise CommandError(f"Couldn't place the fixture order: {response.status_code} {response.content[:200]}")
+        return response.json()['order_id']
+
+    def refill_cart(self):
+        self.item = CartItem.objects.create(cart=self.cart, variant=self.variant, quantity=1)
+
+    def routes(self, category, product):
+        slug = product.slug
+        word = product.name.split()[0]
+        # name -> (method, url, body, setup run before every request)
+        return {
+            'home': ('get', '/api/home/', None, None),
+            'navigation': ('get', '/api/navigation/', None, None),
+            'hero-section': ('get', '/api/hero-section/', None, None),
+            'categories': ('get', '/api/categories/', None, None),
+            'categories-all': ('get', '/api/categories/all/', None, None),
+            'category-products': ('get', f'/api/categories/{category.slug}/products/', None, None),
+            'category-products-filtered': (
+                'get', f'/api/categories/{category.slug}/products/?in_stock=true&ordering=price&size=M,L', None, None,
+            ),
+            'featured': ('get', '/api/products/featured/', None, None),
+            'new-arrivals': ('get', '/api/products/new-arrivals/', None, None),
+            'product-detail': ('get', f'/api/products/{slug}/', None, None),
+            'product-reviews': ('get', f'/api/products/{slug}/reviews/', None, None),
+            'search': ('get', f'/api/search/?q={word}', None, None),
+            'feed': ('get', '/api/feed/products.ndjson.gz', None, None),
+            'async-navigation': ('get', '/api/async/navigation/', None, None),
+            'async-hero-section': ('get', '/api/async/hero-section/', None, None),
+            'async-categories': ('get', '/api/async/categories/', None, None),
+            'async-categories-all': ('get', '/api/async/categories/all/', None, None),
+            'async-category-products': ('get', f'/api/async/categories/{category.slug}/products/', None, None),
+            'async-featured': ('get', '/api/async/products/featured/', None, None),
+            'async-new-arrivals': ('get', '/api/async/products/new-arrivals/', None, None),
+            'async-product-detail': ('get', f'/api/async/products/{slug}/', None, None),
+            'cart': ('get', '/api/cart/', None, self.ensure_cart_item),
+            'cart-add': ('post', '/api/cart/add/', {'variant_id': self.variant.pk, 'quantity': 1}, None),
+            'cart-batch': ('post', '/api/cart/batch/', {'operations': [
+                {'op': 'set', 'variant_id': self.variant.pk, 'quantity': 1},
+            ]}, None),
+            'cart-item-update': ('patch', lambda: f'/api/cart_item/{self.item.pk}/', {'quantity': 1}, self.ensure_cart_item),
+            'cart-item-delete': ('delete', lambda: f'/api/cart_item/{self.item.pk}/delete/', None, self.ensure_cart_item),
+            'orders': ('get', '/orders/', None, None),
+            'order-detail': ('get', lambda: f'/orders/{self.order_id}/', None, None),
+            'order-create': ('post', '/orders/', {'payment_method': 'cash_on_delivery'}, self.ensure_cart_item),
+        }
+
+    def ensure_cart_item(self):
+        if not CartItem.objects.filter(pk=self.item.pk).exists():
+            self.refill_cart()
+
+    def run(self, route, warmup, requests):
+        method, url, body, setup = route
+        timings = []
+        queries = []
+        statuses = set()
+        for index in range(warmup + requests):
+            if setup:
+                setup()
+            path = url() if callable(url) else url
+            kwargs = {'content_type': 'application/json', 'data': body} if body is not None else {}
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(self.client, method)(path, **kwargs)
+                elapsed = time.perf_counter() - started
+            if index >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+
+        timings.sort()
+        return {
+            'method': method.upper(),
+            'path': url() if callable(url) else url,
+            'status': sorted(statuses),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'queries': statistics.median_low(queries),
+            'queries_max': max(queries),
+        }
+
+    def not_covered(self, routes):
+        # routes added to urls.py without a benchmark entry show up in the report
+        covered = set()
+        for method, url, body, setup in routes.values():
+            path = (url() if callable(url) else url).split('?')[0].lstrip('/')
+            covered.add(get_resolver().resolve('/' + path).route)
+        return sorted(
+            route for route, pattern in url_patterns()
+            if route.lstrip('^').startswith(('api/', 'orders'))
+            # the router's .json/.api format suffix variants are the same views
+            and '(?P<format>' not in route
+            and route not in covered
+        )
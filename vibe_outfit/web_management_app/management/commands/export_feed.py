@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_management_app.feeds import FEED_CHUNK_SIZE, FEED_FORMATS, product_feed
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the product feed (one row per active variant with price, stock and "
+        "images) as NDJSON or CSV, optionally gzipped. Streamed chunk by chunk, the "
+        "same as /api/feed/products.<format>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FEED_FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--output', help="Write to this file instead of stdout.")
+        parser.add_argument('--chunk-size', type=int, default=FEED_CHUNK_SIZE, help="Products read per query.")
+        parser.add_argument('--base-url', default='',
+                            help="Prefix for image links, e.g. https://shop.example.com. Links are relative without it.")
+
+    def handle(self, *args, **options):
+        chunks = product_feed(
+            options['format'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size'],
+            base_url=options['base_url'].rstrip('/'),
+        )
+
+        started = time.perf_counter()
+        written = 0
+        file = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                file.close()
+            else:
+                file.flush()
+
+        if options['output']:
+            self.stderr.write(f"Wrote {written} bytes to {options['output']} in {time.perf_counter() - started:.1f}s.")
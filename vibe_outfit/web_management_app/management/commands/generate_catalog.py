@@ -0,0 +1,291 @@
+import random
+import time
+from array import array
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from web_management_app.cache import CATALOG, NAVIGATION, HERO, STOCK, bump_version
+from web_management_app.models import (
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    ProductImages,
+    ProductReview,
+    ProductVariant,
+)
+from web_management_app.pricing import get_rules
+
+ADJECTIVES = ['Classic', 'Slim', 'Relaxed', 'Vintage', 'Organic', 'Premium', 'Everyday', 'Urban', 'Soft', 'Heavy']
+NOUNS = ['Shirt', 'Jeans', 'Jacket', 'Sneaker', 'Dress', 'Hoodie', 'Lamp', 'Mug', 'Backpack', 'Watch']
+COLORS = ['#000000', '#ffffff', '#1f3a93', '#c0392b', '#27ae60', '#f1c40f', '#8e44ad', '#7f8c8d']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+MATERIALS = ['Cotton', 'Linen', 'Denim', 'Leather', 'Wool', 'Polyester', 'Wood', 'Ceramic']
+WORDS = (
+    'soft breathable fabric tailored fit durable stitching everyday comfort water resistant '
+    'lightweight warm layered handmade recycled sustainable stretch classic modern'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic catalog with bulk inserts (categories, products, variants, "
+        "images, users, reviews, carts, orders), then rebuild the derived data "
+        "(category tree, primary images, review stats, search index, facets)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--roots', type=int, default=6, help="Top level categories.")
+        parser.add_argument('--depth', type=int, default=3, help="Category levels, roots included.")
+        parser.add_argument('--fanout', type=int, default=4, help="Children per category.")
+        parser.add_argument('--variants', type=int, default=3, help=f"Variants per product, at most {len(SIZES)}.")
+        parser.add_argument('--images', type=int, default=2, help="Images per product.")
+        parser.add_argument('--users', type=int, default=20_000)
+        parser.add_argument('--reviews', type=int, default=5, help="Reviews per reviewing user.")
+        parser.add_argument('--carts', type=int, default=5_000, help="Users with a filled cart.")
+        parser.add_argument('--orders', type=int, default=50_000)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--prefix', default='gen', help="Prefix of generated slugs, skus and usernames.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not 1 <= options['variants'] <= len(SIZES):
+            raise CommandError(f"--variants must be between 1 and {len(SIZES)}.")
+        prefix = options['prefix']
+        if ProductCategory.objects.filter(slug__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Data with prefix '{prefix}' already exists, pick another --prefix.")
+
+        self.random = random.Random(options['seed'])
+        self.prefix = prefix
+        self.batch_size = options['batch_size']
+        self.image_names = self.sample_image_names()
+
+        leaves = self.timed('categories', self.create_categories, options['roots'], options['depth'], options['fanout'])
+        product_ids, prices = self.timed('products', self.create_products, options['products'], leaves)
+        variant_ids = self.timed('variants', self.create_variants, product_ids, options['variants'])
+        self.timed('images', self.create_images, product_ids, options['images'])
+        user_ids = self.timed('users', self.create_users, options['users'])
+        self.timed('reviews', self.create_reviews, user_ids, product_ids, options['reviews'])
+        self.timed('cart items', self.create_carts, user_ids[:options['carts']], variant_ids)
+        self.timed('orders', self.create_orders, user_ids, product_ids, prices, variant_ids,
+                   options['variants'], options['orders'])
+
+        # bulk_create skips save() and the signals, rebuild everything derived once
+        for command in ('rebuild_category_tree', 'backfill_primary_images', 'rebuild_review_stats',
+                        'rebuild_search_index', 'rebuild_facets'):
+            started = time.perf_counter()
+            call_command(command, stdout=self.stdout)
+            self.stdout.write(f"  {command} took {time.perf_counter() - started:.1f}s")
+        for name in (NAVIGATION, HERO, CATALOG, STOCK):
+            bump_version(name)
+
+    # ----- helpers -----
+    def timed(self, label, function, *args):
+        started = time.perf_counter()
+        result, rows = function(*args)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<12} {rows:>10} rows {elapsed:>8.1f}s {rows / max(elapsed, 1e-9):>10.0f} rows/s")
+        return result
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+
+    def sample_image_names(self):
+        # reuse the uploaded sample images, the generator doesn't create files
+        folder = Path(settings.MEDIA_ROOT) / 'products'
+        names = sorted(f'products/{path.name}' for path in folder.glob('*') if path.is_file())
+        return names or ['']
+
+    @staticmethod
+    def product_name(index):
+        # derived from the index, order snapshots need it without a lookup
+        return f'{ADJECTIVES[index % len(ADJECTIVES)]} {NOUNS[index // len(ADJECTIVES) % len(NOUNS)]} {index + 1}'
+
+    def description(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    # ----- tables -----
+    def create_categories(self, roots, depth, fanout):
+        level = ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'Category {i + 1}', slug=f'{self.prefix}-c{i + 1}', order=i)
+            for i in range(roots)
+        ])
+        total = len(level)
+        for _ in range(depth - 1):
+            level = ProductCategory.objects.bulk_create([
+                ProductCategory(
+                    name=f'{parent.name}.{i + 1}',
+                    slug=f'{parent.slug}-{i + 1}',
+                    order=i,
+                    parent=parent,
+                )
+                for parent in level
+                for i in range(fanout)
+            ], batch_size=self.batch_size)
+            total += len(level)
+        return [category.pk for category in level], total
+
+    def create_products(self, count, category_ids):
+        product_ids = array('q')
+        prices = array('d')
+        rules = get_rules()
+        for batch in self.batches(count):
+            products = []
+            for i in batch:
+                price = Decimal(self.random.randrange(500, 50_000)) / 100
+                product = Product(
+                    name=self.product_name(i),
+                    slug=f'{self.prefix}-p{i + 1}',
+                    short_description=self.description(8),
+                    description=self.description(40),
+                    base_price=price,
+                    discount_price=price * Decimal('0.9') if i % 7 == 0 else None,
+                    category_id=self.random.choice(category_ids),
+                    featured_products=i % 50 == 0,
+                    new_arrivals=i % 20 == 0,
+                )
+                product.effective_price = rules.unit_price(product)
+                products.append(product)
+                prices.append(float(price))
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+            product_ids.extend(product.pk for product in products)
+        return (product_ids, prices), count
+
+    def create_variants(self, product_ids, per_product):
+        variant_ids = array('q')
+        for batch in self.batches(len(product_ids)):
+            variants = [
+                ProductVariant(
+                    product_id=product_ids[i],
+                    sku=f'{self.prefix.upper()}-{product_ids[i]}-{k}',
+                    color=COLORS[(i + k) % len(COLORS)],
+                    size=SIZES[k],
+                    material=MATERIALS[i % len(MATERIALS)],
+                    stock=self.random.randrange(0, 60),
+                )
+                for i in batch
+                for k in range(per_product)
+            ]
+            with transaction.atomic():
+                ProductVariant.objects.bulk_create(variants)
+            variant_ids.extend(variant.pk for variant in variants)
+        return variant_ids, len(variant_ids)
+
+    def create_images(self, product_ids, per_product):
+        rows = 0
+        for batch in self.batches(len(product_ids)):
+            images = [
+                ProductImages(
+                    product_id=product_ids[i],
+                    image=self.image_names[(i + k) % len(self.image_names)],
+                    order=k,
+                )
+                for i in batch
+                for k in range(per_product)
+            ]
+            with transaction.atomic():
+                ProductImages.objects.bulk_create(images)
+            rows += len(images)
+        return None, rows
+
+    def create_users(self, count):
+        # one hash for everybody, hashing per user would dominate the run
+        password = make_password(None)
+        user_ids = array('q')
+        for batch in self.batches(count):
+            users = [User(username=f'{self.prefix}-user-{i + 1}', password=password) for i in batch]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+            user_ids.extend(user.pk for user in users)
+        return user_ids, count
+
+    def create_reviews(self, user_ids, product_ids, per_user):
+        rows = 0
+        per_user = min(per_user, len(product_ids))
+        # every other user writes reviews, never two for the same product
+        reviewers = user_ids[::2]
+        step = max(1, self.batch_size // max(per_user, 1))
+        for start in range(0, len(reviewers), step):
+            reviews = [
+                ProductReview(
+                    product_id=product_id,
+                    user_id=user_id,
+                    rating=self.random.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 6, 8))[0],
+                    comment=self.description(12),
+                )
+                for user_id in reviewers[start:start + step]
+                for product_id in self.random.sample(product_ids, per_user)
+            ]
+            with transaction.atomic():
+                ProductReview.objects.bulk_create(reviews)
+            rows += len(reviews)
+        return None, rows
+
+    def create_carts(self, user_ids, variant_ids):
+        rows = 0
+        for start in range(0, len(user_ids), self.batch_size):
+            with transaction.atomic():
+                carts = Cart.objects.bulk_create([Cart(user_id=user_id) for user_id in user_ids[start:start + self.batch_size]])
+                items = [
+                    CartItem(cart=cart, variant_id=variant_id, quantity=self.random.randint(1, 3))
+                    for cart in carts
+                    for variant_id in self.random.sample(variant_ids, self.random.randint(1, 5))
+                ]
+                CartItem.objects.bulk_create(items)
+            rows += len(items)
+        return None, rows
+
+    def create_orders(self, user_ids, product_ids, prices, variant_ids, per_product, count):
+        rows = 0
+        for batch in self.batches(count):
+            orders = []
+            lines = []
+            for _ in batch:
+                order_lines = []
+                for variant_index in self.random.sample(range(len(variant_ids)), self.random.randint(1, 4)):
+                    # variants were created per product in order
+                    product_index = variant_index // per_product
+                    k = variant_index % per_product
+                    order_lines.append(OrderItem(
+                        product_id=product_ids[product_index],
+                        product_variant_id=variant_ids[variant_index],
+                        product_name=self.product_name(product_index),
+                        sku=f'{self.prefix.upper()}-{product_ids[product_index]}-{k}',
+                        attributes={
+                            'color': COLORS[(product_index + k) % len(COLORS)],
+                            'size': SIZES[k],
+                            'material': MATERIALS[product_index % len(MATERIALS)],
+                        },
+                        quantity=self.random.randint(1, 3),
+                        price=Decimal(str(prices[product_index])),
+                    ))
+                orders.append(Order(
+                    user_id=self.random.choice(user_ids),
+                    total_amount=sum(line.price * line.quantity for line in order_lines),
+                    status=self.random.choice(Order.STATUS_CHOICES)[0],
+                    payment_method=self.random.choice(Order.PAYMENT_METHOD_CHOICES)[0],
+                ))
+                lines.append(order_lines)
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                items = []
+                for order, order_lines in zip(orders, lines):
+                    for line in order_lines:
+                        line.order = order
+                        items.append(line)
+                OrderItem.objects.bulk_create(items)
+            rows += len(orders)
+        return None, rows
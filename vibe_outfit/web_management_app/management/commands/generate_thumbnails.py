@@ -0,0 +1,50 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from web_management_app.models import HeroSection, NavButtons, ProductCategory, ProductImages
+from web_management_app.thumbnails import generate_renditions
+
+
+# every image field that gets renditions, Product.primary_image is a copy of ProductImages.image
+IMAGE_FIELDS = (
+    (ProductImages, 'image'),
+    (ProductCategory, 'image'),
+    (HeroSection, 'bg_img'),
+    (NavButtons, 'icon'),
+)
+
+
+class Command(BaseCommand):
+    help = "Generate the missing or outdated renditions of every uploaded image."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.THUMBNAIL_WORKERS)
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field in IMAGE_FIELDS:
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True).iterator()
+            )
+
+        media_root = str(settings.MEDIA_ROOT)
+        created = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+        ) as executor:
+            futures = {executor.submit(generate_renditions, media_root, name): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    created += future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(names)} images, wrote {created} renditions, {failed} failed."
+        ))
@@ -0,0 +1,441 @@
+import csv
+import gzip
+import hashlib
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from web_management_app.cache import STOCK, bump_version
+from web_management_app.models import Product, ProductCategory, ProductImages, ProductVariant
+from web_management_app.pricing import get_rules
+
+TRUE = {'1', 'true', 'yes', 'y', 't'}
+FALSE = {'0', 'false', 'no', 'n', 'f'}
+
+PRODUCT_FIELDS = [
+    'name', 'category', 'short_description', 'description', 'base_price', 'discount_price',
+    'effective_price', 'featured_products', 'new_arrivals', 'is_active', 'import_hash', 'updated_at',
+]
+VARIANT_FIELDS = ['product', 'color', 'size', 'material', 'stock', 'is_active', 'import_hash', 'updated_at']
+CATEGORY_FIELDS = ['name', 'order', 'is_active', 'updated_at']
+
+# bulk inserts skip the signals, the derived data is rebuilt once at the end;
+# imported products get their effective_price when they are built
+REBUILDS = {
+    'categories': ['rebuild_category_tree', 'rebuild_search_index', 'rebuild_effective_prices'],
+    'products': ['rebuild_category_tree', 'rebuild_search_index', 'rebuild_facets'],
+    'variants': ['rebuild_search_index', 'rebuild_facets'],
+    'images': ['backfill_primary_images'],
+}
+
+
+class RowError(Exception):
+    pass
+
+
+# ----- row values, CSV gives strings, JSONL may give numbers and booleans -----
+def text(row, model, field, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"{field} is required")
+    max_length = model._meta.get_field(field).max_length
+    if max_length and len(value) > max_length:
+        raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def slug_value(row, model, field='slug'):
+    value = text(row, model, field, required=True)
+    try:
+        validate_slug(value)
+    except ValidationError:
+        raise RowError(f"{field} {value!r} is not a valid slug")
+    return value
+
+
+def boolean(row, field, default):
+    value = row.get(field)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE:
+        return True
+    if value in FALSE:
+        return False
+    raise RowError(f"{field} {value!r} is not a boolean")
+
+
+def integer(row, field, default):
+    value = row.get(field)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} {value!r} is not a whole number")
+    if value < 0:
+        raise RowError(f"{field} can't be negative")
+    return value
+
+
+def price(row, field, required=False):
+    value = row.get(field)
+    if value is None or value == '':
+        if required:
+            raise RowError(f"{field} is required")
+        return None
+    try:
+        value = Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f"{field} {value!r} is not a price")
+    if not 0 <= value < 10 ** 8:
+        raise RowError(f"{field} {value} is out of range")
+    return value
+
+
+def reference(row, field):
+    # slug of a related category or product
+    return str(row.get(field) or '').strip()
+
+
+def product_id(row, product_ids):
+    product = reference(row, 'product')
+    if product not in product_ids:
+        raise RowError(f"unknown product {product!r}")
+    return product_ids[product]
+
+
+def row_hash(row):
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a supplier catalog from CSV or JSONL (optionally .gz) and upsert it in "
+        "batches: categories and products by slug, variants by sku, images by product and "
+        "file name. Rows that didn't change since the last import are skipped. Rejected "
+        "rows are reported, the derived data is rebuilt once at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, .gz compressed files are read as well.")
+        parser.add_argument('--kind', required=True, choices=list(REBUILDS),
+                            help="What the file holds. Categories before products, products before variants and images.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="File format, taken from the file extension by default.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows upserted per statement and transaction.")
+        parser.add_argument('--rejects', help="Write rejected rows with the reason to this JSONL file.")
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help="Skip rebuilding the derived data, e.g. when more files follow.")
+
+    def handle(self, *args, **options):
+        self.kind = options['kind']
+        self.counts = dict.fromkeys(['read', 'created', 'updated', 'unchanged', 'rejected'], 0)
+        self.rejects_file = open(options['rejects'], 'w') if options['rejects'] else None
+        if self.kind in ('categories', 'products'):
+            # categories are few, all of them fit in memory
+            self.categories = {
+                category['slug']: category
+                for category in ProductCategory.objects.values('id', 'slug', 'name', 'order', 'is_active', 'parent_id')
+            }
+            self.rules = get_rules()
+        self.parents = {}
+        self.unchanged = set()
+
+        started = time.perf_counter()
+        try:
+            rows = self.read_rows(options['path'], options['format'] or self.guess_format(options['path']))
+            write = getattr(self, f'write_{self.kind}')
+            while batch := list(islice(rows, options['batch_size'])):
+                self.counts['read'] += len(batch)
+                write(batch)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  {self.counts['read']} rows, {time.perf_counter() - started:.1f}s")
+            if self.kind == 'categories':
+                self.write_parents()
+        finally:
+            if self.rejects_file:
+                self.rejects_file.close()
+        elapsed = time.perf_counter() - started
+
+        counts = self.counts
+        self.stdout.write(
+            f"Read {counts['read']} {self.kind} rows in {elapsed:.1f}s ({counts['read'] / max(elapsed, 1e-9):.0f} rows/s): "
+            f"{counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+            f"{counts['rejected']} rejected."
+        )
+
+        if counts['created'] or counts['updated']:
+            if not options['no_rebuild']:
+                for command in REBUILDS[self.kind]:
+                    call_command(command, stdout=self.stdout)
+            if self.kind == 'variants':
+                bump_version(STOCK)
+
+    # ----- reading -----
+    def guess_format(self, path):
+        name = path.lower().removesuffix('.gz')
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        raise CommandError(f"Can't tell the format of {path}, pass --format.")
+
+    def read_rows(self, path, file_format):
+        # a generator over (line number, row): the file is never read in full
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            file = opener(path, 'rt', newline='', encoding='utf-8-sig')
+        except OSError as error:
+            raise CommandError(f"Can't open {path}: {error}")
+
+        with file:
+            if file_format == 'csv':
+                # line numbers of the file, the header is line 1
+                for line, row in enumerate(csv.DictReader(file), start=2):
+                    row.pop(None, None)
+                    yield line, row
+                return
+
+            for line, raw in enumerate(file, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    row = json.loads(raw)
+                except ValueError as error:
+                    self.counts['read'] += 1
+                    self.reject(line, raw.strip(), f"invalid JSON: {error}")
+                    continue
+                if not isinstance(row, dict):
+                    self.counts['read'] += 1
+                    self.reject(line, row, "a line must hold a JSON object")
+                    continue
+                yield line, row
+
+    def reject(self, line, row, error):
+        self.counts['rejected'] += 1
+        if self.rejects_file:
+            self.rejects_file.write(json.dumps({'line': line, 'error': str(error), 'row': row}, default=str) + '\n')
+        elif self.counts['rejected'] <= 10:
+            self.stderr.write(f"line {line}: {error}")
+
+    def clean(self, batch, build, key):
+        # build every row, reject the bad ones; the last row wins for a repeated key
+        objects = {}
+        for line, row in batch:
+            try:
+                obj = build(row)
+            except RowError as error:
+                self.reject(line, row, error)
+                continue
+            obj.import_hash = row_hash(row)
+            objects[getattr(obj, key)] = (line, row, obj)
+        return objects
+
+    def upsert(self, model, rows, **options):
+        # one INSERT .. ON CONFLICT DO UPDATE for the batch. When a row breaks
+        # another constraint the batch is retried row by row to reject just that one.
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([obj for line, row, obj in rows], **options)
+            return rows
+        except IntegrityError:
+            pass
+
+        written = []
+        for line, row, obj in rows:
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create([obj], **options)
+                written.append((line, row, obj))
+            except IntegrityError as error:
+                self.reject(line, row, error)
+        return written
+
+    def count(self, written, existing, key):
+        for line, row, obj in written:
+            self.counts['updated' if getattr(obj, key) in existing else 'created'] += 1
+
+    # ----- categories -----
+    def build_category(self, row):
+        return ProductCategory(
+            slug=slug_value(row, ProductCategory),
+            name=text(row, ProductCategory, 'name', required=True),
+            order=integer(row, 'order', 0),
+            is_active=boolean(row, 'is_active', True),
+        )
+
+    def write_categories(self, batch):
+        categories = self.clean(batch, self.build_category, 'slug')
+        changed = []
+        for line, row, category in categories.values():
+            # parents are set after the whole file, they may come later in it
+            self.parents[category.slug] = (line, row, reference(row, 'parent'))
+            stored = self.categories.get(category.slug)
+            if stored and all(stored[field] == getattr(category, field) for field in ('name', 'order', 'is_active')):
+                self.unchanged.add(category.slug)
+            else:
+                changed.append((line, row, category))
+        self.counts['unchanged'] += len(categories) - len(changed)
+
+        written = self.upsert(
+            ProductCategory, changed,
+            update_conflicts=True, unique_fields=['slug'], update_fields=CATEGORY_FIELDS,
+        )
+        self.count(written, self.categories, 'slug')
+        for category in ProductCategory.objects.filter(slug__in=[obj.slug for line, row, obj in written]).values(
+            'id', 'slug', 'name', 'order', 'is_active', 'parent_id'
+        ):
+            self.categories[category['slug']] = category
+
+    def write_parents(self):
+        parent_ids = {slug: category['parent_id'] for slug, category in self.categories.items()}
+        slugs = {category['id']: slug for slug, category in self.categories.items()}
+        moved = []
+        for slug, (line, row, parent) in self.parents.items():
+            if slug not in self.categories:
+                continue
+            if parent and parent not in self.categories:
+                self.reject(line, row, f"unknown parent category {parent!r}")
+                continue
+            parent_id = self.categories[parent]['id'] if parent else None
+            if parent_id == parent_ids[slug]:
+                continue
+
+            # walking up from the new parent must not lead back to this category
+            ancestor = parent_id
+            while ancestor is not None and slugs[ancestor] != slug:
+                ancestor = parent_ids[slugs[ancestor]]
+            if ancestor is not None:
+                self.reject(line, row, f"parent {parent!r} is inside category {slug!r}")
+                continue
+
+            parent_ids[slug] = parent_id
+            moved.append(ProductCategory(id=self.categories[slug]['id'], parent_id=parent_id))
+            if slug in self.unchanged:
+                self.counts['unchanged'] -= 1
+                self.counts['updated'] += 1
+
+        with transaction.atomic():
+            ProductCategory.objects.bulk_update(moved, ['parent'], batch_size=500)
+
+    # ----- products -----
+    def build_product(self, row):
+        category = reference(row, 'category')
+        if category not in self.categories:
+            raise RowError(f"unknown category {category!r}")
+        product = Product(
+            slug=slug_value(row, Product),
+            name=text(row, Product, 'name', required=True),
+            category_id=self.categories[category]['id'],
+            short_description=text(row, Product, 'short_description'),
+            description=text(row, Product, 'description'),
+            base_price=price(row, 'base_price', required=True),
+            discount_price=price(row, 'discount_price'),
+            featured_products=boolean(row, 'featured_products', False),
+            new_arrivals=boolean(row, 'new_arrivals', False),
+            is_active=boolean(row, 'is_active', True),
+        )
+        product.effective_price = self.rules.unit_price(product)
+        return product
+
+    def write_products(self, batch):
+        products = self.clean(batch, self.build_product, 'slug')
+        existing = dict(Product.objects.filter(slug__in=products).values_list('slug', 'import_hash'))
+        changed = [(line, row, obj) for line, row, obj in products.values() if existing.get(obj.slug) != obj.import_hash]
+        self.counts['unchanged'] += len(products) - len(changed)
+
+        written = self.upsert(
+            Product, changed,
+            update_conflicts=True, unique_fields=['slug'], update_fields=PRODUCT_FIELDS,
+        )
+        self.count(written, existing, 'slug')
+
+    # ----- variants -----
+    def product_ids(self, batch):
+        # one query per batch, the product table may not fit in memory
+        slugs = {reference(row, 'product') for line, row in batch}
+        return dict(Product.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+
+    def write_variants(self, batch):
+        product_ids = self.product_ids(batch)
+
+        def build(row):
+            return ProductVariant(
+                sku=text(row, ProductVariant, 'sku', required=True),
+                product_id=product_id(row, product_ids),
+                color=text(row, ProductVariant, 'color'),
+                size=text(row, ProductVariant, 'size'),
+                material=text(row, ProductVariant, 'material'),
+                stock=integer(row, 'stock', 0),
+                is_active=boolean(row, 'is_active', True),
+            )
+
+        variants = self.clean(batch, build, 'sku')
+        existing = dict(ProductVariant.objects.filter(sku__in=variants).values_list('sku', 'import_hash'))
+        changed = [(line, row, obj) for line, row, obj in variants.values() if existing.get(obj.sku) != obj.import_hash]
+        self.counts['unchanged'] += len(variants) - len(changed)
+
+        written = self.upsert(
+            ProductVariant, changed,
+            update_conflicts=True, unique_fields=['sku'], update_fields=VARIANT_FIELDS,
+        )
+        self.count(written, existing, 'sku')
+
+    # ----- images -----
+    def write_images(self, batch):
+        # images have no natural key: a product's image is identified by its
+        # file name, a known one only gets its order and active flag updated
+        product_ids = self.product_ids(batch)
+        images = {}
+        for line, row in batch:
+            try:
+                image = ProductImages(
+                    product_id=product_id(row, product_ids),
+                    image=text(row, ProductImages, 'image', required=True),
+                    order=integer(row, 'order', 0),
+                    is_active=boolean(row, 'is_active', True),
+                )
+            except RowError as error:
+                self.reject(line, row, error)
+                continue
+            images[(image.product_id, image.image.name)] = (line, row, image)
+
+        existing = {
+            (image['product_id'], image['image']): image
+            for image in ProductImages.objects.filter(product_id__in=product_ids.values()).values(
+                'id', 'product_id', 'image', 'order', 'is_active'
+            )
+        }
+        created, updated = [], []
+        now = timezone.now()
+        for key, (line, row, image) in images.items():
+            stored = existing.get(key)
+            if stored is None:
+                if default_storage.exists(image.image.name):
+                    created.append(image)
+                else:
+                    self.reject(line, row, f"image {image.image.name!r} isn't in media storage")
+            elif (stored['order'], stored['is_active']) != (image.order, image.is_active):
+                image.pk, image.updated_at = stored['id'], now
+                updated.append(image)
+            else:
+                self.counts['unchanged'] += 1
+
+        with transaction.atomic():
+            ProductImages.objects.bulk_create(created)
+            ProductImages.objects.bulk_update(updated, ['order', 'is_active', 'updated_at'])
+        self.counts['created'] += len(created)
+        self.counts['updated'] += len(updated)
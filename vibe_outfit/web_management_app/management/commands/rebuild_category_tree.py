@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from web_management_app.cache import CATALOG, bump_version
+from web_management_app.models import rebuild_category_tree
+
+
+class Command(BaseCommand):
+    help = "Recompute category paths, depths and product counts from ProductCategory.parent."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_category_tree()
+
+        bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} categories."))
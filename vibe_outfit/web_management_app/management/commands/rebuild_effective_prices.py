@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from web_management_app.cache import CATALOG, PRICING, bump_version
+from web_management_app.pricing import refresh_effective_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Product.effective_price from the prices and the promotions in effect now. "
+        "Only changed rows are written, run it every few minutes (cron) so listings follow "
+        "promotions that start or end on a schedule, and after bulk inserts."
+    )
+
+    def handle(self, *args, **options):
+        bump_version(PRICING)
+        changed = refresh_effective_prices()
+        if changed:
+            bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Repriced {changed} products."))
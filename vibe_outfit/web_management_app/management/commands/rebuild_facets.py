@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from web_management_app.cache import CATALOG, bump_version
+from web_management_app.facets import refresh_category_facets
+from web_management_app.models import ProductCategory
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed facet bitmaps of every category."
+
+    def handle(self, *args, **options):
+        category_ids = list(ProductCategory.objects.values_list('id', flat=True))
+        for category_id in category_ids:
+            refresh_category_facets([category_id])
+
+        bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt facets for {len(category_ids)} categories."))
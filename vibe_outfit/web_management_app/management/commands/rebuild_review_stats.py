@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from web_management_app.cache import CATALOG, bump_version
+from web_management_app.models import rebuild_review_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the review count and rating histogram of every product."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_review_stats()
+
+        bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt review stats for {total} products."))
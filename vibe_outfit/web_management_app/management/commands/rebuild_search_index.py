@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from web_management_app.search import rebuild_search_index, search_enabled
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 product search index from the product tables."
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            self.stdout.write(self.style.WARNING("Full text search needs SQLite, nothing to rebuild."))
+            return
+
+        with transaction.atomic():
+            rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from web_management_app.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the replica file with SQLite's online "
+        "backup. A local stand-in for real replication (litestream, LiteFS, ...)."
+    )
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError("No replica database configured, set DB_PROFILE=production and DB_REPLICA_NAME.")
+
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replica only copies SQLite databases.")
+        primary.ensure_connection()
+
+        target = sqlite3.connect(settings.DATABASES[REPLICA]['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        connections[REPLICA].close()
+
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary.settings_dict['NAME']} to the replica."))
@@ -0,0 +1,142 @@
+import json
+import logging
+import random
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('web_management_app.timing')
+
+
+# --------------------------- request timing start here ---------------------------
+# For a sample of requests (QUERY_TIMING_SAMPLE_RATE, 0 = off) record the number
+# of queries, time spent in the database, in the application (views,
+# serializers, rendering: everything but the database) and in total. Reported
+# as a Server-Timing header (visible in the browser's network tab) and as one
+# JSON log line per request. SQL that runs more than once in the same request
+# (the N+1 pattern) is listed in the log line with the view it came from.
+PLACEHOLDER_LIST = re.compile(r'%s(?:, %s)+')
+DUPLICATES_LOGGED = 5
+
+# the sampled request's RequestTiming; a context variable, so it follows the
+# request into the thread sync_to_async runs its queries on
+_current = ContextVar('request_timing', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+def record_queries(connection, **kwargs):
+    # Installed once per connection. First in the list: execute_wrapper()
+    # blocks pop their own wrapper from the end.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.signatures = Counter()
+
+    # connection.execute_wrapper() hook
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries += 1
+            # IN (%s, %s, ...) of any length is the same query
+            self.signatures[PLACEHOLDER_LIST.sub('%s, ...', sql)] += 1
+
+    def duplicates(self):
+        return [
+            {'sql': sql[:300], 'count': count}
+            for sql, count in self.signatures.most_common(DUPLICATES_LOGGED)
+            if count > 1
+        ]
+
+
+class QueryTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        # off: not even in the middleware chain
+        self.sample_rate = settings.QUERY_TIMING_SAMPLE_RATE
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # under ASGI stay async, so async views aren't pushed to a thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(record_queries)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        # connections this thread opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            record_queries(connection)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timing, perf_counter() - started)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timing, perf_counter() - started)
+
+    def report(self, request, response, timing, total_time):
+        app_time = max(total_time - timing.db_time, 0)
+        response['Server-Timing'] = ', '.join([
+            f'db;desc="{timing.queries} queries";dur={timing.db_time * 1000:.2f}',
+            f'app;dur={app_time * 1000:.2f}',
+            f'total;dur={total_time * 1000:.2f}',
+        ])
+
+        match = request.resolver_match
+        duplicates = timing.duplicates()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': timing.queries,
+            'db_ms': round(timing.db_time * 1000, 2),
+            'app_ms': round(app_time * 1000, 2),
+            'total_ms': round(total_time * 1000, 2),
+            'duplicates': duplicates,
+        }
+        logger.log(logging.WARNING if duplicates else logging.INFO, json.dumps(record))
+        return response
+
+# --------------------------- request timing end here ---------------------------
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0006_alter_productcategory_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productcategory',
+            options={'verbose_name': 'Category', 'verbose_name_plural': "Category's"},
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='productcategory',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='catagory/'),
+        ),
+    ]
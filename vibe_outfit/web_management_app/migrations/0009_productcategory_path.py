@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_category_paths(apps, schema_editor):
+    ProductCategory = apps.get_model('web_management_app', 'ProductCategory')
+    Product = apps.get_model('web_management_app', 'Product')
+
+    parents = dict(ProductCategory.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def build_path(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = f'{build_path(parent_id) if parent_id else ""}{pk}/'
+        return paths[pk]
+
+    counts = dict.fromkeys(parents, 0)
+    direct_counts = Product.objects.filter(is_active=True).values('category').annotate(total=Count('id'))
+    for row in direct_counts:
+        for ancestor in build_path(row['category']).split('/')[:-1]:
+            counts[int(ancestor)] += row['total']
+
+    for pk in parents:
+        path = build_path(pk)
+        ProductCategory.objects.filter(pk=pk).update(path=path, depth=path.count('/') - 1, product_count=counts[pk])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0008_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcategory',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
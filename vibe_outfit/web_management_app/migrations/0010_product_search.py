@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+from django.db import migrations
+
+
+CREATE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS web_management_app_product_search USING fts5(
+        name, short_description, description, category, variants,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+POPULATE_SQL = """
+    INSERT INTO web_management_app_product_search (rowid, name, short_description, description, category, variants)
+    SELECT p.id, p.name, p.short_description, p.description, c.name,
+           (SELECT group_concat(v.sku || ' ' || v.material, ' ')
+              FROM web_management_app_productvariant v
+             WHERE v.product_id = p.id AND v.is_active)
+      FROM web_management_app_product p
+      JOIN web_management_app_productcategory c ON c.id = p.category_id
+     WHERE p.is_active
+"""
+
+
+def create_search_table(apps, schema_editor):
+    # FTS5 is SQLite only, other databases fall back to LIKE in search.py
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS web_management_app_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0009_productcategory_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_facets(apps, schema_editor):
+    ProductCategory = apps.get_model('web_management_app', 'ProductCategory')
+    ProductVariant = apps.get_model('web_management_app', 'ProductVariant')
+    Product = apps.get_model('web_management_app', 'Product')
+    CategoryFacet = apps.get_model('web_management_app', 'CategoryFacet')
+
+    def to_bytes(ids):
+        data = bytearray(max(ids) // 8 + 1)
+        for pk in ids:
+            data[pk >> 3] |= 1 << (pk & 7)
+        return bytes(data)
+
+    for category_id in ProductCategory.objects.values_list('id', flat=True):
+        groups = {('all', ''): set(Product.objects.filter(category_id=category_id, is_active=True).values_list('id', flat=True))}
+        variants = ProductVariant.objects.filter(
+            product__category_id=category_id, product__is_active=True, is_active=True,
+        ).values_list('product_id', 'color', 'size', 'material', 'stock')
+        for product_id, color, size, material, stock in variants:
+            for attribute, value in (('color', color), ('size', size), ('material', material)):
+                if value:
+                    groups.setdefault((attribute, value), set()).add(product_id)
+            if stock > 0:
+                groups.setdefault(('in_stock', ''), set()).add(product_id)
+
+        CategoryFacet.objects.bulk_create([
+            CategoryFacet(category_id=category_id, attribute=attribute, value=value,
+                          product_count=len(ids), products=to_bytes(ids) if ids else b'')
+            for (attribute, value), ids in groups.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0010_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute', models.CharField(choices=[('all', 'All products'), ('color', 'Color'), ('size', 'Size'), ('material', 'Material'), ('in_stock', 'In stock')], max_length=20)),
+                ('value', models.CharField(blank=True, max_length=50)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('products', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='web_management_app.productcategory')),
+            ],
+            options={
+                'verbose_name': 'Category Facet',
+                'verbose_name_plural': 'Category Facets',
+                'unique_together': {('category', 'attribute', 'value')},
+            },
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    # keep the oldest cart of every user, move the other carts' lines into it
+    Cart = apps.get_model('web_management_app', 'Cart')
+    CartItem = apps.get_model('web_management_app', 'CartItem')
+
+    duplicated = Cart.objects.values('user').annotate(total=Count('id')).filter(total__gt=1)
+    for row in duplicated:
+        carts = list(Cart.objects.filter(user=row['user']).order_by('created_at', 'id'))
+        keep, extra = carts[0], carts[1:]
+        kept = {item.variant_id: item for item in CartItem.objects.filter(cart=keep)}
+
+        for item in CartItem.objects.filter(cart__in=extra):
+            if item.variant_id in kept:
+                kept[item.variant_id].quantity += item.quantity
+                kept[item.variant_id].save(update_fields=['quantity'])
+            else:
+                CartItem.objects.filter(pk=item.pk).update(cart=keep)
+                kept[item.variant_id] = item
+        Cart.objects.filter(pk__in=[cart.pk for cart in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0011_categoryfacet'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_cart_per_user'),
+        ),
+    ]
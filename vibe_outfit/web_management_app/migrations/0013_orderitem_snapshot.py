@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def snapshot_order_items(apps, schema_editor):
+    OrderItem = apps.get_model('web_management_app', 'OrderItem')
+
+    items = OrderItem.objects.select_related('product', 'product_variant')
+    batch = []
+    for item in items.iterator(chunk_size=2000):
+        variant = item.product_variant
+        item.product_name = item.product.name
+        item.sku = variant.sku
+        item.attributes = {
+            name: getattr(variant, name)
+            for name in ('color', 'size', 'material')
+            if getattr(variant, name)
+        }
+        batch.append(item)
+        if len(batch) == 2000:
+            OrderItem.objects.bulk_update(batch, ['product_name', 'sku', 'attributes'])
+            batch = []
+    OrderItem.objects.bulk_update(batch, ['product_name', 'sku', 'attributes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0012_unique_cart_per_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='attributes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='sku',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='web_managem_user_id_69b8bb_idx'),
+        ),
+        migrations.RunPython(snapshot_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_reviews(apps, schema_editor):
+    Product = apps.get_model('web_management_app', 'Product')
+    ProductReview = apps.get_model('web_management_app', 'ProductReview')
+
+    stats = {}
+    rows = ProductReview.objects.values('product', 'rating').annotate(total=Count('id')).order_by()
+    for row in rows:
+        stats.setdefault(row['product'], {})[row['rating']] = row['total']
+
+    for product_id, histogram in stats.items():
+        Product.objects.filter(pk=product_id).update(
+            review_count=sum(histogram.values()),
+            **{f'rating_{rating}_count': histogram.get(rating, 0) for rating in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0013_orderitem_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='web_managem_product_0aec74_idx'),
+        ),
+        migrations.RunPython(count_reviews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0014_product_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
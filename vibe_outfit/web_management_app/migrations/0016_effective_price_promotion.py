@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:49
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Least
+
+
+def set_effective_prices(apps, schema_editor):
+    # no promotions yet, the lower of base and discount price
+    Product = apps.get_model('web_management_app', 'Product')
+    Product.objects.update(effective_price=Least('base_price', Coalesce('discount_price', 'base_price')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0015_import_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('percent_off', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('min_quantity', models.PositiveIntegerField(default=1, help_text='Units of one cart line needed, e.g. 3 for "3 or more"', validators=[django.core.validators.MinValueValidator(1)])),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Promotion',
+                'verbose_name_plural': 'Promotions',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='web_managem_base_pr_899bb2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='web_managem_categor_d13e46_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(set_effective_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='web_managem_effecti_4e33df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'effective_price', 'id'], name='web_managem_categor_d96279_idx'),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='category',
+            field=models.ForeignKey(blank=True, help_text='Empty for the whole catalog', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='web_management_app.productcategory'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+import zlib
+
+from django.db import migrations, models
+
+
+def compress_bitmaps(apps, schema_editor):
+    # raw little endian bitmaps -> offset + zlib, see facets.encode_bitmap
+    CategoryFacet = apps.get_model('web_management_app', 'CategoryFacet')
+    for facet in CategoryFacet.objects.iterator(chunk_size=100):
+        bitmap = int.from_bytes(bytes(facet.products), 'little')
+        if bitmap:
+            facet.offset = ((bitmap & -bitmap).bit_length() - 1) & ~7
+            shifted = bitmap >> facet.offset
+            facet.products = zlib.compress(shifted.to_bytes((shifted.bit_length() + 7) // 8, 'little'))
+        else:
+            facet.offset, facet.products = 0, b''
+        facet.save(update_fields=['offset', 'products'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0016_effective_price_promotion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryfacet',
+            name='offset',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compress_bitmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+import zlib
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# facets.PRICE_BUCKETS when the price facets were added
+PRICE_BUCKETS = tuple(Decimal(edge) for edge in (0, 10, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000, 2000))
+
+
+def add_price_facets(apps, schema_editor):
+    # one row per category and price bucket, encoded like facets.encode_bitmap
+    CategoryFacet = apps.get_model('web_management_app', 'CategoryFacet')
+    Product = apps.get_model('web_management_app', 'Product')
+    members = {}
+    products = Product.objects.filter(is_active=True).values_list('id', 'category_id', 'effective_price')
+    for pk, category_id, price in products.iterator(chunk_size=2000):
+        bucket = PRICE_BUCKETS[max(bisect_right(PRICE_BUCKETS, price) - 1, 0)]
+        members.setdefault((category_id, str(bucket)), []).append(pk)
+
+    facets = []
+    for (category_id, value), ids in members.items():
+        data = bytearray(max(ids) // 8 + 1)
+        for pk in ids:
+            data[pk >> 3] |= 1 << (pk & 7)
+        bitmap = int.from_bytes(data, 'little')
+        offset = ((bitmap & -bitmap).bit_length() - 1) & ~7
+        shifted = bitmap >> offset
+        facets.append(CategoryFacet(
+            category_id=category_id, attribute='price', value=value, product_count=len(ids), offset=offset,
+            products=zlib.compress(shifted.to_bytes((shifted.bit_length() + 7) // 8, 'little')),
+        ))
+    CategoryFacet.objects.bulk_create(facets, batch_size=500)
+
+
+def remove_price_facets(apps, schema_editor):
+    CategoryFacet = apps.get_model('web_management_app', 'CategoryFacet')
+    CategoryFacet.objects.filter(attribute='price').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_management_app', '0018_effective_price_required'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoryfacet',
+            name='attribute',
+            field=models.CharField(choices=[('all', 'All products'), ('color', 'Color'), ('size', 'Size'), ('material', 'Material'), ('in_stock', 'In stock'), ('price', 'Price from')], max_length=20),
+        ),
+        migrations.RunPython(add_price_facets, remove_price_facets),
+    ]
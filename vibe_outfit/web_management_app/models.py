@@ -1,4 +1,9 @@
+from collections import Counter, defaultdict
+
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Concat, Substr
+from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
@@ -85,6 +90,13 @@ class ProductCategory(models.Model):
     image = models.ImageField(upload_to= 'catagory/',null=True, blank=True)
     parent = models.ForeignKey('self',on_delete=models.CASCADE, null= True, blank=True, related_name='children')
 
+    # materialized path of ids from the root, e.g. "1/4/9/" for Men > Shirts > Formal.
+    # Maintained in save(), a whole subtree is one range scan on this column.
+    path = models.CharField(max_length=255, default='', editable=False, db_index=True)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+    # active products in this category and all of its descendants
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+
     is_active = models.BooleanField(default=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -101,6 +113,125 @@ class ProductCategory(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a rename has to reindex the category's products for search
+        instance._loaded_name = instance.__dict__.get('name')
+        # a move reprices the subtree
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    def clean(self):
+        if self.parent_id and self.pk and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': _("A category can't be moved under itself or its children.")})
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            # a move is written before the row, post_save handlers see the new tree
+            self.move_path()
+            if kwargs.get('update_fields') is None:
+                # product_count is kept up to date with UPDATEs, a stale instance
+                # mustn't write its copy back
+                deferred = self.get_deferred_fields()
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != 'product_count' and field.attname not in deferred
+                ]
+        super().save(*args, **kwargs)
+        if not self.path:
+            # a new category's path ends with its own id
+            self.move_path()
+
+    def move_path(self):
+        old_path = self.path
+        parent_path = self.parent.path if self.parent_id else ''
+        new_path = f'{parent_path}{self.pk}/'
+        if new_path == old_path:
+            return
+
+        new_depth = new_path.count('/') - 1
+        ProductCategory.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+
+        if old_path:
+            # moved: rewrite the paths of the whole subtree in one statement
+            old_depth = old_path.count('/') - 1
+            ProductCategory.objects.filter(**subtree_filter(old_path)).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - old_depth),
+            )
+            # the subtree's products leave the old ancestors and join the new ones
+            moved = ProductCategory.objects.values_list('product_count', flat=True).get(pk=self.pk)
+            totals = Counter()
+            for ancestor in ancestor_ids(old_path) - {self.pk}:
+                totals[ancestor] -= moved
+            for ancestor in ancestor_ids(new_path) - {self.pk}:
+                totals[ancestor] += moved
+            shift_product_counts(totals)
+
+        self.path = new_path
+        self.depth = new_depth
+
+    def subtree_filter(self, prefix=''):
+        return subtree_filter(self.path, prefix)
+
+    def subtree_ids(self):
+        return list(ProductCategory.objects.filter(**self.subtree_filter()).values_list('id', flat=True))
+
+
+def subtree_filter(path, prefix=''):
+    # every descendant path starts with `path`, and '0' is the character right
+    # after '/', so the subtree is the index range [path, path[:-1] + '0')
+    return {f'{prefix}path__gte': path, f'{prefix}path__lt': path[:-1] + '0'}
+
+def ancestor_ids(path):
+    return {int(pk) for pk in path.split('/') if pk}
+
+def add_product_counts(deltas):
+    # deltas: {category_id: change in its active products}. A category's change
+    # counts for all of its ancestors too; full recounts are left to
+    # rebuild_category_tree.
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    totals = Counter()
+    for pk, path in ProductCategory.objects.filter(pk__in=deltas).values_list('id', 'path'):
+        for ancestor in ancestor_ids(path):
+            totals[ancestor] += deltas[pk]
+    shift_product_counts(totals)
+
+def shift_product_counts(totals):
+    # {category_id: amount}, one UPDATE per distinct amount
+    by_amount = defaultdict(list)
+    for pk, amount in totals.items():
+        if amount:
+            by_amount[amount].append(pk)
+    for amount, ids in by_amount.items():
+        ProductCategory.objects.filter(pk__in=ids).update(product_count=F('product_count') + amount)
+
+def rebuild_category_tree():
+    parents = dict(ProductCategory.objects.values_list('id', 'parent_id'))
+
+    paths = {}
+    def build_path(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = f'{build_path(parent_id) if parent_id else ""}{pk}/'
+        return paths[pk]
+
+    direct_counts = dict(
+        Product.objects.filter(is_active=True).values('category').annotate(total=Count('id')).values_list('category', 'total')
+    )
+    counts = dict.fromkeys(parents, 0)
+    for pk, total in direct_counts.items():
+        for ancestor in ancestor_ids(build_path(pk)):
+            counts[ancestor] += total
+
+    categories = []
+    for pk in parents:
+        path = build_path(pk)
+        categories.append(ProductCategory(id=pk, path=path, depth=path.count('/') - 1, product_count=counts[pk]))
+    ProductCategory.objects.bulk_update(categories, ['path', 'depth', 'product_count'], batch_size=500)
+    return len(categories)
+
 class Product(models.Model):
     name = models.CharField(max_length=255, null= False, blank= False)
     slug = models.SlugField(max_length=255, unique=True)
@@ -108,12 +239,33 @@ class Product(models.Model):
     description = models.TextField()
     base_price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # price of one unit right now: base/discount price and the running promotions
+    # (pricing.py). Set on save, refreshed set-based when promotions change or a
+    # time window opens/closes (rebuild_effective_prices), listings sort on it.
+    # No default: bulk_create skips save(), so bulk code has to price its rows
+    # (PricingRules.unit_price) or the insert fails instead of listing them at 0.
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
 
     category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, related_name='products')
 
     featured_products = models.BooleanField(default=False)
     new_arrivals = models.BooleanField(default=False)
 
+    # copy of the first active ProductImages.image (lowest order), kept in sync
+    # from ProductImages saves/deletes so list pages don't need to join images
+    primary_image = models.ImageField(upload_to= 'products/', null=True, blank=True, editable=False)
+
+    # review aggregates, updated incrementally from ProductReview saves/deletes
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # sha256 of the row this product was last imported from (import_catalog),
+    # re-importing an unchanged row skips it
+    import_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     is_active = models.BooleanField(default=True)
 
@@ -126,11 +278,37 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['slug']),
             models.Index(fields=['is_active']),
+            # keyset pagination (pagination.ProductCursorPagination)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['effective_price', 'id']),
+            models.Index(fields=['category', 'created_at', 'id']),
+            models.Index(fields=['category', 'effective_price', 'id']),
         ]
     
     def __str__(self):
         return self.name
 
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
+
+    @property
+    def rating_average(self):
+        if not self.review_count:
+            return None
+        total = sum(rating * count for rating, count in self.rating_histogram.items())
+        return round(total / self.review_count, 2)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what is stored, so a save can tell if the product moved category
+        # (or price bucket)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        instance._loaded_effective_price = instance.__dict__.get('effective_price')
+        return instance
+
 class ProductImages(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to= 'products/', null=True, blank=True)
@@ -144,6 +322,20 @@ class ProductImages(models.Model):
         verbose_name = "Product Image"
         verbose_name_plural = "Product Images"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored product, an image moved to another product changes both
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        return instance
+
+def primary_image_subquery():
+    images = ProductImages.objects.filter(
+        product=OuterRef('pk'),
+        is_active=True,
+    ).exclude(image='').order_by('order', 'id')
+    return Subquery(images.values('image')[:1])
+
 class ProductReview(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -157,6 +349,42 @@ class ProductReview(models.Model):
         verbose_name = "Product Review"
         verbose_name_plural = "Product Review"
         unique_together = ['product', 'user']
+        indexes = [
+            # reviews of a product, keyset paginated newest first
+            models.Index(fields=['product', 'created_at', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the stored rating, to move the product's histogram on an edit
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+def change_review_stats(product_id, rating, delta):
+    Product.objects.filter(pk=product_id).update(**{
+        'review_count': F('review_count') + delta,
+        f'rating_{rating}_count': F(f'rating_{rating}_count') + delta,
+    })
+
+def rebuild_review_stats():
+    stats = {}
+    rows = ProductReview.objects.values('product', 'rating').annotate(total=Count('id')).order_by()
+    for row in rows:
+        stats.setdefault(row['product'], {})[row['rating']] = row['total']
+
+    fields = ['review_count'] + [f'rating_{rating}_count' for rating in range(1, 6)]
+    Product.objects.exclude(review_count=0).update(**dict.fromkeys(fields, 0))
+
+    products = []
+    for product_id, histogram in stats.items():
+        product = Product(pk=product_id, review_count=sum(histogram.values()))
+        for rating in range(1, 6):
+            setattr(product, f'rating_{rating}_count', histogram.get(rating, 0))
+        products.append(product)
+    Product.objects.bulk_update(products, fields, batch_size=500)
+    return len(products)
 
 
 class ProductVariant(models.Model):
@@ -173,6 +401,9 @@ class ProductVariant(models.Model):
     
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+
+    # sha256 of the last imported row, see Product.import_hash
+    import_hash = models.CharField(max_length=64, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -186,6 +417,75 @@ class ProductVariant(models.Model):
             models.Index(fields=['is_active']),
         ]
     
+# Percentage off base_price for a category and its subcategories, or the whole
+# catalog without a category. Optional time window; min_quantity above 1 makes
+# it a quantity tier that only applies to cart lines of that many units.
+# Offers don't stack, a line gets the lowest of its prices (see pricing.py).
+class Promotion(models.Model):
+    name = models.CharField(max_length=255)
+    category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='promotions', help_text="Empty for the whole catalog")
+    percent_off = models.DecimalField(max_digits=5, decimal_places=2,
+                                      validators=[MinValueValidator(0), MaxValueValidator(100)])
+    min_quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)],
+                                               help_text="Units of one cart line needed, e.g. 3 for \"3 or more\"")
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    is_active = models.BooleanField(default=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Promotion"
+        verbose_name_plural = "Promotions"
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # moving a promotion reprices the products of the old category too
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
+    def clean(self):
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': _("Must be after the start.")})
+
+# Precomputed facet values of one category (its own products, not descendants),
+# kept up to date by facets.update_product_facets when products/variants change.
+class CategoryFacet(models.Model):
+    ALL = 'all'
+    IN_STOCK = 'in_stock'
+    PRICE = 'price'
+    ATTRIBUTE_CHOICES = [
+        (ALL, 'All products'),
+        ('color', 'Color'),
+        ('size', 'Size'),
+        ('material', 'Material'),
+        (IN_STOCK, 'In stock'),
+        (PRICE, 'Price from'),
+    ]
+
+    category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, related_name='facets')
+    attribute = models.CharField(max_length=20, choices=ATTRIBUTE_CHOICES)
+    value = models.CharField(max_length=50, blank=True)
+    product_count = models.PositiveIntegerField(default=0)
+    # zlib compressed bitmap of matching product ids: bit n is set when
+    # product offset + n matches (facets.encode_bitmap)
+    offset = models.PositiveIntegerField(default=0)
+    products = models.BinaryField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Category Facet"
+        verbose_name_plural = "Category Facets"
+        unique_together = ['category', 'attribute', 'value']
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -193,6 +493,10 @@ class Cart(models.Model):
     class Meta:
         verbose_name = "Cart"
         verbose_name_plural = "Carts"
+        constraints = [
+            # one cart per user, concurrent first requests can't create two
+            models.UniqueConstraint(fields=['user'], name='unique_cart_per_user'),
+        ]
     
     def __str__(self):
         return f"Cart #{self.id} - {self.user.username}"
@@ -237,10 +541,21 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # order history, keyset paginated per user
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='items')
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='items')
+
+    # snapshot at purchase time, order history never joins the live catalog
+    product_name = models.CharField(max_length=255, blank=True)
+    sku = models.CharField(max_length=100, blank=True)
+    attributes = models.JSONField(default=dict, blank=True)
     
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -248,4 +563,12 @@ class OrderItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @staticmethod
+    def variant_attributes(variant):
+        return {
+            name: getattr(variant, name)
+            for name in ('color', 'size', 'material')
+            if getattr(variant, name)
+        }
+
 # --------------------------- Product Section bar end here ---------------------------
@@ -0,0 +1,223 @@
+import datetime
+import json
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# --------------------------- keyset pagination start here ---------------------------
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, the cursor needs them exact
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorSerializer:
+    # for signing.Signer.sign_object
+    def dumps(self, obj):
+        return json.dumps(obj, cls=CursorEncoder, separators=(',', ':')).encode()
+
+    def loads(self, data):
+        return json.loads(data.decode())
+
+# Pages are fetched with "WHERE (a, id) > (last_a, last_id) ORDER BY a, id LIMIT n",
+# so page 100 costs the same as page 1 as long as (a, id) is indexed. The cursor
+# is the position of the first/last row of the current page, signed (SECRET_KEY)
+# so clients can't hand-craft positions into the WHERE clause. Bad cursors are a 400.
+#
+# Listings over several partitions (the categories of a subtree) can't walk one
+# index in order. partitions=(field, values) restricts the queryset to those
+# values, and every value gets its own index range limited to one page; only
+# those rows are sorted, instead of the whole subtree on every page.
+class KeysetPagination(BasePagination):
+    page_size = 24
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+
+    # public ordering name -> model fields, the last field must be unique
+    orderings = {
+        'newest': ('-created_at', '-id'),
+    }
+    default_ordering = 'newest'
+    # more partitions than this fall back to a single sorted query
+    max_partitions = 100
+
+    invalid_cursor_message = 'Invalid cursor'
+    cursor_salt = 'web_management_app.pagination.cursor'
+
+    def paginate_queryset(self, queryset, request, view=None, partitions=None):
+        queryset = self.page_queryset(queryset, request, partitions)
+        try:
+            results = list(queryset)
+        except (ValidationError, ValueError):
+            # cursor values that don't fit the column type
+            raise ParseError(self.invalid_cursor_message)
+        return self.set_page(results)
+
+    async def apaginate_queryset(self, queryset, request, view=None, partitions=None):
+        # same page, fetched with the async ORM (web_management_app/async_views.py)
+        queryset = self.page_queryset(queryset, request, partitions)
+        try:
+            results = [obj async for obj in queryset]
+        except (ValidationError, ValueError):
+            raise ParseError(self.invalid_cursor_message)
+        return self.set_page(results)
+
+    def page_queryset(self, queryset, request, partitions=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering_name = self.get_ordering_name(request)
+        self.ordering = self.orderings[self.ordering_name]
+
+        self.position, self.reverse = self.decode_cursor(request)
+        ordering = self.reverse_ordering(self.ordering) if self.reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(self.after_position(ordering, self.position))
+            except (ValidationError, ValueError):
+                raise ParseError(self.invalid_cursor_message)
+
+        limit = self.page_size + 1
+        if partitions is not None:
+            field, values = partitions
+            if 1 < len(values) <= self.max_partitions:
+                # WHERE id IN (first page of partition 1) OR id IN (first page of partition 2) ...
+                branch = queryset.values('pk')
+                queryset = queryset.filter(reduce(or_, [
+                    Q(pk__in=branch.filter(**{field: value})[:limit]) for value in values
+                ]))
+            else:
+                queryset = queryset.filter(**{f'{field}__in': values})
+        return queryset[:limit]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering_name(self, request):
+        name = request.query_params.get(self.ordering_query_param)
+        return name if name in self.orderings else self.default_ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # ----- cursor helpers -----
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def after_position(ordering, position):
+        # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        # plus the redundant a >= x, which SQLite needs to start the index scan
+        # at the cursor instead of walking it from the beginning
+        conditions = []
+        for index, field in enumerate(ordering):
+            equal = {
+                name.lstrip('-'): value
+                for name, value in zip(ordering[:index], position[:index])
+            }
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal[f'{field.lstrip("-")}__{lookup}'] = position[index]
+            conditions.append(Q(**equal))
+        first = ordering[0]
+        bound = Q(**{f'{first.lstrip("-")}__{"lte" if first.startswith("-") else "gte"}': position[0]})
+        return bound & reduce(or_, conditions)
+
+    def encode_cursor(self, obj, reverse):
+        position = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        payload = {'o': self.ordering_name, 'p': position}
+        if reverse:
+            payload['r'] = 1
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.sign_cursor(payload))
+
+    @classmethod
+    def sign_cursor(cls, payload):
+        return signing.Signer(salt=cls.cursor_salt).sign_object(payload, serializer=CursorSerializer)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            payload = signing.Signer(salt=self.cursor_salt).unsign_object(cursor, serializer=CursorSerializer)
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+            ordering_name = payload['o']
+        except (signing.BadSignature, ValueError, TypeError, KeyError):
+            raise ParseError(self.invalid_cursor_message)
+
+        # a cursor only makes sense for the ordering it was generated with
+        if ordering_name != self.ordering_name or not isinstance(position, list) \
+                or len(position) != len(self.ordering) \
+                or not all(isinstance(value, (str, int, float)) for value in position):
+            raise ParseError(self.invalid_cursor_message)
+        return position, reverse
+
+
+class ProductCursorPagination(KeysetPagination):
+    orderings = {
+        'newest': ('-created_at', '-id'),
+        'price': ('effective_price', 'id'),
+        '-price': ('-effective_price', '-id'),
+    }
+
+class OrderCursorPagination(KeysetPagination):
+    page_size = 20
+
+class ReviewCursorPagination(KeysetPagination):
+    page_size = 10
+
+# --------------------------- keyset pagination end here ---------------------------
@@ -0,0 +1,139 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Coalesce, Least, Round
+from django.utils import timezone
+
+from .cache import PRICING, get_version
+from .facets import refresh_price_facets
+from .models import Product, ProductCategory, Promotion, ancestor_ids
+from .routers import primary_for_recent
+
+
+# --------------------------- pricing start here ---------------------------
+# What a product costs. A unit's price is the lowest of base_price,
+# discount_price and base_price less the best promotion that applies to it
+# (category subtree or catalog wide, inside its time window, line quantity at
+# least min_quantity). Offers don't stack.
+#
+# The promotion table is compiled once into per-category rule lists and cached
+# under the pricing version, so pricing a cart or a page is plain arithmetic on
+# rows that are already loaded. Cart, checkout and Product.effective_price all
+# go through the same rules, so what a listing shows is what the order charges.
+RULES_CACHE_KEY = 'pricing:rules:{}'
+RULES_CACHE_TIMEOUT = 60 * 60 * 24
+CENT = Decimal('0.01')
+
+
+class PricingRules:
+    def __init__(self, site_wide, by_category):
+        # rules are (min_quantity, percent_off, starts_at, ends_at); categories
+        # with rules of their own already include the site wide ones
+        self.site_wide = site_wide
+        self.by_category = by_category
+
+    def percent_off(self, category_id, quantity, now):
+        best = Decimal('0')
+        for min_quantity, percent_off, starts_at, ends_at in self.by_category.get(category_id, self.site_wide):
+            if quantity >= min_quantity and (starts_at is None or starts_at <= now) \
+                    and (ends_at is None or now < ends_at):
+                best = max(best, percent_off)
+        return best
+
+    def unit_price(self, product, quantity=1, now=None):
+        price = product.base_price
+        if product.discount_price is not None:
+            price = min(price, product.discount_price)
+        percent_off = self.percent_off(product.category_id, quantity, now or timezone.now())
+        if percent_off:
+            promoted = (product.base_price * (100 - percent_off) / 100).quantize(CENT, ROUND_HALF_UP)
+            price = min(price, promoted)
+        return price
+
+
+def compile_rules():
+    now = timezone.now()
+    site_wide = []
+    by_promoted_category = {}
+    promotions = (
+        Promotion.objects.filter(is_active=True).exclude(ends_at__lte=now)
+        .values_list('category_id', 'min_quantity', 'percent_off', 'starts_at', 'ends_at')
+    )
+    for category_id, *rule in promotions:
+        rules = site_wide if category_id is None else by_promoted_category.setdefault(category_id, [])
+        rules.append(tuple(rule))
+
+    # a promotion covers its category's subtree, resolved here once
+    by_category = {}
+    if by_promoted_category:
+        for category_id, path in ProductCategory.objects.values_list('id', 'path'):
+            rules = [rule for ancestor in ancestor_ids(path) for rule in by_promoted_category.get(ancestor, ())]
+            if rules:
+                by_category[category_id] = rules + site_wide
+    return PricingRules(site_wide, by_category)
+
+
+def get_rules():
+    version = get_version(PRICING)
+    key = RULES_CACHE_KEY.format(version)
+    rules = cache.get(key)
+    if rules is None:
+        with primary_for_recent([version]):
+            rules = compile_rules()
+        cache.set(key, rules, RULES_CACHE_TIMEOUT)
+    return rules
+
+
+def price_cart_items(items, rules=None, now=None):
+    # sets unit_price and line_total on every item (variant__product loaded),
+    # returns the subtotal. Quantity tiers go by the line's quantity.
+    rules = rules or get_rules()
+    now = now or timezone.now()
+    subtotal = Decimal('0')
+    for item in items:
+        item.unit_price = rules.unit_price(item.variant.product, item.quantity, now)
+        item.line_total = item.unit_price * item.quantity
+        subtotal += item.line_total
+    return subtotal
+
+
+# ----- Product.effective_price -----
+def effective_price_expression(percent_off):
+    # unit_price() for quantity 1 as SQL
+    base_price = F('base_price')
+    return Least(
+        base_price,
+        Coalesce('discount_price', base_price),
+        Round(base_price * Value((100 - percent_off) / Decimal(100)), 2),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def refresh_effective_prices(products=None, now=None):
+    # One UPDATE per distinct promotion percentage in effect, only rows whose
+    # price actually changes are written, and the price facets of their
+    # categories rebuilt. Returns the number of changed products.
+    products = Product.objects.all() if products is None else products
+    rules = get_rules()
+    now = now or timezone.now()
+
+    categories_by_percent = {}
+    for category_id in rules.by_category:
+        categories_by_percent.setdefault(rules.percent_off(category_id, 1, now), []).append(category_id)
+
+    groups = [(products.filter(category_id__in=ids), percent_off) for percent_off, ids in categories_by_percent.items()]
+    groups.append((products.exclude(category_id__in=list(rules.by_category)), rules.percent_off(None, 1, now)))
+
+    changed, category_ids = 0, set()
+    with transaction.atomic():
+        for group, percent_off in groups:
+            price = effective_price_expression(percent_off)
+            group = group.exclude(effective_price=price)
+            category_ids.update(group.values_list('category_id', flat=True).order_by().distinct())
+            changed += group.update(effective_price=price)
+        refresh_price_facets(category_ids)
+    return changed
+
+# --------------------------- pricing end here ---------------------------
@@ -0,0 +1,135 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# --------------------------- replica routing start here ---------------------------
+# Catalog reads go to the 'replica' database, everything else (carts, orders,
+# users, sessions) and every write to the primary. The replica lags behind, so
+# after a write the same client keeps reading from the primary for a few
+# seconds: within the request through a context variable, and across requests
+# through a short lived cookie (ReplicaPinningMiddleware).
+REPLICA = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+CATALOG_MODELS = {
+    'companylogo',
+    'navoption',
+    'navbuttons',
+    'herosection',
+    'productcategory',
+    'product',
+    'productimages',
+    'productvariant',
+    'productreview',
+    'categoryfacet',
+}
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def pin_primary():
+    _pinned.set(True)
+    _wrote.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def primary_for_recent(versions):
+    # Cache versions (cache.py) are the timestamps of the writes that bumped
+    # them. Anything built under a version newer than REPLICA_PIN_SECONDS (a
+    # cached payload, an ETag'ed response) reads the primary, or a lagging
+    # replica would fill the new version with old rows until the next bump.
+    if not versions or time.time() * 1000 - max(versions) >= settings.REPLICA_PIN_SECONDS * 1000:
+        yield
+        return
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from wherever their parent was read
+            return instance._state.db
+        if model._meta.app_label != 'web_management_app' or model._meta.model_name not in CATALOG_MODELS:
+            return DEFAULT_DB_ALIAS
+        # reads inside a write transaction (checkout) must see the primary
+        if is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        # filling the database cache (CACHE_BACKEND=database) isn't a write the
+        # client has to read back
+        if model._meta.app_label != 'django_cache':
+            pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica is a copy of the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # under ASGI stay async, so async views aren't pushed to a thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.pinning(request) as finish:
+            return finish(self.get_response(request))
+
+    async def __acall__(self, request):
+        with self.pinning(request) as finish:
+            return finish(await self.get_response(request))
+
+    @contextmanager
+    def pinning(self, request):
+        # unsafe requests read from the primary from the start, they usually
+        # validate against what they are about to change
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES
+        pinned_token = _pinned.set(pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            yield self.set_pin_cookie
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+    def set_pin_cookie(self, response):
+        if _wrote.get():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+# --------------------------- replica routing end here ---------------------------
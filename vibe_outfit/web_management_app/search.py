@@ -0,0 +1,116 @@
+import re
+
+from django.db import connection
+
+from .models import Product, ProductCategory, ProductVariant
+
+
+# --------------------------- product search start here ---------------------------
+# Full text search runs on an SQLite FTS5 table (created in migration 0010), one
+# row per active product with rowid = product id. Rows are rewritten from the
+# product tables with INSERT ... SELECT whenever a product, its variants or its
+# category change, so the index never needs a full rebuild to stay in sync.
+SEARCH_TABLE = 'web_management_app_product_search'
+
+# bm25 weight per column: name, short_description, description, category, variants
+RANK_WEIGHTS = (10.0, 4.0, 1.0, 3.0, 2.0)
+
+# SQLite's default limit on host parameters is 999
+BATCH_SIZE = 500
+
+INDEX_SQL = """
+    INSERT INTO {search} (rowid, name, short_description, description, category, variants)
+    SELECT p.id, p.name, p.short_description, p.description, c.name,
+           (SELECT group_concat(v.sku || ' ' || v.material, ' ')
+              FROM {variant} v
+             WHERE v.product_id = p.id AND v.is_active)
+      FROM {product} p
+      JOIN {category} c ON c.id = p.category_id
+     WHERE p.is_active AND {where}
+"""
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _index_sql(where):
+    return INDEX_SQL.format(
+        search=SEARCH_TABLE,
+        product=Product._meta.db_table,
+        variant=ProductVariant._meta.db_table,
+        category=ProductCategory._meta.db_table,
+        where=where,
+    )
+
+
+def remove_products(product_ids):
+    if not search_enabled():
+        return
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch)
+
+
+def index_products(product_ids):
+    # inactive products are removed and not inserted back
+    if not search_enabled():
+        return
+    product_ids = list(product_ids)
+    remove_products(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(_index_sql(f"p.id IN ({placeholders})"), batch)
+
+
+def index_category(category_id):
+    if not search_enabled():
+        return
+    product_ids = Product.objects.filter(category_id=category_id).values_list('id', flat=True)
+    index_products(product_ids)
+
+
+def rebuild_search_index():
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(_index_sql("1"))
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+def build_match_query(query):
+    # user input is never passed to MATCH as is: every word becomes a quoted
+    # phrase, and the last one a prefix so results show up while typing
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_product_ids(query, limit, offset=0):
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    if not search_enabled():
+        products = Product.objects.filter(is_active=True, name__icontains=query).order_by('-created_at', '-id')
+        return list(products.values_list('id', flat=True)[offset:offset + limit])
+
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    sql = (
+        f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+        f"ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+# --------------------------- product search end here ---------------------------
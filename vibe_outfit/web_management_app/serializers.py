@@ -1,3 +1,6 @@
+import os
+
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
 from .models import (
@@ -15,6 +18,40 @@ from .models import (
     Order,
     OrderItem,
 )
+from .pricing import price_cart_items
+from .thumbnails import ready_rendition_names
+
+
+# --------------------------- thumbnails start here ---------------------------
+class RenditionsField(serializers.Field):
+    # {"160w": {"webp": url, "jpeg": url}, "480w": ..., "1080w": ...} for an
+    # image field, only the widths already generated (no query), none wider
+    # than the original. Until the first one is written, or for an original
+    # narrower than all of them: {"original": {"jpeg": url}}.
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request')
+
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        renditions = {
+            f'{width}w': {extension: url(name) for extension, name in names.items()}
+            for width, names in ready_rendition_names(value.name).items()
+        }
+        if not renditions:
+            extension = os.path.splitext(value.name)[1][1:].lower()
+            extension = {'jpg': 'jpeg'}.get(extension, extension)
+            renditions['original'] = {extension: url(value.name)}
+        return renditions
+
+# --------------------------- thumbnails end here ---------------------------
 
 # --------------------------- navigation bar start here ---------------------------
 class CompanyLogoSerializer(serializers.ModelSerializer):
@@ -30,9 +67,11 @@ class NavOptionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'is_active','created_at', 'updated_at']
 
 class NavButtonsSerializer(serializers.ModelSerializer):
+    icon_srcset = RenditionsField(source='icon')
+
     class Meta:
         model = NavButtons
-        fields = ('id','icon', 'url', 'order','is_active','created_at', 'updated_at')
+        fields = ('id','icon', 'icon_srcset', 'url', 'order','is_active','created_at', 'updated_at')
         read_only_fields = ['id', 'is_active','created_at', 'updated_at']
 
 # --------------------------- navigation bar end here ---------------------------
@@ -40,43 +79,61 @@ class NavButtonsSerializer(serializers.ModelSerializer):
 
 # --------------------------- hero section start here ---------------------------
 class HeroSectionSerializer(serializers.ModelSerializer):
+    bg_img_srcset = RenditionsField(source='bg_img')
+
     class Meta:
         model = HeroSection
-        fields = ('id','bg_img', 'catalog_name','heading','sub_heading',
+        fields = ('id','bg_img', 'bg_img_srcset', 'catalog_name','heading','sub_heading',
                   'cta_btn_1', 'cta_btn_1_url','cta_btn_2', 'cta_btn_2_url',
                   'is_active', 'created_at', 'updated_at')
         read_only_fields = ['id', 'is_active','created_at', 'updated_at']
 
 # --------------------------- hero section end here ---------------------------
 class CategorySerializer(serializers.ModelSerializer):
+    image_srcset = RenditionsField(source='image')
+
     class Meta:
         model = ProductCategory
-        fields = "__all__"
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'product_count']
 
 class ChildCategorySerializer(serializers.ModelSerializer):
+    image_srcset = RenditionsField(source='image')
+
     class Meta:
         model = ProductCategory
-        fields = ['id', 'name', 'slug', 'image']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'product_count']
             
 class ParentCategorySerializer(serializers.ModelSerializer):
     children = ChildCategorySerializer(many=True, read_only=True)
+    image_srcset = RenditionsField(source='image')
 
     class Meta:
         model = ProductCategory
-        fields = ['id','name','slug','image','children']
+        fields = ['id','name','slug','image','image_srcset','product_count','children']
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image_srcset = RenditionsField(source='image')
+
     class Meta:
         model = ProductImages
-        fields = ['id', 'image', 'order']
+        fields = ['id', 'image', 'image_srcset', 'order']
 
 class ProductVariantSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductVariant
         fields = ['id','sku','color','size','material','stock']
 
+class ProductReviewSerializer(serializers.ModelSerializer):
+    user = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = ProductReview
+        fields = ['id', 'user', 'rating', 'comment', 'created_at']
+
 class ProductListSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    image_srcset = RenditionsField(source='primary_image')
+    rating_average = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Product
@@ -86,17 +143,23 @@ class ProductListSerializer(serializers.ModelSerializer):
             'slug',
             'base_price',
             'discount_price',
+            'effective_price',
             'image',
+            'image_srcset',
             'featured_products',
             'new_arrivals',
+            'review_count',
+            'rating_average',
         ]
     def get_image(self, obj):
-        image = obj.images.filter(is_active=True).first()
-        return image.image.url if image else None
+        # primary_image is maintained from ProductImages, so no extra query here
+        return obj.primary_image.url if obj.primary_image else None
     
 class ProductDetailsSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
+    rating_average = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
     class Meta:
         model = Product
@@ -108,6 +171,10 @@ class ProductDetailsSerializer(serializers.ModelSerializer):
             'description',
             'base_price',
             'discount_price',
+            'effective_price',
+            'review_count',
+            'rating_average',
+            'rating_histogram',
             'images',
             'variants'
         ]
@@ -115,11 +182,12 @@ class ProductDetailsSerializer(serializers.ModelSerializer):
 class CartItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='variant.product.name', read_only=True)
     price = serializers.DecimalField(
-        source='variant.product.base_price',
+        source='unit_price',
         max_digits=10,
         decimal_places=2,
         read_only=True
     )
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = CartItem
@@ -128,26 +196,47 @@ class CartItemSerializer(serializers.ModelSerializer):
             'product_name',
             'variant',
             'quantity',
-            'price'
+            'price',
+            'line_total'
         ]
 
+    def to_representation(self, instance):
+        # get_cart_data prices the whole cart at once, single items are priced here
+        if not hasattr(instance, 'unit_price'):
+            price_cart_items([instance])
+        return super().to_representation(instance)
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    variant_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=200)
+
+class CartSerializer(serializers.Serializer):
+    items = CartItemSerializer(many=True, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name', read_only=True)
-    variant_sku = serializers.CharField(source='product_variant.sku', read_only=True)
+    # snapshot columns, no joins into product/product_variant
+    variant_sku = serializers.CharField(source='sku', read_only=True)
 
     class Meta:
         model = OrderItem
         fields = [
             'product_name',
             'variant_sku',
+            'attributes',
             'quantity',
             'price'
         ]
 
 
 class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(source='iteams', many=True, read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
@@ -0,0 +1,332 @@
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, PositiveIntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Least, Round
+
+from .cache import CATALOG, STOCK, bump_version
+from .facets import refresh_category_facets, update_product_facets
+from .models import (
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    ProductVariant,
+    add_product_counts,
+    subtree_filter,
+)
+from .pricing import price_cart_items, refresh_effective_prices
+from .search import index_category
+
+
+# --------------------------- checkout start here ---------------------------
+class EmptyCartError(Exception):
+    pass
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, shortages):
+        super().__init__('Insufficient stock')
+        self.shortages = shortages
+
+
+def reserve_stock(quantities):
+    # One conditional UPDATE for all lines:
+    #   UPDATE variant SET stock = stock - CASE id WHEN .. END
+    #   WHERE id IN (..) AND is_active AND stock >= CASE id WHEN .. END
+    # The check and the decrement happen in the same statement, so concurrent
+    # checkouts can't both pass the check on the last unit. Returns False when
+    # some line couldn't be reserved; the caller must roll back.
+    requested = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+    reserved = ProductVariant.objects.filter(
+        pk__in=quantities.keys(),
+        is_active=True,
+        stock__gte=requested,
+    ).update(stock=F('stock') - requested)
+    return reserved == len(quantities)
+
+
+def get_shortages(quantities):
+    variants = ProductVariant.objects.filter(pk__in=quantities.keys()).values('id', 'sku', 'stock', 'is_active')
+    available = {variant['id']: variant for variant in variants}
+
+    shortages = []
+    for pk, quantity in quantities.items():
+        variant = available.get(pk)
+        in_stock = variant['stock'] if variant and variant['is_active'] else 0
+        if in_stock < quantity:
+            shortages.append({
+                'variant_id': pk,
+                'sku': variant['sku'] if variant else None,
+                'requested': quantity,
+                'available': in_stock,
+            })
+    return shortages
+
+
+class _ReservationFailed(Exception):
+    pass
+
+
+def place_order(user, payment_method):
+    # Whole checkout in one transaction: read the cart, reserve stock for every
+    # line, insert the order with its final total, bulk insert the items and
+    # clear exactly the lines that were priced. A failure anywhere leaves no
+    # half built order and no reserved stock behind.
+    try:
+        with transaction.atomic():
+            items = list(CartItem.objects.filter(cart__user=user).select_related('variant__product'))
+            if not items:
+                raise EmptyCartError
+
+            quantities = {}
+            for item in items:
+                quantities[item.variant_id] = quantities.get(item.variant_id, 0) + item.quantity
+            if not reserve_stock(quantities):
+                raise _ReservationFailed
+
+            # the same engine and rules as the cart, so the total matches it
+            total = price_cart_items(items)
+
+            order = Order.objects.create(
+                user=user,
+                total_amount=total,
+                payment_method=payment_method,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=item.variant.product,
+                    product_variant=item.variant,
+                    product_name=item.variant.product.name,
+                    sku=item.variant.sku,
+                    attributes=OrderItem.variant_attributes(item.variant),
+                    quantity=item.quantity,
+                    price=item.unit_price,
+                )
+                for item in items
+            ])
+
+            CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+            # cache versions and facets are kept out of the checkout transaction;
+            # a failure there (a locked database cache table) is logged and never
+            # fails an order that committed
+            transaction.on_commit(lambda: bump_version(STOCK), robust=True)
+            transaction.on_commit(lambda: refresh_sold_out(quantities.keys()), robust=True)
+    except _ReservationFailed:
+        # the reservation was rolled back, report against committed stock
+        raise InsufficientStockError(get_shortages(quantities))
+
+    return order
+
+
+def refresh_sold_out(variant_ids):
+    # variants that just sold out can take their product out of the in_stock facet
+    sold_out = dict(
+        ProductVariant.objects.filter(pk__in=variant_ids, stock=0).values_list('product_id', 'product__category_id')
+    )
+    if sold_out:
+        update_product_facets(sold_out.keys(), sold_out.values())
+        bump_version(CATALOG)
+
+# --------------------------- checkout end here ---------------------------
+
+# --------------------------- cart batch start here ---------------------------
+class UnknownVariantError(Exception):
+    def __init__(self, variant_ids):
+        super().__init__('Unknown variants')
+        self.variant_ids = variant_ids
+
+
+def apply_cart_operations(user, operations):
+    # Folds a list of add/set/remove operations into final quantities in
+    # memory, then writes them with one DELETE and one INSERT .. ON CONFLICT
+    # DO UPDATE, all in one transaction. The query count doesn't depend on the
+    # number of operations.
+    variant_ids = {operation['variant_id'] for operation in operations}
+    added_ids = {operation['variant_id'] for operation in operations if operation['op'] != 'remove'}
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+
+        found = set(ProductVariant.objects.filter(pk__in=added_ids, is_active=True).values_list('id', flat=True))
+        if added_ids - found:
+            raise UnknownVariantError(sorted(added_ids - found))
+
+        quantities = dict(
+            CartItem.objects.filter(cart=cart, variant_id__in=variant_ids).values_list('variant_id', 'quantity')
+        )
+        for operation in operations:
+            variant_id = operation['variant_id']
+            if operation['op'] == 'add':
+                quantities[variant_id] = quantities.get(variant_id, 0) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[variant_id] = operation['quantity']
+            else:
+                quantities[variant_id] = 0
+
+        removed = [variant_id for variant_id, quantity in quantities.items() if quantity <= 0]
+        if removed:
+            CartItem.objects.filter(cart=cart, variant_id__in=removed).delete()
+
+        kept = [
+            CartItem(cart=cart, variant_id=variant_id, quantity=quantity)
+            for variant_id, quantity in quantities.items() if quantity > 0
+        ]
+        if kept:
+            CartItem.objects.bulk_create(
+                kept,
+                update_conflicts=True,
+                unique_fields=['cart', 'variant'],
+                update_fields=['quantity'],
+            )
+    return cart
+
+# --------------------------- cart batch end here ---------------------------
+
+# --------------------------- bulk catalog changes start here ---------------------------
+# Admin bulk actions. Every change is one UPDATE (per batch of SKUs for stock)
+# whatever the number of rows, in one transaction, and the derived data
+# (category counts, facets, search index) and cache versions are refreshed once
+# afterwards. With dry_run=True nothing is written and the returned counts say
+# how many rows would change.
+PRICE_PERCENT = 'percent'
+PRICE_AMOUNT = 'amount'
+STOCK_SET = 'set'
+STOCK_ADD = 'add'
+
+# SQLite's default limit on host parameters is 999, two per CASE branch
+STOCK_BATCH_SIZE = 400
+
+# the largest price that fits DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('99999999.99')
+
+
+def _products(products):
+    # admin querysets may be distinct or ordered, which UPDATE doesn't take
+    return Product.objects.filter(pk__in=products.values('pk'))
+
+
+def change_prices(products, mode, value, dry_run=False):
+    # percent: +10 raises prices by 10 %, -10 lowers them; amount: added to the
+    # price. Discount prices move the same way, prices stay between zero and
+    # MAX_PRICE.
+    products = _products(products)
+    count = products.count()
+    if dry_run or not count:
+        return {'products': count}
+
+    def changed(field):
+        if mode == PRICE_PERCENT:
+            price = Round(F(field) * Value(1 + value / Decimal(100)), 2)
+        else:
+            price = F(field) + Value(value)
+        # NULL discounts stay NULL
+        output_field = DecimalField(max_digits=10, decimal_places=2)
+        price = Greatest(price, Value(Decimal('0')), output_field=output_field)
+        return Least(price, Value(MAX_PRICE), output_field=output_field)
+
+    with transaction.atomic():
+        products.update(base_price=changed('base_price'), discount_price=changed('discount_price'))
+        refresh_effective_prices(products)
+        transaction.on_commit(lambda: bump_version(CATALOG))
+    return {'products': count}
+
+
+def set_discount(products, percent, dry_run=False):
+    # discount_price = base_price less `percent` %, 0 removes the discount
+    products = _products(products)
+    count = products.count()
+    if dry_run or not count:
+        return {'products': count}
+
+    if percent:
+        discount_price = Round(F('base_price') * Value((100 - percent) / Decimal(100)), 2)
+    else:
+        discount_price = None
+    with transaction.atomic():
+        products.update(discount_price=discount_price)
+        refresh_effective_prices(products)
+        transaction.on_commit(lambda: bump_version(CATALOG))
+    return {'products': count}
+
+
+def set_products_active(products, is_active, dry_run=False):
+    products = _products(products).exclude(is_active=is_active)
+    # {category_id: products changing}, the counts move by exactly that
+    changing = dict(products.values_list('category_id').annotate(total=Count('id')).order_by())
+    count = sum(changing.values())
+    if dry_run or not count:
+        return {'products': count}
+
+    category_ids = list(changing)
+    with transaction.atomic():
+        products.update(is_active=is_active)
+        add_product_counts({pk: total if is_active else -total for pk, total in changing.items()})
+        refresh_category_facets(category_ids)
+        for category_id in category_ids:
+            index_category(category_id)
+        transaction.on_commit(lambda: bump_version(CATALOG))
+    return {'products': count}
+
+
+def set_category_tree_active(categories, is_active, dry_run=False):
+    # the categories, all of their descendants and every product in them
+    paths = list(categories.values_list('path', flat=True))
+    if not paths:
+        return {'categories': 0, 'products': 0}
+    subtree = reduce(or_, [Q(**subtree_filter(path)) for path in paths])
+    in_subtree = reduce(or_, [Q(**subtree_filter(path, 'category__')) for path in paths])
+
+    changed_categories = ProductCategory.objects.filter(subtree).exclude(is_active=is_active)
+    with transaction.atomic():
+        counts = set_products_active(Product.objects.filter(in_subtree), is_active, dry_run)
+        counts['categories'] = changed_categories.count()
+        if not dry_run and counts['categories']:
+            changed_categories.update(is_active=is_active)
+            transaction.on_commit(lambda: bump_version(CATALOG))
+    return counts
+
+
+def set_stock(stock_by_sku, mode=STOCK_SET, dry_run=False):
+    # stock_by_sku: {sku: quantity}. set replaces the stock, add adds the
+    # (possibly negative) quantity without going below zero. Returns how many
+    # variants matched and the SKUs that don't exist.
+    skus = list(stock_by_sku)
+    found = set()
+    for start in range(0, len(skus), STOCK_BATCH_SIZE):
+        found.update(ProductVariant.objects.filter(sku__in=skus[start:start + STOCK_BATCH_SIZE]).values_list('sku', flat=True))
+    counts = {'variants': len(found), 'unknown_skus': sorted(set(skus) - found)}
+    if dry_run or not found:
+        return counts
+
+    skus = sorted(found)
+    with transaction.atomic():
+        for start in range(0, len(skus), STOCK_BATCH_SIZE):
+            batch = skus[start:start + STOCK_BATCH_SIZE]
+            quantity = Case(
+                *[When(sku=sku, then=Value(stock_by_sku[sku])) for sku in batch],
+                output_field=IntegerField(),
+            )
+            stock = quantity if mode == STOCK_SET else Greatest(F('stock') + quantity, Value(0))
+            ProductVariant.objects.filter(sku__in=batch).update(stock=stock)
+
+        # in_stock facets of the touched categories
+        category_ids = set()
+        for start in range(0, len(skus), STOCK_BATCH_SIZE):
+            category_ids.update(
+                ProductVariant.objects.filter(sku__in=skus[start:start + STOCK_BATCH_SIZE])
+                .values_list('product__category_id', flat=True).distinct().order_by()
+            )
+        refresh_category_facets(category_ids)
+        transaction.on_commit(lambda: (bump_version(STOCK), bump_version(CATALOG)))
+    return counts
+
+# --------------------------- bulk catalog changes end here ---------------------------
@@ -0,0 +1,308 @@
+import time
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.signals import request_finished
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+from .cache import NAVIGATION, HERO, CATALOG, PRICING, bump_version
+from .pricing import get_rules, refresh_effective_prices
+from .search import index_category, index_products, remove_products
+from .facets import price_bucket, update_product_facets
+from .thumbnails import schedule_renditions
+from .models import (
+    CompanyLogo,
+    NavOption,
+    NavButtons,
+    HeroSection,
+    ProductCategory,
+    Product,
+    ProductImages,
+    ProductVariant,
+    ProductReview,
+    Promotion,
+    primary_image_subquery,
+    add_product_counts,
+    ancestor_ids,
+    shift_product_counts,
+    subtree_filter,
+    change_review_stats,
+)
+
+
+# --------------------------- cache invalidation start here ---------------------------
+@receiver([post_save, post_delete], sender=CompanyLogo)
+@receiver([post_save, post_delete], sender=NavOption)
+@receiver([post_save, post_delete], sender=NavButtons)
+def bump_navigation_version(sender, **kwargs):
+    bump_version(NAVIGATION)
+
+
+@receiver([post_save, post_delete], sender=HeroSection)
+def bump_hero_version(sender, **kwargs):
+    bump_version(HERO)
+
+
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImages)
+@receiver([post_save, post_delete], sender=ProductVariant)
+def bump_catalog_version(sender, **kwargs):
+    bump_version(CATALOG)
+
+# --------------------------- cache invalidation end here ---------------------------
+
+# --------------------------- product primary image start here ---------------------------
+@receiver([post_save, post_delete], sender=ProductImages)
+def refresh_primary_image(sender, instance, **kwargs):
+    # the product it belongs to and, when it was moved, the one it left
+    product_ids = {instance.product_id, getattr(instance, '_loaded_product_id', None)} - {None}
+    Product.objects.filter(pk__in=product_ids).update(primary_image=primary_image_subquery())
+    instance._loaded_product_id = instance.product_id
+
+# --------------------------- product primary image end here ---------------------------
+
+# --------------------------- category counts & facets start here ---------------------------
+def deleted_with(origin, *models):
+    # the delete was started on one of these models, an instance or a queryset
+    return isinstance(origin, models) or getattr(origin, 'model', None) in models
+
+
+def refresh_facets_after_delete(origin, product_id, category_id):
+    # A delete sends post_delete once per row. Collect the products on the
+    # object the delete started from and update each category once, after the
+    # whole delete has committed.
+    if origin is None:
+        update_product_facets([product_id], [category_id])
+        return
+    pending = getattr(origin, '_facet_products', None)
+    if pending is None:
+        pending = origin._facet_products = {}
+        transaction.on_commit(lambda: update_product_facets(pending.keys(), pending.values()))
+    pending[product_id] = category_id
+
+
+@receiver(post_save, sender=Product)
+def refresh_counts_on_product_save(sender, instance, created, **kwargs):
+    # where the product counted before this save; products saved without being
+    # loaded (or with the fields deferred) are taken as unchanged
+    old_category_id = getattr(instance, '_loaded_category_id', None) or instance.category_id
+    old_is_active = getattr(instance, '_loaded_is_active', None)
+    if old_is_active is None:
+        old_is_active = instance.is_active
+    if created or old_category_id != instance.category_id or old_is_active != instance.is_active:
+        deltas = Counter()
+        if old_is_active and not created:
+            deltas[old_category_id] -= 1
+        if instance.is_active:
+            deltas[instance.category_id] += 1
+        add_product_counts(deltas)
+        update_product_facets([instance.pk], [instance.category_id, old_category_id])
+    else:
+        # the price facets hold buckets, a price not loaded may have changed its bucket
+        old_price = getattr(instance, '_loaded_effective_price', None)
+        if old_price is None or price_bucket(old_price) != price_bucket(instance.effective_price):
+            update_product_facets([instance.pk], [instance.category_id])
+
+    instance._loaded_category_id = instance.category_id
+    instance._loaded_is_active = instance.is_active
+    instance._loaded_effective_price = instance.effective_price
+
+
+@receiver(post_delete, sender=Product)
+def refresh_counts_on_product_delete(sender, instance, origin=None, **kwargs):
+    # products deleted along with their category take its counts and facets
+    # with them, see refresh_counts_on_category_delete
+    if deleted_with(origin, ProductCategory):
+        return
+    if instance.is_active:
+        add_product_counts({instance.category_id: -1})
+    refresh_facets_after_delete(origin, instance.pk, instance.category_id)
+
+
+@receiver(pre_delete, sender=ProductCategory)
+def remember_deleted_count(sender, instance, **kwargs):
+    # the stored path and count, the instance may be stale
+    instance._deleted_path, instance._deleted_count = (
+        ProductCategory.objects.values_list('path', 'product_count').get(pk=instance.pk)
+    )
+
+
+@receiver(post_delete, sender=ProductCategory)
+def refresh_counts_on_category_delete(sender, instance, **kwargs):
+    # The whole subtree is gone by now. Only the topmost deleted category takes
+    # its products off its ancestors, a deleted child's products are already
+    # part of its deleted parent's count.
+    if instance.parent_id and ProductCategory.objects.filter(pk=instance.parent_id).exists():
+        ancestors = ancestor_ids(instance._deleted_path) - {instance.pk}
+        shift_product_counts(dict.fromkeys(ancestors, -instance._deleted_count))
+
+# --------------------------- category counts & facets end here ---------------------------
+
+# --------------------------- search index start here ---------------------------
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def index_variant_product(sender, instance, **kwargs):
+    index_products([instance.product_id])
+
+
+@receiver(post_save, sender=ProductCategory)
+def index_category_products(sender, instance, created, **kwargs):
+    if not created and getattr(instance, '_loaded_name', None) != instance.name:
+        index_category(instance.pk)
+    instance._loaded_name = instance.name
+
+# --------------------------- search index end here ---------------------------
+
+# --------------------------- variant facets start here ---------------------------
+@receiver(post_save, sender=ProductVariant)
+def refresh_variant_facets(sender, instance, **kwargs):
+    category_ids = Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True)
+    update_product_facets([instance.product_id], category_ids)
+
+
+@receiver(post_delete, sender=ProductVariant)
+def refresh_facets_on_variant_delete(sender, instance, origin=None, **kwargs):
+    # with their product or category, the product's own delete covers the facets
+    if deleted_with(origin, Product, ProductCategory):
+        return
+    for category_id in Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True):
+        refresh_facets_after_delete(origin, instance.product_id, category_id)
+
+# --------------------------- variant facets end here ---------------------------
+
+# --------------------------- pricing start here ---------------------------
+@receiver(pre_save, sender=Product)
+def set_effective_price(sender, instance, **kwargs):
+    instance.effective_price = get_rules().unit_price(instance)
+
+
+@receiver([post_save, post_delete], sender=Promotion)
+def reprice_promotion(sender, instance, **kwargs):
+    bump_version(PRICING)
+    category_ids = {instance.category_id, getattr(instance, '_loaded_category_id', instance.category_id)}
+    if None in category_ids:
+        products = Product.objects.all()
+    else:
+        paths = ProductCategory.objects.filter(pk__in=category_ids).values_list('path', flat=True)
+        products = Product.objects.filter(reduce(or_, [Q(**subtree_filter(path, 'category__')) for path in paths]))
+    if refresh_effective_prices(products):
+        bump_version(CATALOG)
+    instance._loaded_category_id = instance.category_id
+
+
+# rules are compiled against the category tree, a moved category takes or
+# leaves its ancestors' promotions
+@receiver(post_save, sender=ProductCategory)
+def reprice_category(sender, instance, created, **kwargs):
+    # renames and reorders don't touch the rules, a category that wasn't loaded
+    # from the database may have moved
+    moved = getattr(instance, '_loaded_parent_id', instance) != instance.parent_id
+    if created or moved:
+        bump_version(PRICING)
+    if not created and moved:
+        refresh_effective_prices(Product.objects.filter(**instance.subtree_filter('category__')))
+    instance._loaded_parent_id = instance.parent_id
+
+
+@receiver(post_delete, sender=ProductCategory)
+def forget_category_rules(sender, instance, **kwargs):
+    bump_version(PRICING)
+
+# --------------------------- pricing end here ---------------------------
+
+# --------------------------- review stats start here ---------------------------
+@receiver(pre_save, sender=ProductReview)
+def check_review(sender, instance, **kwargs):
+    # save() doesn't run the field validators, and the rating picks the histogram column
+    if instance.rating not in range(1, 6):
+        raise ValidationError({'rating': _('Rating must be between 1 and 5.')})
+    if instance.pk is not None and getattr(instance, '_loaded_rating', None) is None:
+        # not loaded from the database (or the rating deferred): what is stored,
+        # no row means the save creates it
+        stored = ProductReview.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        instance._loaded_product_id, instance._loaded_rating = stored or (None, None)
+
+
+@receiver(post_save, sender=ProductReview)
+def count_review(sender, instance, created, **kwargs):
+    old_product_id = getattr(instance, '_loaded_product_id', None)
+    old_rating = getattr(instance, '_loaded_rating', None)
+    counted = not created and old_rating is not None
+
+    if not counted or (old_product_id, old_rating) != (instance.product_id, instance.rating):
+        if counted:
+            change_review_stats(old_product_id, old_rating, -1)
+        change_review_stats(instance.product_id, instance.rating, +1)
+        bump_version(CATALOG)
+
+    instance._loaded_product_id = instance.product_id
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=ProductReview)
+def uncount_review(sender, instance, **kwargs):
+    # what was counted, the instance may have unsaved edits
+    product_id = getattr(instance, '_loaded_product_id', None) or instance.product_id
+    rating = getattr(instance, '_loaded_rating', None) or instance.rating
+    change_review_stats(product_id, rating, -1)
+    bump_version(CATALOG)
+
+# --------------------------- review stats end here ---------------------------
+
+# --------------------------- thumbnails start here ---------------------------
+# Product.primary_image is a copy of a ProductImages.image, so it is covered here
+@receiver(post_save, sender=ProductImages)
+@receiver(post_save, sender=ProductCategory)
+def generate_image_renditions(sender, instance, **kwargs):
+    schedule_renditions(instance.image.name)
+
+
+@receiver(post_save, sender=HeroSection)
+def generate_hero_renditions(sender, instance, **kwargs):
+    schedule_renditions(instance.bg_img.name)
+
+
+@receiver(post_save, sender=NavButtons)
+def generate_icon_renditions(sender, instance, **kwargs):
+    schedule_renditions(instance.icon.name)
+
+# --------------------------- thumbnails end here ---------------------------
+
+# --------------------------- sqlite maintenance start here ---------------------------
+# Persistent connections never close, so SQLite's advice of running
+# PRAGMA optimize before closing becomes "run it every now and then".
+@receiver(request_finished)
+def optimize_sqlite(sender, **kwargs):
+    interval = settings.SQLITE_OPTIMIZE_INTERVAL
+    if interval is None:
+        return
+    now = time.monotonic()
+    for connection in connections.all(initialized_only=True):
+        if connection.vendor != 'sqlite' or connection.connection is None:
+            continue
+        last_run = getattr(connection, 'last_optimize', None)
+        if last_run is None:
+            connection.last_optimize = now
+        elif now - last_run >= interval:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA optimize')
+            connection.last_optimize = now
+
+# --------------------------- sqlite maintenance end here ---------------------------
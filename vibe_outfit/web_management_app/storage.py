@@ -0,0 +1,44 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+
+# --------------------------- hashed media start here ---------------------------
+# Uploads are stored as <upload_to>/<first 2 hex>/<sha256>.<ext>, so a URL always
+# points to the same bytes and can be cached forever. Uploading identical bytes
+# again returns the existing name instead of writing a second copy, which also
+# means a file can be shared by several rows and must never be deleted with one.
+HASH_LENGTH = 64
+HASH_SEGMENT = re.compile(rf'(?:^|/)([0-9a-f]{{{HASH_LENGTH}}})(?:[./]|$)')
+
+
+def file_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_path(name):
+    # the sha256 of the file (or of the original, for renditions), None for
+    # files stored before hashing was enabled
+    match = HASH_SEGMENT.search(name)
+    return match.group(1) if match else None
+
+
+class HashedMediaStorage(FileSystemStorage):
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = file_hash(content)
+        name = os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+        if self.exists(name):
+            # same bytes already stored
+            return name
+        return super()._save(name, content)
+
+# --------------------------- hashed media end here ---------------------------
@@ -1,3 +1,1241 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, close_old_connections, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from .models import (
+    Cart,
+    CartItem,
+    NavButtons,
+    NavOption,
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    ProductImages,
+    ProductReview,
+    CategoryFacet,
+    ProductVariant,
+    Promotion,
+)
+from .cache import CATALOG, HERO, bump_version
+from .facets import get_facet_counts, update_product_facets
+from .middleware import QueryTimingMiddleware, RequestTiming, record_queries
+from .pagination import ProductCursorPagination
+from .pricing import get_rules
+from .routers import (
+    PIN_COOKIE,
+    REPLICA,
+    PrimaryReplicaRouter,
+    ReplicaPinningMiddleware,
+    _pinned,
+    is_pinned,
+    pin_primary,
+    primary_for_recent,
+)
+from .serializers import RenditionsField
+from .admin import PriceChangeForm
+from .services import (
+    MAX_PRICE,
+    PRICE_AMOUNT,
+    PRICE_PERCENT,
+    STOCK_ADD,
+    InsufficientStockError,
+    change_prices,
+    place_order,
+    set_category_tree_active,
+    set_products_active,
+    set_stock,
+)
+from .thumbnails import generate_renditions
+from .views import serve_media
+
+
+def create_variant(sku='SKU-1', stock=10, price=10):
+    category, _ = ProductCategory.objects.get_or_create(name='Men', slug='men')
+    product = Product.objects.create(
+        name=f'Product {sku}',
+        slug=sku.lower(),
+        short_description='short',
+        description='description',
+        base_price=price,
+        category=category,
+    )
+    return ProductVariant.objects.create(product=product, sku=sku, stock=stock)
+
+
+def fill_cart(user, *lines):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    for variant, quantity in lines:
+        CartItem.objects.create(cart=cart, variant=variant, quantity=quantity)
+    return cart
+
+
+# --------------------------- checkout start here ---------------------------
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='buyer')
+
+    def test_order_decrements_stock(self):
+        shirt = create_variant('SHIRT', stock=5)
+        jeans = create_variant('JEANS', stock=2)
+        fill_cart(self.user, (shirt, 3), (jeans, 2))
+
+        place_order(self.user, payment_method='cash_on_delivery')
+
+        shirt.refresh_from_db()
+        jeans.refresh_from_db()
+        self.assertEqual((shirt.stock, jeans.stock), (2, 0))
+
+    def test_shortage_rolls_back_every_line(self):
+        shirt = create_variant('SHIRT', stock=5)
+        jeans = create_variant('JEANS', stock=1)
+        fill_cart(self.user, (shirt, 3), (jeans, 2))
+
+        with self.assertRaises(InsufficientStockError) as raised:
+            place_order(self.user, payment_method='cash_on_delivery')
+
+        self.assertEqual(raised.exception.shortages, [
+            {'variant_id': jeans.pk, 'sku': 'JEANS', 'requested': 2, 'available': 1},
+        ])
+        shirt.refresh_from_db()
+        self.assertEqual(shirt.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 12
+    stock = 5
+
+    def test_hot_variant_never_oversells(self):
+        variant = create_variant('HOT', stock=self.stock)
+        users = [User.objects.create(username=f'buyer-{i}') for i in range(self.buyers)]
+        for user in users:
+            fill_cart(user, (variant, 1))
+
+        start = threading.Barrier(self.buyers)
+        results = []
+
+        def checkout(user):
+            start.wait()
+            try:
+                # sqlite reports lock contention instead of waiting, retry like a client would
+                for _ in range(200):
+                    try:
+                        place_order(user, payment_method='cash_on_delivery')
+                        results.append('ordered')
+                        return
+                    except OperationalError:
+                        time.sleep(random.uniform(0.001, 0.01))
+                    except InsufficientStockError:
+                        results.append('sold out')
+                        return
+                results.append('gave up')
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        variant.refresh_from_db()
+        sold = OrderItem.objects.filter(product_variant=variant).count()
+        self.assertGreaterEqual(variant.stock, 0)
+        self.assertEqual(sold, results.count('ordered'))
+        self.assertEqual(variant.stock + sold, self.stock)
+        self.assertEqual(sold, min(self.stock, self.buyers - results.count('gave up')))
+
+# --------------------------- checkout end here ---------------------------
+
+
+# --------------------------- cart batch start here ---------------------------
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='buyer')
+        self.client.force_login(self.user)
+        self.shirt, self.jeans, self.socks = (create_variant(sku) for sku in ('SHIRT', 'JEANS', 'SOCKS'))
+        fill_cart(self.user, (self.shirt, 2), (self.jeans, 1))
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/batch/', {'operations': [
+            {'op': op, 'variant_id': variant.pk, 'quantity': quantity} for op, variant, quantity in operations
+        ]}, content_type='application/json')
+
+    def cart(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('variant__sku', 'quantity'))
+
+    def test_operations_fold_into_final_quantities(self):
+        response = self.batch(
+            ('add', self.shirt, 1), ('set', self.jeans, 0), ('add', self.socks, 2), ('add', self.socks, 1),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {'SHIRT': 3, 'SOCKS': 3})
+        self.assertEqual(Decimal(response.json()['subtotal']), 60)
+        self.assertEqual(
+            {item['variant']: item['quantity'] for item in response.json()['items']},
+            {self.shirt.pk: 3, self.socks.pk: 3},
+        )
+
+    def test_unknown_variant_changes_nothing(self):
+        self.socks.is_active = False
+        self.socks.save()
+
+        response = self.batch(('remove', self.shirt, 1), ('add', self.socks, 1))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['variant_ids'], [self.socks.pk])
+        self.assertEqual(self.cart(), {'SHIRT': 2, 'JEANS': 1})
+
+# --------------------------- cart batch end here ---------------------------
+
+
+# --------------------------- keyset pagination start here ---------------------------
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        men = ProductCategory.objects.create(name='Men', slug='men')
+        shirts = ProductCategory.objects.create(name='Shirts', slug='shirts', parent=men)
+        jeans = ProductCategory.objects.create(name='Jeans', slug='jeans', parent=men)
+        categories = [men, shirts, jeans]
+        for i in range(11):
+            Product.objects.create(
+                name=f'Product {i}', slug=f'p{i}', short_description='', description='',
+                base_price=10 + i % 3, category=categories[i % 3], featured_products=True,
+            )
+        # ties on the sort key, the id decides
+        Product.objects.filter(slug__in=['p2', 'p3', 'p4', 'p5']).update(created_at=timezone.now())
+
+    def walk(self, url):
+        pages, previous = [], None
+        while url:
+            data = self.client.get(url).json()
+            pages.append([row['slug'] for row in data['results']])
+            url, previous = data['next'], data['previous']
+        # and back again from the last page
+        back = []
+        while previous:
+            data = self.client.get(previous).json()
+            back.insert(0, [row['slug'] for row in data['results']])
+            previous = data['previous']
+        self.assertEqual(back, pages[:-1])
+        return pages
+
+    def expected(self, *ordering):
+        return list(Product.objects.order_by(*ordering).values_list('slug', flat=True))
+
+    def test_next_and_previous_pages(self):
+        pages = self.walk('/api/products/featured/?page_size=3')
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), self.expected('-created_at', '-id'))
+
+    def test_category_subtree_ordered_by_price(self):
+        for url in ('/api/categories/men/products/?page_size=4&ordering=price',
+                    '/api/async/categories/men/products/?page_size=4&ordering=price'):
+            with self.subTest(url=url):
+                pages = self.walk(url)
+                self.assertEqual(sum(pages, []), self.expected('effective_price', 'id'))
+
+        pages = self.walk('/api/categories/men/products/?page_size=4&ordering=-price')
+        self.assertEqual(sum(pages, []), self.expected('-effective_price', '-id'))
+
+    def test_inactive_category(self):
+        ProductCategory.objects.filter(slug='shirts').update(is_active=False)
+        for url in ('/api/categories/shirts/products/', '/api/async/categories/shirts/products/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+        for url in ('/api/categories/', '/api/async/categories/'):
+            with self.subTest(url=url):
+                self.assertEqual(list(self.client.get(url).json()[0]), [
+                    'id', 'name', 'slug', 'image', 'image_srcset', 'product_count',
+                ])
+
+    def test_tampered_cursor(self):
+        first = self.client.get('/api/products/featured/?page_size=3').json()
+        cursor = parse_qs(urlsplit(first['next']).query)['cursor'][0]
+        data, signature = cursor.rsplit(':', 1)
+        payload = json.loads(base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+
+        def request(cursor, ordering='newest', url='/api/products/featured/'):
+            return self.client.get(url, {'page_size': 3, 'ordering': ordering, 'cursor': cursor})
+
+        def signed(payload, ordering='newest'):
+            return request(ProductCursorPagination.sign_cursor(payload), ordering)
+
+        self.assertEqual(self.client.get('/api/products/featured/?cursor=not-base64!').status_code, 400)
+        # unsigned or re-encoded positions never reach the query
+        unsigned = base64.urlsafe_b64encode(json.dumps({**payload, 'p': [payload['p'][0], 1]}).encode()).decode()
+        self.assertEqual(request(unsigned).status_code, 400)
+        self.assertEqual(request(f'{unsigned.rstrip("=")}:{signature}').status_code, 400)
+        self.assertEqual(request(cursor, url='/api/async/products/featured/').status_code, 200)
+        self.assertEqual(request(cursor[:-1], url='/api/async/products/featured/').status_code, 400)
+        # signed, but for another ordering or not a position
+        self.assertEqual(signed(payload, ordering='price').status_code, 400)
+        self.assertEqual(signed({**payload, 'p': ['yesterday', 1]}).status_code, 400)
+        self.assertEqual(signed({**payload, 'p': [payload['p'][0]]}).status_code, 400)
+        self.assertEqual(signed(payload).status_code, 200)
+
+# --------------------------- keyset pagination end here ---------------------------
+
+
+# --------------------------- conditional get start here ---------------------------
+class ConditionalGetTests(TestCase):
+    def revalidate(self, url, response):
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        return again.status_code, len(queries)
+
+    def test_304_until_its_own_version_changes(self):
+        NavOption.objects.create(title='Men', url='https://example.com/men')
+        response = self.client.get('/api/navigation/')
+        self.assertEqual(response.status_code, 200)
+
+        # answered from the version counters alone, no query
+        self.assertEqual(self.revalidate('/api/navigation/', response), (304, 0))
+        # other versions don't matter to it
+        bump_version(HERO)
+        bump_version(CATALOG)
+        self.assertEqual(self.revalidate('/api/navigation/', response)[0], 304)
+
+        NavOption.objects.create(title='Women', url='https://example.com/women')
+        self.assertEqual(self.revalidate('/api/navigation/', response)[0], 200)
+
+    def test_product_details_follow_stock(self):
+        shirt = create_variant('SHIRT')
+        for url in ('/api/products/shirt/', '/api/async/products/shirt/'):
+            response = self.client.get(url)
+            self.assertEqual(self.revalidate(url, response)[0], 304)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                set_stock({'SHIRT': 3})
+            self.assertEqual(self.revalidate(url, response)[0], 200)
+
+# --------------------------- conditional get end here ---------------------------
+
+
+# --------------------------- async views start here ---------------------------
+class AsyncViewParityTests(TestCase):
+    def test_same_json_as_the_sync_views(self):
+        NavOption.objects.create(title='Men', url='https://example.com/men')
+        shirt = create_variant('SHIRT', price=20).product
+        men = shirt.category
+        formal = ProductCategory.objects.create(name='Formal', slug='formal', parent=men)
+        for i in range(3):
+            product = create_variant(f'SUIT-{i}', price=30 + i).product
+            product.category = formal
+            product.featured_products = product.new_arrivals = True
+            product.save()
+        ProductImages.objects.create(product=shirt, image='products/front.jpg')
+        ProductReview.objects.create(product=shirt, user=User.objects.create(username='reviewer'), rating=4, comment='nice')
+
+        for url in (
+            'navigation/', 'hero-section/', 'categories/', 'categories/all/',
+            'categories/men/products/?page_size=2&ordering=price',
+            'products/featured/', 'products/new-arrivals/', 'products/shirt/',
+        ):
+            with self.subTest(url=url):
+                sync = self.client.get(f'/api/{url}')
+                asynchronous = self.client.get(f'/api/async/{url}')
+                self.assertEqual(sync.status_code, 200)
+                self.assertEqual(asynchronous.status_code, 200)
+                # pagination links only differ in the path prefix
+                self.assertEqual(json.loads(asynchronous.content.decode().replace('/api/async/', '/api/')), sync.json())
+
+# --------------------------- async views end here ---------------------------
+
+
+# --------------------------- product search start here ---------------------------
+class ProductSearchTests(TestCase):
+    def search(self, query):
+        response = self.client.get('/api/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['slug'] for product in response.json()['results']]
+
+    def test_ranking_and_filters(self):
+        shirt = create_variant('SHIRT').product
+        shirt.description = 'a crisp linen blend'
+        shirt.save()
+        create_variant('LINEN-TEE')
+        hidden = create_variant('LINEN-PANTS').product
+        hidden.is_active = False
+        hidden.save()
+
+        # a match in the name outranks one in the description, inactive products never show
+        self.assertEqual(self.search('linen'), ['linen-tee', 'shirt'])
+        # the last word is a prefix, while typing
+        self.assertEqual(self.search('lin'), ['linen-tee', 'shirt'])
+        self.assertEqual(self.search('linen tee'), ['linen-tee'])
+        # FTS syntax in the input is matched as plain words
+        self.assertEqual(self.search('"linen OR'), [])
+        self.assertEqual(self.search('*'), [])
+
+# --------------------------- product search end here ---------------------------
+
+
+# --------------------------- product primary image start here ---------------------------
+class PrimaryImageTests(TestCase):
+    def test_moving_an_image_to_another_product(self):
+        shirt = create_variant('SHIRT').product
+        jeans = create_variant('JEANS').product
+        ProductImages.objects.create(product=shirt, image='products/front.jpg', order=1)
+        ProductImages.objects.create(product=shirt, image='products/back.jpg', order=2)
+
+        image = ProductImages.objects.get(image='products/front.jpg')
+        image.product = jeans
+        image.save()
+
+        self.assertEqual(dict(Product.objects.values_list('slug', 'primary_image')), {
+            'shirt': 'products/back.jpg', 'jeans': 'products/front.jpg',
+        })
+
+# --------------------------- product primary image end here ---------------------------
+
+
+# --------------------------- review stats start here ---------------------------
+class ReviewStatsTests(TestCase):
+    def setUp(self):
+        self.shirt = create_variant('SHIRT').product
+        self.user = User.objects.create(username='reviewer')
+
+    def assertHistogram(self, expected):
+        product = Product.objects.get(pk=self.shirt.pk)
+        self.assertEqual(product.rating_histogram, expected)
+        self.assertEqual(product.review_count, sum(expected.values()))
+        # the incremental updates agree with a full rebuild
+        call_command('rebuild_review_stats', stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=self.shirt.pk).rating_histogram, expected)
+
+    def test_editing_and_deleting_a_review(self):
+        review = ProductReview.objects.create(product=self.shirt, user=self.user, rating=5, comment='great')
+        self.assertHistogram({1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+        review = ProductReview.objects.get(pk=review.pk)
+        review.rating = 3
+        review.save()
+        self.assertHistogram({1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+
+        # loaded without the rating: the stored one moves, nothing is counted twice
+        review = ProductReview.objects.defer('rating').get(pk=review.pk)
+        review.rating = 4
+        review.save()
+        self.assertHistogram({1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+        ProductReview.objects.get(pk=review.pk).delete()
+        self.assertHistogram({1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+
+    def test_rating_out_of_range(self):
+        with self.assertRaises(ValidationError):
+            ProductReview.objects.create(product=self.shirt, user=self.user, rating=6, comment='too good')
+        self.assertFalse(ProductReview.objects.exists())
+        self.assertHistogram({1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+
+# --------------------------- review stats end here ---------------------------
+
+
+# --------------------------- category counts start here ---------------------------
+class CategoryCountTests(TestCase):
+    def setUp(self):
+        self.men = ProductCategory.objects.create(name='Men', slug='men')
+        self.shirts = ProductCategory.objects.create(name='Shirts', slug='shirts', parent=self.men)
+        self.women = ProductCategory.objects.create(name='Women', slug='women')
+        self.product = Product.objects.create(
+            name='Oxford', slug='oxford', short_description='', description='', base_price=1, category=self.shirts,
+        )
+
+    def assertCounts(self, expected):
+        counts = dict(ProductCategory.objects.values_list('slug', 'product_count'))
+        self.assertEqual(counts, expected)
+        # the incremental updates agree with a full recount
+        call_command('rebuild_category_tree', stdout=StringIO())
+        self.assertEqual(dict(ProductCategory.objects.values_list('slug', 'product_count')), counts)
+
+    def test_moving_a_product(self):
+        self.assertCounts({'men': 1, 'shirts': 1, 'women': 0})
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = self.women
+        product.save()
+        self.assertCounts({'men': 0, 'shirts': 0, 'women': 1})
+
+    def test_deactivating_and_activating_a_product(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.is_active = False
+        product.save()
+        self.assertCounts({'men': 0, 'shirts': 0, 'women': 0})
+        # saving an inactive product again doesn't count it
+        product.name = 'Oxford shirt'
+        product.save()
+        self.assertCounts({'men': 0, 'shirts': 0, 'women': 0})
+
+        set_products_active(Product.objects.all(), True)
+        self.assertCounts({'men': 1, 'shirts': 1, 'women': 0})
+        Product.objects.get(pk=self.product.pk).delete()
+        self.assertCounts({'men': 0, 'shirts': 0, 'women': 0})
+
+    def test_moving_and_deleting_categories(self):
+        self.shirts.parent = self.women
+        self.shirts.save()
+        self.assertCounts({'men': 0, 'shirts': 1, 'women': 1})
+
+        Product.objects.create(name='Tee', slug='tee', short_description='', description='', base_price=1, category=self.men)
+        self.men.parent = self.women
+        self.men.save()
+        self.assertCounts({'men': 1, 'shirts': 1, 'women': 2})
+
+        # a parent and its child deleted together are taken off once
+        ProductCategory.objects.filter(slug__in=['men', 'shirts']).delete()
+        self.assertCounts({'women': 0})
+
+# --------------------------- category counts end here ---------------------------
+
+
+# --------------------------- facets start here ---------------------------
+class CategoryFacetTests(TestCase):
+    def test_deleting_a_category_with_products(self):
+        shirt = create_variant('SHIRT')
+        men = shirt.product.category
+        formal = ProductCategory.objects.create(name='Formal', slug='formal', parent=men)
+        kept = create_variant('KEPT')
+        tuxedo = create_variant('TUXEDO')
+        Product.objects.filter(pk__in=[kept.product_id, tuxedo.product_id]).update(category=formal)
+        ProductVariant.objects.filter(pk=tuxedo.pk).update(color='black')
+        call_command('rebuild_category_tree', stdout=StringIO())
+        call_command('rebuild_facets', stdout=StringIO())
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            formal.delete()
+
+        self.assertEqual(len(callbacks), 0)
+        self.assertFalse(CategoryFacet.objects.filter(category=formal.pk).exists())
+        men.refresh_from_db()
+        self.assertEqual(men.product_count, 1)
+
+    def test_deleting_products_updates_each_category_once(self):
+        for sku in ('SHIRT', 'JEANS', 'SOCKS'):
+            create_variant(sku)
+        call_command('rebuild_facets', stdout=StringIO())
+
+        with mock.patch('web_management_app.signals.update_product_facets', wraps=update_product_facets) as update, \
+                self.captureOnCommitCallbacks(execute=True):
+            Product.objects.exclude(slug='socks').delete()
+
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(CategoryFacet.objects.get(attribute=CategoryFacet.ALL).product_count, 1)
+
+    def test_saves_flip_only_their_products_bits(self):
+        shirt = create_variant('SHIRT')
+        jeans = create_variant('JEANS')
+        men = shirt.product.category
+        with self.captureOnCommitCallbacks(execute=True):
+            shirt.color = 'red'
+            shirt.save()
+            jeans.color = 'red'
+            jeans.stock = 0
+            jeans.save()
+
+        self.assertEqual(get_facet_counts(men, {}), {
+            'color': {'red': 2}, 'size': {}, 'material': {}, 'in_stock': 1,
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            shirt.color = 'blue'
+            shirt.save()
+        self.assertEqual(get_facet_counts(men, {'color': 'red'})['color'], {'red': 1, 'blue': 1})
+        self.assertEqual(get_facet_counts(men, {'color': 'blue'})['in_stock'], 1)
+
+        # the full rebuild agrees with the incremental updates
+        updated = set(CategoryFacet.objects.values_list('attribute', 'value', 'product_count'))
+        call_command('rebuild_facets', stdout=StringIO())
+        self.assertEqual(set(CategoryFacet.objects.values_list('attribute', 'value', 'product_count')), updated)
+
+    def test_sold_out_after_checkout(self):
+        user = User.objects.create(username='buyer')
+        shirt = create_variant('SHIRT', stock=1)
+        fill_cart(user, (shirt, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, payment_method='cash_on_delivery')
+
+        self.assertFalse(CategoryFacet.objects.filter(attribute=CategoryFacet.IN_STOCK).exists())
+        self.assertEqual(get_facet_counts(shirt.product.category, {})['in_stock'], 0)
+
+    def test_price_filters_use_the_price_buckets(self):
+        for sku, price in (('SOCKS', 5), ('SHIRT', 25), ('JEANS', 45), ('COAT', 120), ('SUIT', 2500)):
+            create_variant(sku, price=price)
+        men = ProductCategory.objects.get(slug='men')
+
+        def in_stock(**params):
+            return get_facet_counts(men, params)['in_stock']
+
+        self.assertEqual(in_stock(min_price='20', max_price='150'), 3)
+        self.assertEqual(in_stock(min_price='25.01'), 3)
+        self.assertEqual(in_stock(max_price='45'), 3)
+        # only the buckets the bounds fall inside are looked up
+        with self.assertNumQueries(2):
+            self.assertEqual(in_stock(min_price='22', max_price='130'), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Promotion.objects.create(name='Half off', percent_off=50)
+        self.assertEqual(in_stock(max_price='30'), 3)
+        self.assertEqual(in_stock(min_price='1000'), 1)
+        updated = set(CategoryFacet.objects.values_list('attribute', 'value', 'product_count'))
+        call_command('rebuild_facets', stdout=StringIO())
+        self.assertEqual(set(CategoryFacet.objects.values_list('attribute', 'value', 'product_count')), updated)
+
+# --------------------------- facets end here ---------------------------
+
+
+# --------------------------- media start here ---------------------------
+class HashedMediaTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root.name
+
+    def test_identical_uploads_share_one_file(self):
+        first = default_storage.save('products/front.jpg', ContentFile(b'same bytes'))
+        second = default_storage.save('products/copy.JPG', ContentFile(b'same bytes'))
+        other = default_storage.save('products/back.jpg', ContentFile(b'other bytes'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^products/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        stored = [name for _, _, names in os.walk(self.media_root) for name in names]
+        self.assertEqual(len(stored), 2)
+
+    def save_image(self, name, size):
+        image = BytesIO()
+        Image.new('RGB', size, 'red').save(image, 'JPEG')
+        return default_storage.save(name, ContentFile(image.getvalue()))
+
+    def test_srcset_lists_only_generated_renditions(self):
+        name = self.save_image('products/front.jpg', (1200, 800))
+        field = RenditionsField()
+        field.bind('image_srcset', None)
+        value = ContentFile(b'', name=name)
+
+        with mock.patch('web_management_app.thumbnails._ready', set()):
+            self.assertEqual(field.to_representation(value), {
+                'original': {'jpeg': default_storage.url(name)},
+            })
+
+            self.assertEqual(generate_renditions(self.media_root, name), 6)
+            self.assertEqual(list(field.to_representation(value)), ['160w', '480w', '1080w'])
+
+        # nothing stale: the original isn't even opened
+        with mock.patch('web_management_app.thumbnails.Image.open') as open_image:
+            self.assertEqual(generate_renditions(self.media_root, name), 0)
+        open_image.assert_not_called()
+
+    def test_no_renditions_wider_than_the_original(self):
+        field = RenditionsField()
+        field.bind('image_srcset', None)
+        narrow = self.save_image('products/narrow.jpg', (600, 400))
+        tiny = self.save_image('products/tiny.jpg', (100, 100))
+
+        with mock.patch('web_management_app.thumbnails._ready', set()):
+            self.assertEqual(generate_renditions(self.media_root, narrow), 4)
+            self.assertEqual(list(field.to_representation(ContentFile(b'', name=narrow))), ['160w', '480w'])
+            self.assertEqual(generate_renditions(self.media_root, tiny), 0)
+            self.assertEqual(list(field.to_representation(ContentFile(b'', name=tiny))), ['original'])
+
+        # the missing widths are known from the header, nothing is decoded again
+        with mock.patch('web_management_app.thumbnails.ImageOps.exif_transpose') as transpose:
+            self.assertEqual(generate_renditions(self.media_root, narrow), 0)
+        transpose.assert_not_called()
+
+    def test_range_and_conditional_requests(self):
+        name = default_storage.save('products/front.jpg', ContentFile(b'0123456789'))
+        factory = RequestFactory()
+
+        response = serve_media(factory.get('/media/', HTTP_RANGE='bytes=2-5'), name)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+
+        response = serve_media(factory.get('/media/', HTTP_RANGE='bytes=20-'), name)
+        self.assertEqual(response.status_code, 416)
+
+        etag = serve_media(factory.get('/media/'), name)
+        etag.close()
+        response = serve_media(factory.get('/media/', HTTP_IF_NONE_MATCH=etag['ETag']), name)
+        self.assertEqual(response.status_code, 304)
+
+# --------------------------- media end here ---------------------------
+
+
+# --------------------------- replica routing start here ---------------------------
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        token = _pinned.set(False)
+        self.addCleanup(_pinned.reset, token)
+        self.router = PrimaryReplicaRouter()
+
+    def test_catalog_reads_use_the_replica_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Product), REPLICA)
+        self.assertEqual(self.router.db_for_read(Cart), 'default')
+
+        self.assertEqual(self.router.db_for_write(Cart), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    @override_settings(REPLICA_PIN_SECONDS=5)
+    async def test_async_requests_stay_async(self):
+        async def view(request):
+            asyncio.get_running_loop()
+            self.assertTrue(is_pinned())
+            pin_primary()
+            return HttpResponse()
+
+        with mock.patch.dict(settings.DATABASES, {REPLICA: {}}):
+            middleware = ReplicaPinningMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertFalse(is_pinned())
+
+    def test_fresh_versions_are_built_from_the_primary(self):
+        now = int(time.time() * 1000)
+        with primary_for_recent([now - 60_000, now - 1000]):
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        with primary_for_recent([now - 60_000]):
+            self.assertEqual(self.router.db_for_read(Product), REPLICA)
+        self.assertEqual(self.router.db_for_read(Product), REPLICA)
+
+# --------------------------- replica routing end here ---------------------------
+
+
+# --------------------------- request timing start here ---------------------------
+class QueryTimingTests(TestCase):
+    @override_settings(QUERY_TIMING_SAMPLE_RATE=1)
+    def test_sampled_request_gets_server_timing(self):
+        create_variant('SHIRT')
+
+        with self.assertLogs('web_management_app.timing', 'INFO') as logs:
+            response = self.client.get('/api/products/shirt/')
+
+        self.assertRegex(response['Server-Timing'], r'^db;desc="\d+ queries";dur=[\d.]+, app;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertIn('"view": "web_management_app.views.ProductDetailsAPIView"', logs.output[0])
+
+    @override_settings(QUERY_TIMING_SAMPLE_RATE=1)
+    async def test_async_requests_stay_async(self):
+        await sync_to_async(create_variant)('SHIRT')
+        async def view(request):
+            # no thread hop between the server and the view
+            asyncio.get_running_loop()
+            await Product.objects.aget(slug='shirt')
+            return HttpResponse()
+
+        middleware = QueryTimingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        # the test database connection was opened before the middleware existed
+        await sync_to_async(record_queries)(connection)
+        with self.assertLogs('web_management_app.timing', 'INFO'):
+            response = await middleware(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'^db;desc="1 queries"')
+
+    def test_repeated_queries_are_reported(self):
+        timing = RequestTiming()
+        with connection.execute_wrapper(timing):
+            for pk in (1, 2, 3):
+                list(Product.objects.filter(pk=pk))
+            list(Product.objects.filter(pk__in=[1, 2]))
+            list(Product.objects.filter(pk__in=[1, 2, 3]))
+
+        self.assertEqual(timing.queries, 5)
+        self.assertEqual([duplicate['count'] for duplicate in timing.duplicates()], [3, 2])
+
+# --------------------------- request timing end here ---------------------------
+
+
+# --------------------------- catalog import start here ---------------------------
+class ImportCatalogTests(TestCase):
+    def write(self, name, lines):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        path = os.path.join(folder.name, name)
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, path, kind):
+        output = StringIO()
+        call_command('import_catalog', path, kind=kind, stdout=output, stderr=StringIO())
+        return output.getvalue().splitlines()[0]
+
+    def test_upserts_and_skips_unchanged_rows(self):
+        categories = self.write('categories.csv', ['slug,name,parent', 'shirts,Shirts,men', 'men,Men,'])
+        products = [
+            {'slug': 'oxford', 'name': 'Oxford', 'category': 'shirts', 'base_price': '25.00'},
+            {'slug': 'linen', 'name': 'Linen', 'category': 'men', 'base_price': 30},
+            {'slug': 'broken', 'name': 'Broken', 'category': 'women', 'base_price': 10},
+        ]
+        path = self.write('products.jsonl', [json.dumps(product) for product in products])
+
+        self.assertIn('2 created', self.run_import(categories, 'categories'))
+        self.assertIn('2 created, 0 updated, 0 unchanged, 1 rejected', self.run_import(path, 'products'))
+        men = ProductCategory.objects.get(slug='men')
+        self.assertEqual(ProductCategory.objects.get(slug='shirts').parent, men)
+        men.refresh_from_db()
+        self.assertEqual(men.product_count, 2)
+
+        products[1]['base_price'] = 35
+        path = self.write('products.jsonl', [json.dumps(product) for product in products])
+        self.assertIn('0 created, 1 updated, 1 unchanged, 1 rejected', self.run_import(path, 'products'))
+        self.assertEqual(Product.objects.get(slug='linen').base_price, 35)
+
+    def test_effective_price_of_imported_products(self):
+        categories = self.write('categories.csv', ['slug,name,parent', 'men,Men,', 'shirts,Shirts,men', 'women,Women,'])
+        self.run_import(categories, 'categories')
+        Promotion.objects.create(name='Men', category=ProductCategory.objects.get(slug='men'), percent_off=20)
+        path = self.write('products.csv', [
+            'slug,name,category,base_price,discount_price',
+            'oxford,Oxford,shirts,25.00,',
+            'linen,Linen,women,30,24.50',
+        ])
+
+        self.run_import(path, 'products')
+
+        self.assertEqual(dict(Product.objects.values_list('slug', 'effective_price')), {
+            'oxford': Decimal('20.00'), 'linen': Decimal('24.50'),
+        })
+
+# --------------------------- catalog import end here ---------------------------
+
+# --------------------------- bulk actions start here ---------------------------
+class BulkCatalogChangeTests(TestCase):
+    def test_price_change_is_one_update(self):
+        for i in range(20):
+            create_variant(f'SKU-{i}', price=100)
+        Product.objects.filter(slug='sku-0').update(discount_price=80)
+        products = Product.objects.all()
+
+        self.assertEqual(change_prices(products, PRICE_PERCENT, 10, dry_run=True), {'products': 20})
+        self.assertEqual(Product.objects.get(slug='sku-0').base_price, 100)
+        # count, one UPDATE of the prices and one of the effective prices, the
+        # price facets of the one category changed, savepoints
+        with self.assertNumQueries(14):
+            change_prices(products, PRICE_PERCENT, -10)
+
+        self.assertEqual(Product.objects.get(slug='sku-0').discount_price, 72)
+        self.assertEqual(Product.objects.get(slug='sku-1').discount_price, None)
+        self.assertEqual(set(Product.objects.values_list('base_price', flat=True)), {90})
+
+    def test_prices_stay_within_the_column(self):
+        create_variant('SHIRT', price=Decimal('99999000.00'))
+
+        change_prices(Product.objects.all(), PRICE_AMOUNT, 5000)
+
+        self.assertEqual(Product.objects.get().base_price, MAX_PRICE)
+        self.assertFalse(PriceChangeForm({'mode': PRICE_PERCENT, 'value': '1001'}).is_valid())
+        self.assertTrue(PriceChangeForm({'mode': PRICE_PERCENT, 'value': '1000'}).is_valid())
+
+    def test_deactivating_a_category_tree(self):
+        shirt = create_variant('SHIRT')
+        men = shirt.product.category
+        formal = ProductCategory.objects.create(name='Formal', slug='formal', parent=men)
+        Product.objects.create(name='Tuxedo', slug='tuxedo', short_description='', description='', base_price=1, category=formal)
+        men.refresh_from_db()
+        self.assertEqual(men.product_count, 2)
+
+        counts = set_category_tree_active(ProductCategory.objects.filter(pk=men.pk), False)
+
+        self.assertEqual(counts, {'products': 2, 'categories': 2})
+        men.refresh_from_db()
+        self.assertEqual((men.is_active, men.product_count), (False, 0))
+        self.assertFalse(Product.objects.filter(is_active=True).exists())
+
+    def test_stock_by_sku(self):
+        create_variant('SHIRT', stock=5)
+        create_variant('JEANS', stock=1)
+
+        counts = set_stock({'SHIRT': 3, 'JEANS': -4, 'NOPE': 1}, STOCK_ADD)
+
+        self.assertEqual(counts, {'variants': 2, 'unknown_skus': ['NOPE']})
+        self.assertEqual(dict(ProductVariant.objects.values_list('sku', 'stock')), {'SHIRT': 8, 'JEANS': 0})
+
+# --------------------------- bulk actions end here ---------------------------
+
+# --------------------------- pricing start here ---------------------------
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='buyer')
+        self.client.force_login(self.user)
+
+    def test_cart_and_checkout_use_the_same_prices(self):
+        shirt = create_variant('SHIRT', price=100)
+        jeans = create_variant('JEANS', price=100)
+        Product.objects.filter(pk=jeans.product_id).update(discount_price=80)
+        now = timezone.now()
+        Promotion.objects.create(name='Sale', category=shirt.product.category, percent_off=25,
+                                 starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1))
+        Promotion.objects.create(name='Later', percent_off=90, starts_at=now + timedelta(hours=1))
+        Promotion.objects.create(name='3 or more', percent_off=30, min_quantity=3)
+        fill_cart(self.user, (shirt, 1), (jeans, 3))
+
+        cart = self.client.get('/api/cart/').json()
+
+        # the sale beats the discount, the quantity tier beats both
+        self.assertEqual([(item['price'], item['line_total']) for item in cart['items']],
+                         [('75.00', '75.00'), ('70.00', '210.00')])
+        self.assertEqual(cart['subtotal'], '285.00')
+        order = place_order(self.user, payment_method='cash_on_delivery')
+        self.assertEqual(order.total_amount, Decimal('285.00'))
+        self.assertEqual(sorted(order.items.values_list('price', flat=True)), [70, 75])
+
+    def test_listings_sort_on_the_effective_price(self):
+        men = ProductCategory.objects.create(name='Men', slug='men')
+        shirts = ProductCategory.objects.create(name='Shirts', slug='shirts', parent=men)
+        cheap = create_variant('CHEAP', price=40).product
+        dear = create_variant('DEAR', price=60).product
+        Product.objects.filter(pk=dear.pk).update(category=shirts)
+        call_command('rebuild_category_tree', stdout=StringIO())
+
+        def listed():
+            response = self.client.get('/api/categories/men/products/?ordering=price')
+            return [(row['slug'], row['effective_price']) for row in response.json()['results']]
+
+        self.assertEqual(listed(), [('cheap', '40.00'), ('dear', '60.00')])
+        sale = Promotion.objects.create(name='Shirts', category=shirts, percent_off=50)
+        self.assertEqual(listed(), [('dear', '30.00'), ('cheap', '40.00')])
+
+        # a window that has closed is picked up by the periodic rebuild
+        Promotion.objects.filter(pk=sale.pk).update(ends_at=timezone.now())
+        call_command('rebuild_effective_prices', stdout=StringIO())
+        self.assertEqual(listed(), [('cheap', '40.00'), ('dear', '60.00')])
+
+    def test_bulk_created_products_are_priced(self):
+        Promotion.objects.create(name='Everything', percent_off=10)
+        call_command(
+            'generate_catalog', products=20, roots=2, depth=2, fanout=2, variants=1, images=0,
+            users=2, reviews=1, carts=1, orders=2, stdout=StringIO(),
+        )
+
+        rules = get_rules()
+        for product in Product.objects.all():
+            self.assertEqual(product.effective_price, rules.unit_price(product))
+            self.assertGreater(product.effective_price, 0)
+
+        # bulk code that forgets the price fails instead of listing products at 0
+        with self.assertRaises(IntegrityError):
+            Product.objects.bulk_create([Product(
+                name='Unpriced', slug='unpriced', short_description='', description='',
+                base_price=10, category=ProductCategory.objects.first(),
+            )])
+
+    def test_only_a_moved_category_is_repriced(self):
+        men = ProductCategory.objects.create(name='Men', slug='men')
+        women = ProductCategory.objects.create(name='Women', slug='women')
+        shirts = ProductCategory.objects.create(name='Shirts', slug='shirts', parent=men)
+        product = create_variant('SHIRT', price=40).product
+        Product.objects.filter(pk=product.pk).update(category=shirts)
+        Promotion.objects.create(name='Men', category=men, percent_off=50)
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, Decimal('20.00'))
+
+        shirts = ProductCategory.objects.get(pk=shirts.pk)
+        with mock.patch('web_management_app.signals.refresh_effective_prices') as reprice:
+            shirts.name = 'Shirts & Tops'
+            shirts.save()
+        reprice.assert_not_called()
+
+        shirts.parent = women
+        shirts.save()
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, Decimal('40.00'))
+
+# --------------------------- pricing end here ---------------------------
+
+# --------------------------- product feed start here ---------------------------
+class ProductFeedTests(TestCase):
+    def test_one_row_per_active_variant(self):
+        shirt = create_variant('SHIRT-M', stock=3, price=20)
+        ProductVariant.objects.create(product=shirt.product, sku='SHIRT-L', size='L', stock=0)
+        ProductVariant.objects.create(product=shirt.product, sku='SHIRT-XL', size='XL', is_active=False)
+        ProductImages.objects.create(product=shirt.product, image='products/front.jpg', order=0)
+        ProductImages.objects.create(product=shirt.product, image='products/back.jpg', order=1)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+
+        response = self.client.get('/api/feed/products.csv.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(body.splitlines()))
+
+        self.assertEqual([(row['id'], row['availability']) for row in rows], [
+            ('SHIRT-M', 'in_stock'), ('SHIRT-L', 'out_of_stock'),
+        ])
+        self.assertEqual(rows[0]['image_link'], 'http://testserver/media/products/front.jpg')
+        self.assertEqual(rows[0]['additional_image_links'], 'http://testserver/media/products/back.jpg')
+
+        response = self.client.get('/api/feed/products.ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['price'], '20.00')
+        self.assertEqual(self.client.get('/api/feed/products.xml').status_code, 404)
+
+    @override_settings(FEED_TOKENS=['marketplace'], FEED_DOWNLOADS_PER_HOUR=2)
+    def test_tokens_and_download_limit(self):
+        cache.clear()
+        create_variant('SHIRT-M')
+        self.assertEqual(self.client.get('/api/feed/products.ndjson').status_code, 403)
+        self.assertEqual(self.client.get('/api/feed/products.ndjson?token=other').status_code, 403)
+
+        response = self.client.get('/api/feed/products.ndjson?token=marketplace')
+        self.assertEqual(response.status_code, 200)
+        # revalidating is free, the limit counts full downloads
+        for _ in range(3):
+            not_modified = self.client.get('/api/feed/products.ndjson?token=marketplace',
+                                           HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get('/api/feed/products.csv?token=marketplace').status_code, 200)
+        throttled = self.client.get('/api/feed/products.csv?token=marketplace')
+        self.assertEqual(throttled.status_code, 429)
+        self.assertIn('Retry-After', throttled)
+
+# --------------------------- product feed end here ---------------------------
+
+# --------------------------- query budgets start here ---------------------------
+# Every endpoint runs twice, once with SMALL and once with LARGE rows behind it
+# (products, reviews, cart lines, orders), starting from an empty cache. Both
+# runs must make the same number of queries, at most the endpoint's budget, so
+# a serializer field that queries per row (N+1) fails here. Budgets include
+# the two session/user queries of the logged in test client.
+SMALL = 5
+LARGE = 500
+PAGE = '?page_size=100'
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='budget')
+        self.client.force_login(self.user)
+        self.men = ProductCategory.objects.create(name='Men', slug='men')
+        self.shirts = ProductCategory.objects.create(name='Shirts', slug='shirts', parent=self.men)
+        self.products = []
+        self.variants = []
+
+    def assertQueryBudget(self, budget, grow, request, sizes=(SMALL, LARGE)):
+        counts = []
+        for rows in sizes:
+            grow(rows)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            self.assertLess(response.status_code, 400, response.content[:300])
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1], (
+            f"{counts[0]} queries with {sizes[0]} rows but {counts[1]} with {sizes[1]}:\n"
+            + '\n'.join(query['sql'] for query in queries.captured_queries)
+        ))
+        self.assertLessEqual(counts[1], budget)
+
+    # ----- fixtures -----
+    def grow_catalog(self, count):
+        # bulk inserts skip the signals, the derived data is rebuilt like generate_catalog does
+        start = len(self.products)
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Shirt {i}',
+                slug=f'shirt-{i}',
+                short_description='short',
+                description='description',
+                base_price=10 + i,
+                effective_price=10 + i,
+                category=self.shirts,
+                featured_products=True,
+                new_arrivals=True,
+            )
+            for i in range(start, count)
+        ])
+        self.variants += ProductVariant.objects.bulk_create([
+            ProductVariant(product=product, sku=f'SHIRT-{product.pk}-{size}', size=size, color='#000000', stock=1000)
+            for product in products
+            for size in ('M', 'L')
+        ])
+        ProductImages.objects.bulk_create([
+            ProductImages(product=product, image=f'products/shirt-{product.pk}.jpg', order=order)
+            for product in products
+            for order in (0, 1)
+        ])
+        self.products += products
+        for command in ('backfill_primary_images', 'rebuild_search_index', 'rebuild_facets', 'rebuild_effective_prices'):
+            call_command(command, stdout=StringIO())
+
+    def grow_navigation(self, count):
+        self.grow_catalog(count)
+        start = NavOption.objects.count()
+        NavOption.objects.bulk_create([NavOption(title=f'Option {i}', url='https://example.com', order=i) for i in range(start, count)])
+        NavButtons.objects.bulk_create([
+            NavButtons(icon=f'assets/icon-{i}.png', url='https://example.com', order=i) for i in range(start, count)
+        ])
+        start = ProductCategory.objects.count()
+        ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'Category {i}', slug=f'category-{i}', parent=self.men if i % 2 else None)
+            for i in range(start, count)
+        ])
+        call_command('rebuild_category_tree', stdout=StringIO())
+
+    def grow_reviews(self, count):
+        self.grow_catalog(1)
+        start = ProductReview.objects.count()
+        users = User.objects.bulk_create([User(username=f'reviewer-{i}') for i in range(start, count)])
+        ProductReview.objects.bulk_create([
+            ProductReview(product=self.products[0], user=user, rating=5, comment='great')
+            for user in users
+        ])
+        call_command('rebuild_review_stats', stdout=StringIO())
+
+    def grow_cart(self, count):
+        self.grow_catalog(count)
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, variant=variant, quantity=1)
+            for variant in self.variants[:count]
+        ], ignore_conflicts=True)
+        self.item = CartItem.objects.filter(cart=cart).latest('id')
+
+    def grow_orders(self, count):
+        self.grow_catalog(3)
+        start = Order.objects.filter(user=self.user).count()
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, total_amount=30, payment_method='cash_on_delivery')
+            for _ in range(start, count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=variant.product,
+                product_variant=variant,
+                product_name=variant.product.name,
+                sku=variant.sku,
+                quantity=1,
+                price=10,
+            )
+            for order in orders
+            for variant in self.variants[:3]
+        ])
+        self.order = Order.objects.filter(user=self.user).latest('id')
+
+    def grow_admin(self, count):
+        self.grow_catalog(count)
+        self.grow_reviews(count)
+        start = Cart.objects.count()
+        users = User.objects.bulk_create([User(username=f'shopper-{i}') for i in range(start, count)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, variant=variant, quantity=1)
+            for cart, variant in zip(carts, self.variants[start:])
+        ])
+        self.grow_orders(count)
+
+    # ----- catalog -----
+    def test_navigation(self):
+        self.assertQueryBudget(5, self.grow_navigation, lambda: self.client.get('/api/navigation/'))
+
+    def test_hero_section(self):
+        self.assertQueryBudget(3, self.grow_navigation, lambda: self.client.get('/api/hero-section/'))
+
+    def test_home(self):
+        self.assertQueryBudget(9, self.grow_navigation, lambda: self.client.get('/api/home/'))
+
+    def test_categories(self):
+        self.assertQueryBudget(3, self.grow_navigation, lambda: self.client.get('/api/categories/'))
+        self.assertQueryBudget(4, self.grow_navigation, lambda: self.client.get('/api/categories/all/'))
+
+    def test_category_products(self):
+        # category, its subtree's ids, page, facets and the cache checks
+        self.assertQueryBudget(6, self.grow_catalog, lambda: self.client.get('/api/categories/men/products/' + PAGE))
+        self.assertQueryBudget(6, self.grow_catalog, lambda: self.client.get(
+            '/api/categories/men/products/' + PAGE + '&size=M&in_stock=true&ordering=price'
+        ))
+
+    def test_featured_and_new_arrivals(self):
+        self.assertQueryBudget(3, self.grow_catalog, lambda: self.client.get('/api/products/featured/' + PAGE))
+        self.assertQueryBudget(3, self.grow_catalog, lambda: self.client.get('/api/products/new-arrivals/' + PAGE))
+
+    def test_product_details(self):
+        self.assertQueryBudget(5, self.grow_catalog, lambda: self.client.get('/api/products/shirt-0/'))
+
+    def test_product_reviews(self):
+        self.assertQueryBudget(4, self.grow_reviews, lambda: self.client.get('/api/products/shirt-0/reviews/' + PAGE))
+
+    def test_search(self):
+        self.assertQueryBudget(4, self.grow_catalog, lambda: self.client.get('/api/search/?q=shirt'))
+
+    # ----- cart -----
+    # cart and checkout compile the promotion rules once the cache is cleared
+    def test_cart(self):
+        self.assertQueryBudget(4, self.grow_cart, lambda: self.client.get('/api/cart/'))
+
+    def test_cart_add(self):
+        self.assertQueryBudget(9, self.grow_cart, lambda: self.client.post(
+            '/api/cart/add/', {'variant_id': self.variants[0].pk, 'quantity': 1}, content_type='application/json'
+        ))
+
+    def test_cart_batch(self):
+        self.assertQueryBudget(10, self.grow_cart, lambda: self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'set', 'variant_id': variant.pk, 'quantity': 2} for variant in self.variants[:SMALL]
+        ]}, content_type='application/json'))
+
+    def test_cart_item_update_and_delete(self):
+        self.assertQueryBudget(4, self.grow_cart, lambda: self.client.patch(
+            f'/api/cart_item/{self.item.pk}/', {'quantity': 3}, content_type='application/json'
+        ))
+        self.assertQueryBudget(4, self.grow_cart, lambda: self.client.delete(f'/api/cart_item/{self.item.pk}/delete/'))
+
+    # ----- orders -----
+    def test_order_list_and_detail(self):
+        self.assertQueryBudget(4, self.grow_orders, lambda: self.client.get('/orders/' + PAGE))
+        self.assertQueryBudget(4, self.grow_orders, lambda: self.client.get(f'/orders/{self.order.pk}/'))
+
+    def test_order_create(self):
+        # sqlite splits bulk inserts in batches of 999 variables (~99 order
+        # lines), so the cart stays below one batch here
+        self.assertQueryBudget(11, self.grow_cart, lambda: self.client.post(
+            '/orders/', {'payment_method': 'cash_on_delivery'}, content_type='application/json'
+        ), sizes=(SMALL, 50))
+
+    # ----- admin -----
+    def test_admin_changelists(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        for model in ('product', 'productimages', 'productvariant', 'productreview', 'cart', 'cartitem', 'order'):
+            with self.subTest(model):
+                self.assertQueryBudget(6, self.grow_admin, lambda: self.client.get(f'/admin/web_management_app/{model}/'))
+
+# --------------------------- query budgets end here ---------------------------
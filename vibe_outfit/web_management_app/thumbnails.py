@@ -0,0 +1,161 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import ExifTags, Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------- thumbnails start here ---------------------------
+# Every uploaded image gets resized/recompressed renditions next to it:
+#   media/renditions/<upload path without extension>/<width>.<webp|jpeg>
+# Names are derived from the original name only. They are generated after the
+# upload commits, smallest first, so serializers only list the ones already on
+# disk. Widths larger than the original are skipped, never upscaled.
+RENDITION_WIDTHS = (160, 480, 1080)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+RENDITION_DIR = 'renditions'
+
+
+def rendition_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'{RENDITION_DIR}/{root}/{width}.{extension}'
+
+
+def rendition_names(name):
+    return {
+        width: {extension: rendition_name(name, width, extension) for extension in RENDITION_FORMATS}
+        for width in RENDITION_WIDTHS
+    }
+
+
+# rendition names known to exist. Uploads are stored under their content hash
+# (storage.py), so a rendition never goes away once written; only missing ones
+# are looked up again.
+_ready = set()
+READY_CACHE_SIZE = 100_000
+
+
+def _is_ready(name):
+    if name not in _ready:
+        if not default_storage.exists(name):
+            return False
+        if len(_ready) >= READY_CACHE_SIZE:
+            _ready.clear()
+        _ready.add(name)
+    return True
+
+
+def ready_rendition_names(name):
+    # rendition_names() limited to the widths whose files are all written. The
+    # first missing width ends it: the larger ones are written after it, or
+    # skipped because the original is narrower.
+    ready = {}
+    for width, names in rendition_names(name).items():
+        if not all(_is_ready(rendition) for rendition in names.values()):
+            break
+        ready[width] = names
+    return ready
+
+
+def source_width(image):
+    # the width after exif_transpose, from the header only
+    width, height = image.size
+    rotated = image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8)
+    return height if rotated else width
+
+
+def generate_renditions(media_root, name):
+    # Runs in a worker process: plain files and Pillow only, no ORM. Renditions
+    # newer than the original are kept, so calling this twice is cheap: the
+    # image is only opened when something is missing, and only decoded when
+    # that is a width it is wide enough for.
+    source = os.path.join(media_root, name)
+    if not os.path.isfile(source):
+        return 0
+
+    source_mtime = os.path.getmtime(source)
+    stale = {}
+    for width in RENDITION_WIDTHS:
+        for extension in RENDITION_FORMATS:
+            target = os.path.join(media_root, rendition_name(name, width, extension))
+            if not os.path.exists(target) or os.path.getmtime(target) < source_mtime:
+                stale.setdefault(width, []).append((extension, target))
+    if not stale:
+        return 0
+
+    created = 0
+    with Image.open(source) as original:
+        # a "1080w" rendition of a 600px image would be 600px wide
+        stale = {width: targets for width, targets in stale.items() if width <= source_width(original)}
+        if not stale:
+            return 0
+        image = ImageOps.exif_transpose(original)
+        for width, targets in stale.items():
+            # bound by width only
+            resized = image.copy()
+            resized.thumbnail((width, resized.height), Image.Resampling.LANCZOS)
+            for extension, target in targets:
+                image_format, options = RENDITION_FORMATS[extension]
+                output = resized
+                if image_format == 'JPEG' and output.mode not in ('RGB', 'L'):
+                    output = output.convert('RGB')
+
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temporary = f'{target}.{os.getpid()}.tmp'
+                output.save(temporary, image_format, **options)
+                os.replace(temporary, target)
+                created += 1
+    return created
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, forking a threaded web worker isn't safe
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def _log_failure(future):
+    global _executor
+    error = future.exception()
+    if error is not None:
+        logger.error("Rendition generation failed: %s", error)
+        if isinstance(error, BrokenProcessPool):
+            # a worker died (killed, out of memory), start a new pool next time
+            _executor = None
+
+
+def schedule_renditions(name):
+    # after commit, so a rolled back upload doesn't get renditions
+    if not name:
+        return
+
+    def submit():
+        global _executor
+        try:
+            future = get_executor().submit(generate_renditions, str(settings.MEDIA_ROOT), name)
+        except BrokenProcessPool:
+            _executor = None
+            future = get_executor().submit(generate_renditions, str(settings.MEDIA_ROOT), name)
+        future.add_done_callback(_log_failure)
+
+    transaction.on_commit(submit)
+
+# --------------------------- thumbnails end here ---------------------------
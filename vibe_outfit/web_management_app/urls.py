@@ -2,10 +2,12 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from .views import *
+from . import async_views
 
 urlpatterns = [
     # path('', home, name='home'),
 
+    path('api/home/', HomeAPIView.as_view(), name='home'),
     path('api/navigation/', NavigationViewSet.as_view(), name='navigation'),
     path('api/hero-section/', HeroSectionViewSet.as_view(), name='hero_section'),
 
@@ -15,9 +17,23 @@ urlpatterns = [
     path('api/products/featured/', FeaturedProductAPIView.as_view()),
     path('api/products/new-arrivals/', NewArrivalProductAPIView.as_view()),
     path('api/products/<slug:slug>/', ProductDetailsAPIView.as_view()),
+    path('api/products/<slug:slug>/reviews/', ProductReviewListAPIView.as_view(), name='product-reviews'),
+    path('api/search/', ProductSearchAPIView.as_view(), name='product-search'),
+    path('api/feed/products.<str:feed_format>', product_feed_view, name='product-feed'),
+
+    # async variants of the read-only catalog endpoints, for ASGI servers
+    path('api/async/navigation/', async_views.navigation, name='async-navigation'),
+    path('api/async/hero-section/', async_views.hero_section, name='async-hero-section'),
+    path('api/async/categories/', async_views.categories, name='async-category-list'),
+    path('api/async/categories/all/', async_views.categories_with_children, name='async-category-with-children'),
+    path('api/async/categories/<slug:slug>/products/', async_views.category_products, name='async-category-products'),
+    path('api/async/products/featured/', async_views.featured_products, name='async-featured-products'),
+    path('api/async/products/new-arrivals/', async_views.new_arrival_products, name='async-new-arrivals'),
+    path('api/async/products/<slug:slug>/', async_views.product_details, name='async-product-details'),
     
     path('api/cart/add/', AddToCartAPIView.as_view()),
     path('api/cart/', CartListAPIView.as_view()),
+    path('api/cart/batch/', CartBatchAPIView.as_view(), name='cart-batch'),
     path('api/cart_item/<int:pk>/', UpdateCartItemAPIView.as_view()),
     path('api/cart_item/<int:pk>/delete/', RemoveCartItemAPIView.as_view()),
 ]
@@ -1,9 +1,28 @@
-from django.shortcuts import render
+import hashlib
+import os
+import re
+import time
+from functools import wraps
+from stat import S_ISREG
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, StreamingHttpResponse,
+)
+from django.shortcuts import render, get_object_or_404
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
 from rest_framework import viewsets, status
 from rest_framework.views import APIView, Response
 from rest_framework.generics import ListAPIView,RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from .models import (
     CompanyLogo,
     NavOption,
@@ -20,41 +39,54 @@ from .models import (
     OrderItem,
 )
 from .serializers import *
+from .cache import NAVIGATION, HERO, CATALOG, STOCK, HOME_CACHE_TIMEOUT, conditional_get, home_cache_key
+from .pagination import OrderCursorPagination, ProductCursorPagination, ReviewCursorPagination
+from .search import search_product_ids
+from .filters import ProductFilter
+from .facets import get_facet_counts
+from .feeds import FEED_FORMATS, product_feed
+from .pricing import price_cart_items
+from .storage import hashed_path
+from .services import EmptyCartError, InsufficientStockError, UnknownVariantError, apply_cart_operations, place_order
+from django_filters.rest_framework import DjangoFilterBackend
 
 
 # --------------------------- navigation bar start here ---------------------------
+def get_navigation_data():
+    logo = CompanyLogo.objects.filter(is_active= True).order_by('-updated_at').first()
+    nav_option = NavOption.objects.filter(is_active= True).order_by('order')[:4]
+    nav_button = NavButtons.objects.filter(is_active= True).order_by('order')[:3]
+
+    return {
+        "logo" : CompanyLogoSerializer(logo).data,
+        "nav_option" : NavOptionSerializer(nav_option, many = True).data,
+        "nav_button" : NavButtonsSerializer(nav_button, many = True).data,
+    }
+
+@method_decorator(conditional_get(NAVIGATION), name='get')
 class NavigationViewSet(APIView):
     def get(self, request):
-        logo = CompanyLogo.objects.filter(is_active= True).order_by('-updated_at').first()
-        nav_option = NavOption.objects.filter(is_active= True).order_by('order')[:4]
-        nav_button = NavButtons.objects.filter(is_active= True).order_by('order')[:3]
-
-        return Response (
-            {
-                "logo" : CompanyLogoSerializer(logo).data,
-                "nav_option" : NavOptionSerializer(nav_option, many = True).data,
-                "nav_button" : NavButtonsSerializer(nav_button, many = True).data,
-            },
-            status= status.HTTP_200_OK
-        )
+        return Response (get_navigation_data(), status= status.HTTP_200_OK)
     
 # --------------------------- navigation bar end here ---------------------------
 
 # --------------------------- hero section start here ---------------------------
+def get_hero_section_data():
+    hero_section = HeroSection.objects.filter(is_active = True).order_by('-updated_at').first()
+    return {
+        "hero_section": HeroSectionSerializer(hero_section).data
+    }
+
+@method_decorator(conditional_get(HERO), name='get')
 class HeroSectionViewSet(APIView):
     def get(self, request):
-        hero_section = HeroSection.objects.filter(is_active = True).order_by('-updated_at').first()
-        return Response (
-            {
-                "hero_section": HeroSectionSerializer(hero_section).data
-            },
-            status= status.HTTP_200_OK
-        )
+        return Response (get_hero_section_data(), status= status.HTTP_200_OK)
 # --------------------------- hero section end here ---------------------------
 
 
 
 # This API will return Only Parent categorys
+@method_decorator(conditional_get(CATALOG), name='get')
 class CategoryAPIView(ListAPIView):
     serializer_class = CategorySerializer
 
@@ -62,6 +94,7 @@ class CategoryAPIView(ListAPIView):
         return ProductCategory.objects.filter(is_active = True, parent_id__isnull=True).order_by('order')[:4]
 
 # This API will return Parent & child categorys
+@method_decorator(conditional_get(CATALOG), name='get')
 class CategoryWithChildrenAPIView(APIView):
     def get(self, request):
         categories = ProductCategory.objects.filter(is_active=True,parent_id__isnull=True).prefetch_related('children')
@@ -69,17 +102,34 @@ class CategoryWithChildrenAPIView(APIView):
         serializer = ParentCategorySerializer(categories, many=True)
         return Response(serializer.data)
 
-# Using this api we can see Category-wise Product List
+# Using this api we can see Category-wise Product List (sub categories included)
+@method_decorator(conditional_get(CATALOG), name='get')
 class CategoryProductListAPIView(ListAPIView):
     serializer_class = ProductListSerializer
+    pagination_class = ProductCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
 
     def get_queryset(self):
-        return Product.objects.filter(
-            category__slug=self.kwargs['slug'],
-            is_active=True
-        ).prefetch_related('images')
+        self.category = get_object_or_404(ProductCategory, slug=self.kwargs['slug'], is_active=True)
+        self.category_ids = self.category.subtree_ids()
+        return Product.objects.filter(is_active=True)
+
+    def paginate_queryset(self, queryset):
+        # the paginator limits the products to the subtree, one
+        # (category, sort key) index range per category
+        return self.paginator.paginate_queryset(
+            queryset, self.request, view=self, partitions=('category_id', self.category_ids),
+        )
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        # counts per color/size/material for the current filters, from the precomputed bitmaps
+        response.data['facets'] = get_facet_counts(self.category, request.query_params)
+        return response
 
 # Product Api Start here.    
+@method_decorator(conditional_get(CATALOG, STOCK), name='get')
 class ProductDetailsAPIView(RetrieveAPIView):
     serializer_class = ProductDetailsSerializer
     lookup_field = 'slug'
@@ -89,36 +139,123 @@ class ProductDetailsAPIView(RetrieveAPIView):
             is_active=True
         ).prefetch_related('images', 'variants')
     
+@method_decorator(conditional_get(CATALOG), name='get')
+class ProductReviewListAPIView(ListAPIView):
+    serializer_class = ProductReviewSerializer
+    pagination_class = ReviewCursorPagination
+
+    def get_queryset(self):
+        product = get_object_or_404(Product, slug=self.kwargs['slug'], is_active=True)
+        return ProductReview.objects.filter(product=product).select_related('user')
+
+@method_decorator(conditional_get(CATALOG), name='get')
 class FeaturedProductAPIView(ListAPIView):
     serializer_class = ProductListSerializer
+    pagination_class = ProductCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
 
     def get_queryset(self):
-        print("🔥 FEATURED API HIT 🔥")
-        qs = Product.objects.filter(
+        return Product.objects.filter(
             featured_products=True,
             is_active=True
         )
-        print("QUERYSET:", qs)
-        return qs.prefetch_related('images')
-
-        # return Product.objects.filter(
-        #     featured_products=True,
-        #     is_active=True
-        # ).prefetch_related('images')
     
+@method_decorator(conditional_get(CATALOG), name='get')
 class NewArrivalProductAPIView(ListAPIView):
     serializer_class = ProductListSerializer
+    pagination_class = ProductCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
 
     def get_queryset(self):
         return Product.objects.filter(
             new_arrivals=True,
             is_active=True
-        ).prefetch_related('images')
+        )
     
+# --------------------------- product search start here ---------------------------
+# Full text search over name, descriptions, category and variant sku/material,
+# ranked with bm25. Results are paged with ?page=, since rank order can't be keyset paged.
+class ProductSearchAPIView(APIView):
+    page_size = 24
+    max_page = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            page = min(max(int(request.query_params.get('page', 1)), 1), self.max_page)
+        except ValueError:
+            page = 1
+
+        ids = search_product_ids(query, limit=self.page_size + 1, offset=(page - 1) * self.page_size)
+        has_next = len(ids) > self.page_size and page < self.max_page
+        ids = ids[:self.page_size]
+
+        products = Product.objects.in_bulk(ids)
+        results = [products[pk] for pk in ids if pk in products]
+
+        url = request.build_absolute_uri()
+        return Response({
+            "query": query,
+            "next": replace_query_param(url, 'page', page + 1) if has_next else None,
+            "previous": replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            "results": ProductListSerializer(results, many=True, context={'request': request}).data,
+        }, status= status.HTTP_200_OK)
+
+# --------------------------- product search end here ---------------------------
+
+# --------------------------- home page start here ---------------------------
+HOME_PRODUCT_LIMIT = 8
+
+def get_home_data():
+    categories = ProductCategory.objects.filter(is_active = True, parent_id__isnull=True).order_by('order')[:4]
+    featured = Product.objects.filter(featured_products=True, is_active=True)[:HOME_PRODUCT_LIMIT]
+    new_arrivals = Product.objects.filter(new_arrivals=True, is_active=True)[:HOME_PRODUCT_LIMIT]
+
+    return {
+        **get_navigation_data(),
+        **get_hero_section_data(),
+        "categories": CategorySerializer(categories, many=True).data,
+        "featured_products": ProductListSerializer(featured, many=True).data,
+        "new_arrivals": ProductListSerializer(new_arrivals, many=True).data,
+    }
+
+# Everything the storefront home page needs in one response. The payload is
+# cached under the current navigation/hero/catalog versions, so a warm hit
+# doesn't touch the database at all.
+@method_decorator(conditional_get(NAVIGATION, HERO, CATALOG), name='get')
+class HomeAPIView(APIView):
+    def get(self, request):
+        key = home_cache_key()
+        data = cache.get(key)
+        if data is None:
+            data = get_home_data()
+            cache.set(key, data, HOME_CACHE_TIMEOUT)
+        return Response(data, status= status.HTTP_200_OK)
+
+# --------------------------- home page end here ---------------------------
+
+# only for writes, reads use get_cart_data and never create a cart
 def get_user_cart(user):
     cart, created = Cart.objects.get_or_create(user=user)
     return cart
 
+def get_cart_data(user):
+    # a single query: the user's lines with product data, priced in one batch
+    # by the same engine checkout uses. No cart yet just means no lines,
+    # nothing gets inserted on a read.
+    items = list(
+        CartItem.objects.filter(cart__user=user)
+        .select_related('variant__product')
+        .order_by('id')
+    )
+    return {
+        "items": items,
+        "item_count": sum(item.quantity for item in items),
+        "subtotal": price_cart_items(items),
+    }
+
 # add procut in cart
 class AddToCartAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -152,12 +289,27 @@ class CartListAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart = get_user_cart(request.user)
-        items = cart.items.select_related('variant__product')
-
-        serializer = CartItemSerializer(items, many=True)
+        serializer = CartSerializer(get_cart_data(request.user))
         return Response(serializer.data)
     
+# apply many add/set/remove operations at once, e.g. when an app syncs an offline cart
+class CartBatchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            apply_cart_operations(request.user, serializer.validated_data['operations'])
+        except UnknownVariantError as error:
+            return Response(
+                {"error": "Unknown variants", "variant_ids": error.variant_ids},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(CartSerializer(get_cart_data(request.user)).data)
+
 class UpdateCartItemAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -192,54 +344,207 @@ class RemoveCartItemAPIView(APIView):
 class OrderViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
-    # Order List
+    # Order List, newest first, items of the whole page come in one query
     def list(self, request):
-        orders = Order.objects.filter(user=request.user)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = Order.objects.filter(user=request.user).prefetch_related('items')
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     # Order Create (MOST IMPORTANT)
     def create(self, request):
-        cart = Cart.objects.get(user=request.user)
-        items = cart.items.select_related('variant__product')
-
-        if not items.exists():
+        try:
+            order = place_order(
+                request.user,
+                payment_method=request.data.get('payment_method', 'cash_on_delivery')
+            )
+        except EmptyCartError:
             return Response(
                 {"error": "Cart is empty"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        total = 0
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=0,
-            payment_method=request.data.get('payment_method', 'cash_on_delivery')
-        )
-
-        for item in items:
-            price = item.variant.product.base_price
-            total += price * item.quantity
-
-            OrderItem.objects.create(
-                order=order,
-                product=item.variant.product,
-                product_variant=item.variant,
-                quantity=item.quantity,
-                price=price
+        except InsufficientStockError as error:
+            return Response(
+                {"error": "Insufficient stock", "items": error.shortages},
+                status=status.HTTP_409_CONFLICT
             )
 
-        order.total_amount = total
-        order.save()
-
-        cart.items.all().delete()  # clear cart
-
         return Response(
-            {"message": "Order placed successfully"},
+            {"message": "Order placed successfully", "order_id": order.id},
             status=status.HTTP_201_CREATED
         )
 
     # Order Details
     def retrieve(self, request, pk=None):
-        order = Order.objects.get(id=pk, user=request.user)
+        order = get_object_or_404(Order.objects.prefetch_related('items'), id=pk, user=request.user)
         serializer = OrderSerializer(order)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+# --------------------------- product feed start here ---------------------------
+FEED_THROTTLE_KEY = 'feed:downloads:{}:{}'
+
+
+def feed_client(request):
+    # staff, or a marketplace with one of settings.FEED_TOKENS; None for anyone else
+    if request.user.is_authenticated and request.user.is_staff:
+        return f'staff:{request.user.pk}'
+    token = request.GET.get('token', '')
+    if token and any(constant_time_compare(token, allowed) for allowed in settings.FEED_TOKENS):
+        return 'token:' + hashlib.sha256(token.encode()).hexdigest()[:16]
+    return None
+
+
+def feed_access(view):
+    # before the ETag check, a 304 tells whether the catalog changed
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.feed_client = feed_client(request)
+        if request.feed_client is None:
+            return HttpResponseForbidden('A feed token is required.')
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def take_feed_download(client):
+    # fixed one hour windows in the shared cache, False once the client used them up
+    window = int(time.time() // 3600)
+    key = FEED_THROTTLE_KEY.format(client, window)
+    cache.add(key, 0, 3600)
+    try:
+        return cache.incr(key) <= settings.FEED_DOWNLOADS_PER_HOUR
+    except ValueError:
+        # expired in between
+        return cache.add(key, 1, 3600)
+
+
+# /api/feed/products.ndjson, .csv, .ndjson.gz or .csv.gz: the whole active
+# catalog, streamed chunk by chunk (see feeds.py), never built up in memory.
+# Stock levels and the cost of a full export are not for everyone, see
+# settings.FEED_TOKENS.
+@require_safe
+@feed_access
+@conditional_get(CATALOG, STOCK)
+def product_feed_view(request, feed_format):
+    gz = feed_format.endswith('.gz')
+    feed_format = feed_format.removesuffix('.gz')
+    if feed_format not in FEED_FORMATS:
+        raise Http404('Unknown feed format.')
+    if not take_feed_download(request.feed_client):
+        response = HttpResponse('Too many feed downloads, try again later.', status=429)
+        response['Retry-After'] = str(3600 - int(time.time()) % 3600)
+        return response
+
+    base_url = f'{request.scheme}://{request.get_host()}'
+    response = StreamingHttpResponse(
+        product_feed(feed_format, compress=gz, base_url=base_url),
+        content_type='application/gzip' if gz else f'{FEED_FORMATS[feed_format]}; charset=utf-8',
+    )
+    filename = f'products.{feed_format}' + ('.gz' if gz else '')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# --------------------------- product feed end here ---------------------------
+
+# --------------------------- media serving start here ---------------------------
+# Production path for MEDIA_URL (DEBUG keeps django's static() helper). The file
+# object goes to FileResponse untouched, so WSGI servers with wsgi.file_wrapper
+# (gunicorn, uwsgi) send it with sendfile() instead of copying it through Python.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE_CONTROL = 'public, max-age=3600'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class BoundedFile:
+    # read()/fileno() view of [start, start + length) for Range responses; no
+    # tell()/seek() so FileResponse leaves Content-Length to us, and sendfile()
+    # starts at the current offset and stops at Content-Length
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    # single byte range only, anything else is served as a full response
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        file = open(full_path, 'rb')
+    except OSError:
+        raise Http404
+    stat = os.fstat(file.fileno())
+    if not S_ISREG(stat.st_mode):
+        file.close()
+        raise Http404
+
+    digest = hashed_path(path)
+    if digest and os.path.splitext(os.path.basename(path))[0] == digest:
+        etag = f'"{digest}"'
+    else:
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if digest else MUTABLE_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        file.close()
+        return HttpResponseNotModified(headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # If-Range: only send the part if the client's copy is still this file
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range and byte_range[0] > byte_range[1]:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        response = FileResponse(BoundedFile(file, start, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+# --------------------------- media serving end here ---------------------------